@@ -1,38 +1,59 @@
-from flask import Flask, render_template, request, jsonify, redirect
+from flask import Flask, render_template, redirect
 from flask_cors import CORS
 import os
 import sys
-from werkzeug.utils import secure_filename
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from backend.utils.csv_parser import parse_csv
-from backend.utils.data_transform import transform_data
-from backend.utils.db_client import insert_fitness_data, init_db
+from backend.utils import metrics
 from backend.config import Config
-
-app = Flask(__name__, 
-            static_folder="../frontend/static",
-            template_folder="../frontend/templates")
-app.config.from_object(Config)
-CORS(app)
-
-with app.app_context():
-    init_db()
-
-from backend.routes.upload import upload_bp
-
-app.register_blueprint(upload_bp)
-
-@app.route('/')
-def index():
-    """Render the main upload page."""
-    return render_template('index.html')
-
-@app.route('/grafana')
-def grafana_redirect():
-    """Redirect to the Grafana dashboard."""
-    return redirect('http://localhost:3001')
+from backend.cli import register_commands
+
+def create_app(config_object=Config):
+    """
+    Build the Flask app. Startup neither connects to the database nor imports
+    pandas or SQLAlchemy: routes import the data modules on first use, and the
+    schema is checked on each process's first database use or by the
+    `migrate` command (see backend/cli.py).
+    """
+    app = Flask(__name__, 
+                static_folder="../frontend/static",
+                template_folder="../frontend/templates")
+    app.config.from_object(config_object)
+    CORS(app)
+    metrics.init_app(app)
+    
+    from backend.routes.upload import upload_bp
+    from backend.routes.resumable import resumable_bp
+    from backend.routes.status import status_bp
+    from backend.routes.jobs import jobs_bp
+    from backend.routes.nutrition import nutrition_bp
+    from backend.routes.metrics import metrics_bp
+    from backend.routes.export import export_bp
+    
+    app.register_blueprint(upload_bp)
+    app.register_blueprint(resumable_bp)
+    app.register_blueprint(status_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(nutrition_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(export_bp)
+    
+    @app.route('/')
+    def index():
+        """Render the main upload page."""
+        return render_template('index.html')
+    
+    @app.route('/grafana')
+    def grafana_redirect():
+        """Redirect to the Grafana dashboard."""
+        return redirect('http://localhost:3001')
+    
+    register_commands(app)
+    
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=True)
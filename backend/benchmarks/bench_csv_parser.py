@@ -0,0 +1,80 @@
+"""
+Benchmark the column-wise nutrition extraction in parse_csv against the
+original row-by-row implementation.
+
+Usage:
+    python -m backend.benchmarks.bench_csv_parser --rows 200000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.benchmarks.generator import write_export
+from backend.utils.csv_parser import parse_csv, extract_nutrition_data, NUTRIENT_COLUMNS
+
+
+def legacy_parse_csv(file_path):
+    """The iterrows-based parser that parse_csv replaced, kept as a reference."""
+    df = pd.read_csv(file_path)
+    column_mapping = {}
+    for i, col in enumerate(df.columns):
+        if i == 0:
+            column_mapping[col] = 'user_id'
+        elif i == 1:
+            column_mapping[col] = 'date'
+        else:
+            column_mapping[col] = f'data_{i-1}'
+    df = df.rename(columns=column_mapping)
+    df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+
+    processed_data = []
+    for _, row in df.iterrows():
+        json_data = ""
+        for col in df.columns:
+            if col.startswith('data_'):
+                if pd.notna(row[col]):
+                    json_data += str(row[col])
+        json_data = json_data.replace("'", '"')
+        processed_data.extend(extract_nutrition_data(json_data, row['user_id'], row['date']))
+
+    return pd.DataFrame(processed_data)
+
+
+def time_parser(parser, file_path):
+    start = time.perf_counter()
+    result = parser(file_path)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'export.csv')
+        write_export(file_path, args.rows, seed=args.seed)
+
+        legacy_df, legacy_seconds = time_parser(legacy_parse_csv, file_path)
+        vectorized_df, vectorized_seconds = time_parser(parse_csv, file_path)
+
+    # The column-wise parser stores nutrients as float32, hence the tolerance.
+    pd.testing.assert_frame_equal(legacy_df.astype({'user_id': 'int64'}),
+                                  vectorized_df.astype({'user_id': 'int64', **{c: 'float64' for c in NUTRIENT_COLUMNS}}),
+                                  check_dtype=False, rtol=1e-6)
+
+    print(f"rows:        {args.rows}")
+    print(f"row-by-row:  {legacy_seconds:8.2f}s  {args.rows / legacy_seconds:12,.0f} rows/sec")
+    print(f"column-wise: {vectorized_seconds:8.2f}s  {args.rows / vectorized_seconds:12,.0f} rows/sec")
+    print(f"speedup:     {legacy_seconds / vectorized_seconds:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
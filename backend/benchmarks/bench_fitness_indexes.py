@@ -0,0 +1,166 @@
+"""
+Compare fitness_data index and partitioning layouts with EXPLAIN plans.
+
+Generates a synthetic dataset in Postgres (10M rows by default, ten years
+per user), copies it into one table per layout and prints EXPLAIN (ANALYZE,
+BUFFERS) for the queries the Grafana panels and the upsert lookup run.
+Layouts:
+
+    baseline     separate single-column indexes on user_id and date (before)
+    composite    UNIQUE (user_id, date)
+    covering     UNIQUE (user_id, date) INCLUDE (calories, carbs, fat, protein)
+    partitioned  covering index, range partitioned by month
+
+The tables are created next to the application's and dropped afterwards
+unless --keep is given.
+
+Usage:
+    DB_NAME=scratch python -m backend.benchmarks.bench_fitness_indexes --rows 10000000
+"""
+import argparse
+import os
+import sys
+import time
+
+from sqlalchemy import MetaData, create_engine, text
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.config import Config
+from backend.utils import schema
+from backend.utils.db_client import FitnessData
+
+DAYS_PER_USER = 3650
+START_DATE = '2015-01-01'
+SOURCE_TABLE = 'bench_fitness_source'
+LAYOUTS = ['baseline', 'composite', 'covering', 'partitioned']
+
+QUERIES = {
+    'panel (one user, 90 days)': """
+        SELECT date, calories, carbs, fat, protein FROM {table}
+        WHERE user_id = :user_id AND date BETWEEN :start AND CAST(:start AS date) + 90
+        ORDER BY date
+    """,
+    'stat (one user, 1 year avg)': """
+        SELECT AVG(calories) FROM {table}
+        WHERE user_id = :user_id AND date BETWEEN :start AND CAST(:start AS date) + 365
+    """,
+    'upsert lookup (user_id, date)': """
+        SELECT id FROM {table} WHERE user_id = :user_id AND date = :start
+    """,
+}
+
+
+def table_name(layout):
+    return f'bench_fitness_{layout}'
+
+
+def create_source(conn, rows):
+    users = max(rows // DAYS_PER_USER, 1)
+    conn.execute(text(f"DROP TABLE IF EXISTS {SOURCE_TABLE}"))
+    conn.execute(text(f"""
+        CREATE TABLE {SOURCE_TABLE} AS
+        SELECT
+            row_number() OVER ()::integer AS id,
+            u AS user_id,
+            CAST(:start AS date) + d AS date,
+            1500 + random() * 2000 AS calories,
+            50 + random() * 350 AS carbs,
+            20 + random() * 130 AS fat,
+            30 + random() * 220 AS protein,
+            500 + random() * 3500 AS sodium,
+            5 + random() * 115 AS sugar,
+            random() * 800 AS exercise_calories,
+            (random() * 20000)::integer AS steps,
+            NULL::float AS carbs_calories,
+            NULL::float AS fat_calories,
+            NULL::float AS protein_calories,
+            NULL::float AS net_calories,
+            CAST(:start AS date) AS created_at
+        FROM generate_series(1, :users) AS u, generate_series(0, :days - 1) AS d
+        LIMIT :rows
+    """), {'start': START_DATE, 'users': users, 'days': DAYS_PER_USER, 'rows': rows})
+    return users
+
+
+def create_layout(conn, layout):
+    name = table_name(layout)
+    columns = ', '.join(column.name for column in FitnessData.__table__.columns)
+    conn.execute(text(f"DROP TABLE IF EXISTS {name} CASCADE"))
+
+    if layout == 'partitioned':
+        table = FitnessData.__table__.to_metadata(MetaData(), name=name)
+        schema.create_partitioned_table(conn, table, include_macros=True)
+        months = conn.execute(text(
+            f"SELECT DISTINCT CAST(date_trunc('month', date) AS date) FROM {SOURCE_TABLE}")).scalars().all()
+        schema.create_month_partitions(conn, name, months)
+        conn.execute(text(f"INSERT INTO {name} ({columns}) SELECT {columns} FROM {SOURCE_TABLE}"))
+        return
+
+    conn.execute(text(f"CREATE TABLE {name} AS SELECT {columns} FROM {SOURCE_TABLE}"))
+    conn.execute(text(f"ALTER TABLE {name} ADD PRIMARY KEY (id)"))
+    conn.execute(text(f"CREATE INDEX ix_{name}_date ON {name} (date)"))
+    if layout == 'baseline':
+        conn.execute(text(f"CREATE INDEX ix_{name}_user_id ON {name} (user_id)"))
+    else:
+        conn.execute(text(f"ALTER TABLE {name} ADD {schema.user_date_constraint_sql(name, layout == 'covering')}"))
+
+
+def explain(conn, sql, params):
+    plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"), params).scalars().all()
+    execution = next((line for line in plan if line.startswith('Execution Time')), '')
+    return plan, float(execution.split(':')[1].split()[0]) if execution else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--user-id', type=int, default=None,
+                        help='user to query (defaults to one in the middle of the dataset)')
+    parser.add_argument('--start', default='2019-06-01', help='first date of the queried range')
+    parser.add_argument('--layouts', nargs='+', choices=LAYOUTS, default=LAYOUTS)
+    parser.add_argument('--keep', action='store_true', help='keep the generated tables')
+    parser.add_argument('--quiet', action='store_true', help='print timings only, not full plans')
+    args = parser.parse_args()
+
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
+    timings = {}
+
+    try:
+        with engine.begin() as conn:
+            started = time.perf_counter()
+            users = create_source(conn, args.rows)
+            print(f"generated {args.rows:,} rows for {users:,} users in {time.perf_counter() - started:.1f}s")
+
+        for layout in args.layouts:
+            with engine.begin() as conn:
+                started = time.perf_counter()
+                create_layout(conn, layout)
+                print(f"built {layout} in {time.perf_counter() - started:.1f}s")
+            # VACUUM sets the visibility map that index-only scans rely on.
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(text(f"VACUUM ANALYZE {table_name(layout)}"))
+
+        params = {'user_id': args.user_id or max(users // 2, 1), 'start': args.start}
+        with engine.connect() as conn:
+            for query, sql in QUERIES.items():
+                for layout in args.layouts:
+                    plan, milliseconds = explain(conn, sql.format(table=table_name(layout)), params)
+                    timings[(query, layout)] = milliseconds
+                    if not args.quiet:
+                        print(f"\n=== {query} / {layout} ===")
+                        print('\n'.join(plan))
+    finally:
+        if not args.keep:
+            with engine.begin() as conn:
+                for layout in LAYOUTS:
+                    conn.execute(text(f"DROP TABLE IF EXISTS {table_name(layout)} CASCADE"))
+                conn.execute(text(f"DROP TABLE IF EXISTS {SOURCE_TABLE}"))
+
+    print(f"\n{'query':32}" + ''.join(f"{layout:>14}" for layout in args.layouts))
+    for query in QUERIES:
+        print(f"{query:32}" + ''.join(f"{timings[(query, layout)]:>12.3f}ms" for layout in args.layouts))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Measure the memory per row of the parsed and transformed upload frames,
+comparing the compact nullable dtypes with the original float64/object
+layout.
+
+The original layout is rebuilt from the same parsed data: int64 user ids,
+float64 nutrients with NaN, and a transform that copied the frame and
+replaced NaN with None. That replacement turned every nutrient column into
+boxed Python objects.
+
+Usage:
+    python -m backend.benchmarks.bench_memory --rows 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.benchmarks.generator import write_export
+from backend.utils.csv_parser import parse_csv, NUTRIENT_COLUMNS
+from backend.utils.data_transform import transform_data
+
+
+def legacy_layout(df):
+    """The parsed frame as parse_csv used to return it."""
+    legacy = pd.DataFrame({'user_id': df['user_id'].to_numpy(dtype='int64'), 'date': df['date']})
+    for nutrient in NUTRIENT_COLUMNS:
+        legacy[nutrient] = df[nutrient].to_numpy(dtype='float64', na_value=np.nan)
+    return legacy
+
+
+def legacy_transform_data(df):
+    """transform_data before the compact dtypes, kept as a reference."""
+    transformed_df = df.copy()
+    transformed_df = transformed_df.replace({np.nan: None})
+
+    calc_df = transformed_df[['carbs', 'fat', 'protein']].fillna(0)
+    transformed_df['carbs_calories'] = calc_df['carbs'] * 4
+    transformed_df['fat_calories'] = calc_df['fat'] * 9
+    transformed_df['protein_calories'] = calc_df['protein'] * 4
+    return transformed_df
+
+
+def bytes_per_row(df):
+    return df.memory_usage(deep=True, index=False).sum() / len(df)
+
+
+def measure_transform(transform, df):
+    """Run transform under tracemalloc; returns the result, seconds and peak bytes allocated."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = transform(df)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'export.csv')
+        write_export(file_path, args.rows, seed=args.seed)
+        parsed = parse_csv(file_path)
+
+    legacy = legacy_layout(parsed)
+    legacy_out, legacy_seconds, legacy_peak = measure_transform(legacy_transform_data, legacy)
+    compact_out, compact_seconds, compact_peak = measure_transform(transform_data, parsed)
+
+    for column in legacy_out.columns.drop(['user_id', 'date']):
+        np.testing.assert_allclose(compact_out[column].to_numpy(dtype='float64', na_value=np.nan),
+                                   pd.to_numeric(legacy_out[column]).to_numpy(dtype='float64'), rtol=1e-6)
+
+    print(f"rows: {args.rows:,}")
+    print(f"{'':>10} {'parsed B/row':>13} {'transformed B/row':>18} {'transform peak':>15} {'transform':>10}")
+    for name, before, after, peak, seconds in (
+            ('original', legacy, legacy_out, legacy_peak, legacy_seconds),
+            ('compact', parsed, compact_out, compact_peak, compact_seconds)):
+        print(f"{name:>10} {bytes_per_row(before):>13.1f} {bytes_per_row(after):>18.1f} "
+              f"{peak / 2**20:>12.1f} MB {seconds:>9.3f}s")
+
+
+if __name__ == '__main__':
+    main()
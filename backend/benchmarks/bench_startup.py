@@ -0,0 +1,78 @@
+"""
+Measure how long a fresh process takes to become ready, for the lazy app
+factory and for the startup the app used to do.
+
+Each scenario runs --repeat times in a new interpreter and reports the
+median time from the first import to the end of the scenario:
+
+    create_app     import backend.app and build the app (no database)
+    first_upload   create_app plus the data modules the first upload imports
+    schema_check   create_app plus the first database use, with the schema current
+    eager_init     the old import-time path: data modules plus a full init_db()
+
+The database scenarios use the DB_* settings, so point them at a scratch
+database (or pass --no-db to skip them).
+
+Usage:
+    DB_NAME=scratch python -m backend.benchmarks.bench_startup --repeat 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+_PRELUDE = """
+import time
+start = time.perf_counter()
+from backend.app import create_app
+app = create_app()
+"""
+
+SCENARIOS = {
+    'create_app': "",
+    'first_upload': "import backend.utils.pipeline",
+    'schema_check': """
+from backend.utils.db_client import get_engine
+with app.app_context():
+    get_engine()
+""",
+    'eager_init': """
+import backend.utils.pipeline
+from backend.utils.db_client import init_db
+with app.app_context():
+    init_db()
+""",
+}
+
+DB_SCENARIOS = ('schema_check', 'eager_init')
+
+
+def run_scenario(body):
+    """Seconds one fresh interpreter needs for the scenario."""
+    script = _PRELUDE + body + "\nprint(time.perf_counter() - start)\n"
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-db', action='store_true', help='skip the scenarios that need a database')
+    args = parser.parse_args()
+
+    scenarios = [name for name in SCENARIOS if not (args.no_db and name in DB_SCENARIOS)]
+    if 'schema_check' in scenarios:
+        # Record the schema version first, so schema_check times the fast path.
+        run_scenario(SCENARIOS['schema_check'])
+
+    print(f"{'scenario':>14} {'median':>10} {'min':>10}")
+    for name in scenarios:
+        times = [run_scenario(SCENARIOS[name]) for _ in range(args.repeat)]
+        print(f"{name:>14} {statistics.median(times) * 1000:>8.0f}ms {min(times) * 1000:>8.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
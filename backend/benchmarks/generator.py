@@ -0,0 +1,130 @@
+"""
+Write synthetic MyFitnessPal exports for tests and benchmarks.
+
+Rows cycle through `users` user ids per day, so a file of R rows covers
+about R / users consecutive days, from 2014-01-01 or, for longer files,
+from early enough that the last day is today. Beyond the days since 1970
+the dates wrap around, repeating (user, date) pairs. Each row's nutrition is either the flat
+shape ({"Calories": 1800, ...}, sometimes single-quoted) or the
+meal/dishes/nutrition JSON shape. It is cut at random points across
+`data_columns` columns. A small share of rows carries no nutrition at all,
+to exercise the rejected-row path. Output is fully determined by the seed
+and, for files that reach today, the current date.
+
+Usage:
+    python -m backend.benchmarks.generator export.csv --rows 1000000 --users 500 --seed 7
+"""
+import argparse
+import csv
+import datetime
+import random
+
+DATE_FORMATS = {'dmy': '%d-%m-%Y', 'ymd': '%Y-%m-%d'}
+
+START_DATE = datetime.date(2014, 1, 1)
+
+# Files too long to end by today start no earlier than this, and wrap.
+EARLIEST_DATE = datetime.date(1970, 1, 1)
+
+MEALS = ['Breakfast', 'Lunch', 'Dinner', 'Snacks']
+
+DISHES = ['Oats', 'Rice', 'Chicken Breast', 'Greek Yogurt', 'Banana', 'Salmon', 'Pasta', 'Eggs']
+
+_BLOCK_ROWS = 10000
+
+def write_export(file_path, rows, users=50, seed=42, date_style='ymd', data_columns=3,
+                 meal_ratio=0.5, empty_ratio=0.02):
+    """
+    Write an export of `rows` rows for `users` users to file_path.
+
+    date_style is 'dmy' (DD-MM-YYYY), 'ymd' (YYYY-MM-DD) or 'random', which
+    picks one of the two from the seed. Exports use one date style per file,
+    which is also what the parser expects. Returns the date style used.
+    """
+    rng = random.Random(seed)
+    if date_style == 'random':
+        date_style = rng.choice(sorted(DATE_FORMATS))
+    if date_style not in DATE_FORMATS:
+        raise ValueError(f"Unknown date style '{date_style}'. Expected one of: dmy, ymd, random")
+    if data_columns < 1:
+        raise ValueError("data_columns must be at least 1")
+
+    date_format = DATE_FORMATS[date_style]
+    users = max(users, 1)
+    start = first_date(rows, users)
+    span = (datetime.date.today() - start).days + 1
+
+    with open(file_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['user_id', 'date'] + [f'data_{i + 1}' for i in range(data_columns)])
+
+        dates = {}
+        block = []
+        for i in range(rows):
+            day = i // users % span
+            if day not in dates:
+                dates = {day: (start + datetime.timedelta(days=day)).strftime(date_format)}
+
+            payload = _nutrition_payload(rng, meal_ratio, empty_ratio)
+            block.append([1 + i % users, dates[day]] + _split(rng, payload, data_columns))
+
+            if len(block) >= _BLOCK_ROWS:
+                writer.writerows(block)
+                block = []
+
+        writer.writerows(block)
+
+    return date_style
+
+def first_date(rows, users=50):
+    """The first day of an export of `rows` rows for `users` users, see write_export."""
+    days = -(-rows // max(users, 1))
+    latest_start = datetime.date.today() - datetime.timedelta(days=max(days - 1, 0))
+    return max(min(START_DATE, latest_start), EARLIEST_DATE)
+
+def _nutrition_payload(rng, meal_ratio, empty_ratio):
+    if rng.random() < empty_ratio:
+        return 'no nutrition logged'
+
+    carbs = rng.randint(50, 400)
+    fat = rng.randint(20, 150)
+    protein = rng.randint(30, 250)
+    # Within the tolerance of the calorie vs macro validation rule.
+    calories = round((4 * carbs + 9 * fat + 4 * protein) * rng.uniform(0.9, 1.1))
+    sodium = rng.randint(500, 4000)
+    sugar = rng.randint(5, 120)
+
+    if rng.random() < meal_ratio:
+        return (f'{{"meal": "{rng.choice(MEALS)}", "dishes": [{{"name": "{rng.choice(DISHES)}", "nutrition": ['
+                f'{{"name": "Calories", "value": "{calories}"}}, {{"name": "Carbs", "value": "{carbs}"}}, '
+                f'{{"name": "Fat", "value": "{fat}"}}, {{"name": "Protein", "value": "{protein}"}}, '
+                f'{{"name": "Sodium", "value": "{sodium}mg"}}, {{"name": "Sugar", "value": "{sugar}"}}]}}]}}')
+
+    payload = (f'{{"Calories": {calories}, "Carbs": {carbs}, "Fat": {fat}, '
+               f'"Protein": {protein}, "Sodium": {sodium}, "Sugar": {sugar}}}')
+    # Some exports quote keys with single quotes; the parser normalizes them.
+    return payload.replace('"', "'") if rng.random() < 0.1 else payload
+
+def _split(rng, payload, parts):
+    """Cut payload into `parts` pieces at random points; trailing pieces may be empty."""
+    cuts = sorted(rng.randint(0, len(payload)) for _ in range(parts - 1))
+    bounds = [0] + cuts + [len(payload)]
+    return [payload[start:end] for start, end in zip(bounds, bounds[1:])]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('file_path')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--date-style', choices=['dmy', 'ymd', 'random'], default='ymd')
+    parser.add_argument('--data-columns', type=int, default=3)
+    parser.add_argument('--meal-ratio', type=float, default=0.5)
+    args = parser.parse_args()
+
+    date_style = write_export(args.file_path, args.rows, args.users, args.seed, args.date_style,
+                              args.data_columns, args.meal_ratio)
+    print(f"wrote {args.rows:,} rows for {args.users} users ({date_style} dates) to {args.file_path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""
+Drive concurrent uploads and reads against a running server and report latency percentiles.
+
+Uploaders post generated exports to /api/upload, one after another, each
+file with a new seed so no upload is answered as a duplicate. Readers
+request the nutrition series (day, week and month), summary and trends of
+random users over random ranges. Both run for --duration seconds after
+--warmup seconds whose requests are not counted, and every request is
+timed from sending to the last byte of the response.
+
+The report gives, per request kind, the request and error counts,
+throughput and the p50/p95/p99/max latency; uploads also report rows per
+second. --save writes the same numbers as JSON, to compare capacity
+across settings and machines.
+
+Point it at docker-compose (the default URL) or let --serve start gunicorn
+with gunicorn.conf.py on a free local port, using the DB_* settings of the
+environment. Uploads write to the fitness tables, so use a scratch
+database.
+
+Usage:
+    python -m backend.benchmarks.loadtest --uploaders 2 --readers 16 --duration 60
+    DB_NAME=scratch python -m backend.benchmarks.loadtest --serve --workers 4 --save loadtest.json
+"""
+import argparse
+import datetime
+import http.client
+import itertools
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.benchmarks.generator import first_date, write_export
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+READS = ('nutrition_day', 'nutrition_week', 'nutrition_month', 'summary', 'trends')
+
+
+class Recorder:
+    """Latencies and errors per request kind, from every thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.rows = 0
+        self.recording = False
+
+    def add(self, kind, seconds, ok, rows=0):
+        with self.lock:
+            if not self.recording:
+                return
+            if ok:
+                self.latencies.setdefault(kind, []).append(seconds)
+                self.rows += rows
+            else:
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+def percentile(sorted_values, share):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = min(max(math.ceil(share * len(sorted_values)), 1), len(sorted_values))
+    return sorted_values[rank - 1]
+
+
+def request(url, method, path, body=None, headers=None, timeout=600):
+    """Send one request on a new connection; returns (status, parsed JSON body or None)."""
+    parts = urllib.parse.urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        data = response.read()
+    finally:
+        conn.close()
+    try:
+        return response.status, json.loads(data)
+    except ValueError:
+        return response.status, None
+
+
+def multipart(file_path):
+    """(body, content type) of a multipart form with file_path as 'file'."""
+    boundary = uuid.uuid4().hex
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="export.csv"\r\n'
+            f'Content-Type: text/csv\r\n\r\n').encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def uploader(url, recorder, stop, folder, seeds, rows, users):
+    path = os.path.join(folder, f'{threading.get_ident()}.csv')
+    while not stop.is_set():
+        write_export(path, rows, users=users, seed=next(seeds))
+        body, content_type = multipart(path)
+        started = time.perf_counter()
+        try:
+            status, _ = request(url, 'POST', '/api/upload', body, {'Content-Type': content_type})
+            ok = status == 200
+        except OSError:
+            ok = False
+        recorder.add('upload', time.perf_counter() - started, ok, rows if ok else 0)
+
+
+def reader(url, recorder, stop, rng, users, start, days):
+    while not stop.is_set():
+        kind = rng.choice(READS)
+        user_id = rng.randint(1, users)
+        first = start + datetime.timedelta(days=rng.randrange(max(days, 1)))
+        last = first + datetime.timedelta(days=rng.choice((7, 30, 90, 365)))
+        params = {'from': first.isoformat(), 'to': last.isoformat()}
+        if kind.startswith('nutrition'):
+            params['granularity'] = kind.split('_')[1]
+        path = f"/api/users/{user_id}/{kind.split('_')[0]}?{urllib.parse.urlencode(params)}"
+
+        started = time.perf_counter()
+        try:
+            status, _ = request(url, 'GET', path)
+            ok = status in (200, 404)
+        except OSError:
+            ok = False
+        recorder.add(kind, time.perf_counter() - started, ok)
+
+
+def run_load(url, uploaders, readers, duration, warmup, upload_rows, users, seed):
+    """Run the load and return the report as a dict."""
+    recorder = Recorder()
+    stop = threading.Event()
+    seeds = itertools.count(seed)
+    # Uploads of upload_rows rows cover about upload_rows / users days from start.
+    start = first_date(upload_rows, users)
+    days = min(max(upload_rows // max(users, 1), 1), (datetime.date.today() - start).days + 1)
+
+    with tempfile.TemporaryDirectory() as folder:
+        threads = [threading.Thread(target=uploader, args=(url, recorder, stop, folder, seeds, upload_rows, users))
+                   for _ in range(uploaders)]
+        threads += [threading.Thread(target=reader,
+                                     args=(url, recorder, stop, random.Random(seed + i), users, start, days))
+                    for i in range(readers)]
+        for thread in threads:
+            thread.start()
+
+        time.sleep(warmup)
+        recorder.recording = True
+        started = time.perf_counter()
+        time.sleep(duration)
+        recorder.recording = False
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    report = {}
+    for kind in ('upload',) + READS:
+        latencies = sorted(recorder.latencies.get(kind, []))
+        errors = recorder.errors.get(kind, 0)
+        if not latencies and not errors:
+            continue
+        report[kind] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'per_second': len(latencies) / elapsed,
+            **{f'p{p}_ms': (percentile(latencies, p / 100) or 0) * 1000 for p in (50, 95, 99)},
+            'max_ms': (latencies[-1] if latencies else 0) * 1000
+        }
+    if 'upload' in report:
+        report['upload']['rows_per_second'] = recorder.rows / elapsed
+    return {'seconds': elapsed, 'requests': report}
+
+
+def print_report(result):
+    print(f"{'request':>16} {'count':>7} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9}")
+    total = 0
+    for kind, stats in result['requests'].items():
+        total += stats['requests']
+        print(f"{kind:>16} {stats['requests']:>7} {stats['errors']:>6} {stats['per_second']:>8.1f} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+    print(f"\n{total} requests in {result['seconds']:.1f}s ({total / result['seconds']:.1f} req/s)")
+    if 'upload' in result['requests']:
+        print(f"uploads wrote {result['requests']['upload']['rows_per_second']:,.0f} rows/s")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(workers, threads):
+    """Start gunicorn with gunicorn.conf.py on a free port; returns (process, url) once it answers."""
+    port = free_port()
+    env = dict(os.environ, GUNICORN_BIND=f'127.0.0.1:{port}', GUNICORN_ACCESS_LOG='',
+               GUNICORN_LOG_LEVEL='warning')
+    if workers:
+        env['WEB_CONCURRENCY'] = str(workers)
+    if threads:
+        env['GUNICORN_THREADS'] = str(threads)
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'backend.wsgi:app'],
+                               cwd=ROOT, env=env)
+    url = f'http://127.0.0.1:{port}'
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            request(url, 'GET', '/api/cache', timeout=5)
+            return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not answer within 60 seconds")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--serve', action='store_true', help='start gunicorn locally instead of using --url')
+    parser.add_argument('--workers', type=int, default=None, help='gunicorn workers with --serve')
+    parser.add_argument('--threads', type=int, default=None, help='gunicorn threads per worker with --serve')
+    parser.add_argument('--uploaders', type=int, default=2)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--upload-rows', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save', metavar='PATH', help='write the report as JSON')
+    args = parser.parse_args()
+
+    process, url = serve(args.workers, args.threads) if args.serve else (None, args.url)
+    try:
+        result = run_load(url, args.uploaders, args.readers, args.duration, args.warmup,
+                          args.upload_rows, args.users, args.seed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print_report(result)
+    if args.save:
+        result['meta'] = {key: value for key, value in vars(args).items() if key != 'save'}
+        result['meta']['url'] = url
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nSaved report to {args.save}")
+
+
+if __name__ == '__main__':
+    main()
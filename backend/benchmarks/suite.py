@@ -0,0 +1,212 @@
+"""
+Time each upload pipeline stage on generated exports and compare against baselines.
+
+Stages:
+
+    parse      parse_csv on the generated export
+    transform  transform_data on the parsed frame
+    insert     insert_fitness_data into an empty table
+    upload     process_upload end to end (parse, transform, write, rollups)
+
+By default the database is a throwaway SQLite file, with the 'orm' write
+mode, so the suite runs offline. Pass --database-url to time the bulk
+path against Postgres. The fitness tables in that database are emptied
+before every insert/upload round, so only point it at a scratch database.
+
+Each stage runs --repeat times and the median is reported. --save writes
+the results as a JSON baseline; --compare reads one and exits non-zero
+when a stage's best time is more than --tolerance slower.
+
+Usage:
+    python -m backend.benchmarks.suite --rows 1000 10000 --save backend/benchmarks/baselines/sqlite-orm.json
+    python -m backend.benchmarks.suite --rows 1000 10000 --compare backend/benchmarks/baselines/sqlite-orm.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from flask import Flask
+from sqlalchemy import inspect, text
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.benchmarks.generator import write_export
+from backend.config import Config
+from backend.utils.csv_parser import parse_csv
+from backend.utils.data_transform import transform_data
+from backend.utils.db_client import Base, get_engine, insert_fitness_data
+from backend.utils.pipeline import process_upload
+
+STAGES = ('parse', 'transform', 'insert', 'upload')
+
+
+def make_app(database_url, archive_folder):
+    """
+    A bare Flask app configured like the real one but pointed at database_url.
+    With ARCHIVE_UPLOADS, uploads are archived into archive_folder, so the
+    upload stage still times archiving but generated rows never reach the
+    real archive, where `archive reprocess` would load them.
+    """
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['ARCHIVE_FOLDER'] = archive_folder
+
+    with app.app_context():
+        # Postgres databases are migrated by the first get_engine() call.
+        engine = get_engine()
+        if engine.dialect.name != 'postgresql':
+            Base.metadata.create_all(engine)
+
+    return app
+
+
+def clear_tables():
+    engine = get_engine()
+    tables = inspect(engine).get_table_names()
+    # TRUNCATE keeps Postgres rounds from slowing down on dead tuples.
+    statement = 'TRUNCATE' if engine.dialect.name == 'postgresql' else 'DELETE FROM'
+    with engine.begin() as conn:
+        for table in ('fitness_data', 'fitness_data_rollup', 'fitness_trends', 'users', 'fitness_data_rejects',
+                      'uploaded_files'):
+            if table in tables:
+                conn.execute(text(f"{statement} {table}"))
+
+
+def measure(func, repeat, setup=None):
+    """Run func repeat times, calling setup untimed before each run."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_suite(app, sizes, users=50, seed=42, repeat=3, mode=None, stages=STAGES, parse_workers=1):
+    """Return {'<stage>@<rows>': timing summary} for every stage and size."""
+    results = {}
+
+    with app.app_context(), tempfile.TemporaryDirectory() as tmp_dir:
+        mode = mode or ('bulk' if get_engine().dialect.name == 'postgresql' else 'orm')
+        app.config['PARSE_WORKERS'] = parse_workers
+
+        for rows in sizes:
+            file_path = os.path.join(tmp_dir, f'export_{rows}.csv')
+            write_export(file_path, rows, users=users, seed=seed, date_style='random')
+            parsed = parse_csv(file_path)
+            transformed = transform_data(parsed)
+
+            runs = {
+                'parse': (lambda: parse_csv(file_path, workers=parse_workers), None),
+                'transform': (lambda: transform_data(parsed), None),
+                'insert': (lambda: insert_fitness_data(transformed.copy(), mode=mode), clear_tables),
+                'upload': (lambda: process_upload(file_path, mode=mode), clear_tables),
+            }
+
+            for stage in stages:
+                func, setup = runs[stage]
+                times = measure(func, repeat, setup)
+                median = statistics.median(times)
+                results[f'{stage}@{rows}'] = {
+                    'stage': stage,
+                    'rows': rows,
+                    'rounds': len(times),
+                    'min_seconds': round(min(times), 6),
+                    'median_seconds': round(median, 6),
+                    'rows_per_second': round(rows / median, 1) if median else None
+                }
+                print(f"{stage:>10} {rows:>10,} rows  median {median:9.4f}s  {rows / median:12,.0f} rows/sec")
+
+        clear_tables()
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print each stage against the baseline and return the keys that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':>20} {'baseline':>12} {'current':>12} {'change':>9}")
+
+    for key, current in results.items():
+        previous = baseline['results'].get(key)
+        if previous is None:
+            print(f"{key:>20} {'-':>12} {current['min_seconds']:>11.4f}s {'new':>9}")
+            continue
+
+        change = current['min_seconds'] / previous['min_seconds'] - 1
+        flag = ''
+        if change > tolerance:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        print(f"{key:>20} {previous['min_seconds']:>11.4f}s {current['min_seconds']:>11.4f}s "
+              f"{change:>+8.1%}{flag}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--parse-workers', type=int, default=1,
+                        help='processes for nutrient extraction in the parse and upload stages')
+    parser.add_argument('--database-url', default=None,
+                        help='database to write to (defaults to a temporary SQLite file)')
+    parser.add_argument('--mode', choices=['bulk', 'orm'], default=None,
+                        help="write mode (defaults to 'bulk' on Postgres, 'orm' elsewhere)")
+    parser.add_argument('--save', metavar='PATH', help='write the results as a baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare the results with a baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown before a stage counts as a regression (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        database_url = args.database_url or f"sqlite:///{os.path.join(db_dir, 'bench.db')}"
+        mode = args.mode or ('bulk' if database_url.startswith('postgresql') else 'orm')
+        app = make_app(database_url, os.path.join(db_dir, 'archive'))
+        results = run_suite(app, args.rows, args.users, args.seed, args.repeat, mode, args.stages,
+                            args.parse_workers)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump({
+                'meta': {
+                    'database': database_url.split(':', 1)[0],
+                    'mode': mode,
+                    'users': args.users,
+                    'seed': args.seed,
+                    'repeat': args.repeat,
+                    'parse_workers': args.parse_workers,
+                    'cpus': os.cpu_count(),
+                    'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+                },
+                'results': results
+            }, f, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
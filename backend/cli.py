@@ -0,0 +1,87 @@
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+import click
+
+def register_commands(app):
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(rebuild_user_totals_command)
+    app.cli.add_command(rebuild_trends_command)
+    app.cli.add_command(archive_cli)
+
+@click.command('migrate')
+@click.option('--force', is_flag=True, help='Run the schema checks even if this version is already applied.')
+@with_appcontext
+def migrate_command(force):
+    """Create or upgrade the database schema and record its version."""
+    from backend.utils.db_client import migrate, schema_version
+    
+    applied = migrate(force=force)
+    version = schema_version(current_app.config)
+    click.echo(f"Applied schema version {version}." if applied else f"Schema version {version} is up to date.")
+
+@click.command('rebuild-user-totals')
+@with_appcontext
+def rebuild_user_totals_command():
+    """Recompute the users table from fitness_data, e.g. after rows were changed with plain SQL."""
+    from backend.utils.db_client import get_engine, rebuild_user_totals
+    
+    with get_engine().begin() as conn:
+        rebuild_user_totals(conn)
+    click.echo("Rebuilt the users table.")
+
+@click.command('rebuild-trends')
+@with_appcontext
+def rebuild_trends_command():
+    """Recompute fitness_trends from fitness_data, e.g. after rows were changed with plain SQL."""
+    from backend.utils.db_client import get_engine
+    from backend.utils.trends import rebuild_trends
+    
+    with get_engine().begin() as conn:
+        rebuild_trends(conn)
+    click.echo("Rebuilt the fitness_trends table.")
+
+archive_cli = AppGroup('archive', help='Reprocess and analyse the Parquet archive of parsed uploads.')
+
+_date_option = click.DateTime(formats=['%Y-%m-%d'])
+
+@archive_cli.command('reprocess')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Only this user; may be repeated.')
+@click.option('--from', 'start', type=_date_option, help='First day to rebuild (YYYY-MM-DD).')
+@click.option('--to', 'end', type=_date_option, help='Last day to rebuild (YYYY-MM-DD).')
+@click.option('--mode', type=click.Choice(['bulk', 'orm']), default=None, help='Write mode (defaults to DB_WRITE_MODE).')
+def reprocess_command(user_ids, start, end, mode):
+    """Rebuild fitness_data rows and derived columns from the archive."""
+    from backend.utils.pipeline import reprocess_archive
+    
+    summary = reprocess_archive(user_ids or None, _day(start), _day(end), mode)
+    click.echo(f"Reprocessed {summary['rows']} rows of {summary['users']} user(s): "
+               f"{summary['inserted']} inserted, {summary['updated']} updated.")
+
+@archive_cli.command('report')
+@click.option('--from', 'start', type=_date_option)
+@click.option('--to', 'end', type=_date_option)
+@click.option('--bins', type=int, default=10, show_default=True, help='Share ranges in the macro distribution.')
+def report_command(start, end, bins):
+    """Print cohort averages and the macro calorie distribution of all users."""
+    from backend.utils.analytics import cohort_averages, macro_distribution
+    
+    folder = current_app.config['ARCHIVE_FOLDER']
+    click.echo("Daily averages by cohort (month of first log) and month of activity:")
+    click.echo(cohort_averages(folder, _day(start), _day(end)).to_string(index=False))
+    click.echo("\nShare of days by share of macro calories:")
+    click.echo(macro_distribution(folder, _day(start), _day(end), bins).to_string(index=False))
+
+@archive_cli.command('query')
+@click.argument('sql')
+def query_command(sql):
+    """Run DuckDB SQL over the fitness_archive and fitness_latest views."""
+    from backend.utils.analytics import query_archive
+    
+    try:
+        result = query_archive(sql, current_app.config['ARCHIVE_FOLDER'])
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(result.to_string(index=False))
+
+def _day(value):
+    return value.date() if value else None
@@ -3,8 +3,58 @@ import os
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'myfitnessapp-secret-key')
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
-    ALLOWED_EXTENSIONS = {'csv'}
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  
+    ALLOWED_EXTENSIONS = {'csv', 'csv.gz', 'csv.zst', 'zip'}
+    # Uploads are spooled to disk and parsed in chunks, so this only bounds
+    # the request size, not the memory needed to process it. For compressed
+    # uploads it limits the compressed bytes; MAX_DECOMPRESSED_LENGTH stops
+    # decompression bombs while they are being read.
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 1024 * 1024 * 1024))
+    MAX_DECOMPRESSED_LENGTH = int(os.environ.get('MAX_DECOMPRESSED_LENGTH', 10 * 1024 * 1024 * 1024))
+    CSV_CHUNK_SIZE = int(os.environ.get('CSV_CHUNK_SIZE', 50000))
+    # Processes used to extract nutrients from each chunk; 1 parses serially.
+    # Chunks smaller than a few thousand rows per worker stay serial anyway.
+    PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 1))
+    
+    # Background upload jobs: JOB_WORKERS run at once, JOB_QUEUE_SIZE more may
+    # wait, and further uploads are refused with 429 until a slot frees up.
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 8))
+    JOB_STATUS_FOLDER = os.path.join(UPLOAD_FOLDER, 'jobs')
+    
+    # Resumable uploads (/api/uploads) arrive in chunks of RESUMABLE_CHUNK_SIZE
+    # bytes and are parsed while later chunks are still being sent, by up to
+    # RESUMABLE_PARSE_WORKERS jobs at once besides JOB_WORKERS; further uploads
+    # are parsed once complete. A parse gives up after RESUMABLE_STALL_TIMEOUT
+    # seconds without a new chunk, and uploads never completed are deleted
+    # after RESUMABLE_UPLOAD_TTL seconds.
+    RESUMABLE_FOLDER = os.path.join(UPLOAD_FOLDER, 'resumable')
+    RESUMABLE_CHUNK_SIZE = int(os.environ.get('RESUMABLE_CHUNK_SIZE', 8 * 1024 * 1024))
+    RESUMABLE_PARSE_WORKERS = int(os.environ.get('RESUMABLE_PARSE_WORKERS', 2))
+    RESUMABLE_STALL_TIMEOUT = int(os.environ.get('RESUMABLE_STALL_TIMEOUT', 900))
+    RESUMABLE_UPLOAD_TTL = int(os.environ.get('RESUMABLE_UPLOAD_TTL', 24 * 3600))
+    
+    # Parsed uploads can also be kept as Parquet, partitioned by user and
+    # month, so derived columns can be rebuilt and heavy scans run off Postgres.
+    # Off by default: it costs upload time and disk for every upload.
+    ARCHIVE_UPLOADS = os.environ.get('ARCHIVE_UPLOADS', 'false').lower() == 'true'
+    ARCHIVE_FOLDER = os.environ.get('ARCHIVE_FOLDER', os.path.join(UPLOAD_FOLDER, 'archive'))
+    
+    # Profile uploads with 'cprofile' or 'pyinstrument'. Off by default. With
+    # PROFILE_HEADER_ENABLED, a single upload can ask for it with an X-Profile
+    # header instead; that lets any client spend CPU and disk, so it is off too.
+    PROFILE_UPLOADS = os.environ.get('PROFILE_UPLOADS', '')
+    PROFILE_HEADER_ENABLED = os.environ.get('PROFILE_HEADER_ENABLED', 'false').lower() == 'true'
+    PROFILE_FOLDER = os.path.join(UPLOAD_FOLDER, 'profiles')
+    
+    # Per-process cache for the read API: at most QUERY_CACHE_SIZE results,
+    # each kept for QUERY_CACHE_TTL seconds or until the user's rows change
+    # in any process (checked against users.updated_at on every lookup).
+    QUERY_CACHE_SIZE = int(os.environ.get('QUERY_CACHE_SIZE', 1024))
+    QUERY_CACHE_TTL = int(os.environ.get('QUERY_CACHE_TTL', 300))
+    
+    # Rows fetched per server-side cursor round trip and encoded per chunk by
+    # /api/export; bounds the export's memory regardless of its size.
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 10000))
     
     DB_USER = os.environ.get('DB_USER', 'postgres')
     DB_PASSWORD = os.environ.get('DB_PASSWORD', 'ujjwal')
@@ -15,6 +65,43 @@ class Config:
     SQLALCHEMY_DATABASE_URI = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # 'bulk' stages rows with COPY and merges them with INSERT ... ON CONFLICT,
+    # 'orm' falls back to the row-by-row session path.
+    DB_WRITE_MODE = os.environ.get('DB_WRITE_MODE', 'bulk')
+    
+    # 'file' writes a whole upload in one transaction: all or nothing, but it
+    # holds every row lock until the end, so concurrent uploads of the same
+    # users wait on each other, and one that deadlocks is run again up to
+    # INGEST_MAX_RETRIES times. 'user' commits each user's rows of a chunk
+    # separately under a per-user advisory lock, on INGEST_WORKERS threads,
+    # retrying conflicts up to INGEST_MAX_RETRIES times.
+    # The threads are shared by all uploads of a worker process, so keep
+    # INGEST_WORKERS below DB_POOL_SIZE + DB_MAX_OVERFLOW.
+    UPLOAD_TRANSACTION = os.environ.get('UPLOAD_TRANSACTION', 'file')
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 4))
+    INGEST_MAX_RETRIES = int(os.environ.get('INGEST_MAX_RETRIES', 5))
+    
+    # Connection pool per worker process. Size it so that
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays below max_connections.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    
+    # Schema options applied by init_db. DB_COVERING_INDEX adds the macro
+    # columns to the (user_id, date) unique index; DB_PARTITIONING converts
+    # fitness_data to monthly range partitions, created DB_PARTITION_PREMAKE_MONTHS
+    # months ahead and on demand during uploads.
+    DB_COVERING_INDEX = os.environ.get('DB_COVERING_INDEX', 'false').lower() == 'true'
+    DB_PARTITIONING = os.environ.get('DB_PARTITIONING', 'false').lower() == 'true'
+    DB_PARTITION_PREMAKE_MONTHS = int(os.environ.get('DB_PARTITION_PREMAKE_MONTHS', 3))
+    
+    # Check the recorded schema version on each process's first database use
+    # and migrate if it is out of date. Set to false to only migrate through
+    # `flask --app backend.app migrate`, e.g. as a deploy step.
+    DB_AUTO_MIGRATE = os.environ.get('DB_AUTO_MIGRATE', 'true').lower() == 'true'
+    
     @staticmethod
     def init_app(app):
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True) 
\ No newline at end of file
@@ -5,7 +5,7 @@ from sqlalchemy import create_engine, text
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from backend.utils.db_client import init_db
+from backend.utils.db_client import migrate
 from backend.app import app
 
 @pytest.fixture(scope="session")
@@ -29,13 +29,19 @@ def test_db():
     # Create engine
     engine = create_engine(conn_string)
     
-    # Create tables
+    # Create tables, even if a previous run recorded the schema version
     with app.app_context():
-        init_db()
+        migrate(force=True)
     
     yield engine
     
     # Clean up after tests
     with engine.connect() as conn:
         conn.execute(text("DROP TABLE IF EXISTS fitness_data"))
+        conn.execute(text("DROP TABLE IF EXISTS fitness_data_rollup"))
+        conn.execute(text("DROP TABLE IF EXISTS uploaded_files"))
+        conn.execute(text("DROP TABLE IF EXISTS fitness_data_rejects"))
+        conn.execute(text("DROP TABLE IF EXISTS users"))
+        conn.execute(text("DROP TABLE IF EXISTS fitness_trends"))
+        conn.execute(text("DROP TABLE IF EXISTS schema_migrations"))
         conn.commit() 
\ No newline at end of file
@@ -0,0 +1,53 @@
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+import logging
+
+from backend.routes.params import date_range
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+export_bp = Blueprint('export', __name__, url_prefix='/api')
+
+@export_bp.route('/export', methods=['GET'])
+def export_fitness_data():
+    """
+    Stream fitness_data rows as a download:
+    ?user_id=&from=YYYY-MM-DD&to=YYYY-MM-DD&format=csv|ndjson|parquet&gzip=1.
+    All filters are optional; without user_id every user is exported.
+    """
+    from backend.utils.export import EXPORT_FORMATS, export_chunks, gzip_chunks
+    
+    try:
+        user_id = _user_id()
+        start, end = date_range()
+        export_format = request.args.get('format', 'csv')
+        chunks = export_chunks(export_format, user_id, start, end, current_app.config['EXPORT_BATCH_SIZE'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    parts = ['fitness_data']
+    if user_id is not None:
+        parts.append(f'user{user_id}')
+    parts += [day.isoformat() for day in (start, end) if day]
+    filename = '_'.join(parts) + f'.{export_format}'
+    mimetype = EXPORT_FORMATS[export_format]
+    
+    if request.args.get('gzip', '').lower() in ('1', 'true', 'yes'):
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    logger.info(f"Starting {export_format} export {filename}")
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def _user_id():
+    value = request.args.get('user_id')
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Invalid user_id '{value}'. Expected an integer")
@@ -0,0 +1,20 @@
+from flask import Blueprint, jsonify
+import logging
+
+from backend.utils.jobs import get_job_manager
+
+logging.basicConfig(level=logging.INFO, 
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api')
+
+@jobs_bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report the phase, progress and outcome of a background upload."""
+    status = get_job_manager().get(job_id)
+    
+    if status is None:
+        return jsonify({'error': f'Unknown job: {job_id}'}), 404
+    
+    return jsonify(status), 200
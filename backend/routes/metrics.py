@@ -0,0 +1,16 @@
+from flask import Blueprint, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import logging
+
+from backend.utils.metrics import collect_registry
+
+logging.basicConfig(level=logging.INFO, 
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose request, upload, parser and database metrics for Prometheus."""
+    return Response(generate_latest(collect_registry()), mimetype=CONTENT_TYPE_LATEST)
@@ -0,0 +1,63 @@
+from flask import Blueprint, jsonify, request
+import logging
+
+from backend.routes.params import date_range
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+nutrition_bp = Blueprint('nutrition', __name__, url_prefix='/api')
+
+@nutrition_bp.route('/users/<int:user_id>/nutrition', methods=['GET'])
+def nutrition_series(user_id):
+    """Nutrition time series of one user: ?from=YYYY-MM-DD&to=YYYY-MM-DD&granularity=day|week|month."""
+    from backend.utils.queries import get_nutrition_series
+    
+    try:
+        start, end = date_range()
+        granularity = request.args.get('granularity', 'day')
+        series = get_nutrition_series(user_id, start, end, granularity)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'user_id': user_id,
+        'granularity': granularity,
+        'from': start.isoformat() if start else None,
+        'to': end.isoformat() if end else None,
+        'data': series
+    }), 200
+
+@nutrition_bp.route('/users/<int:user_id>/trends', methods=['GET'])
+def nutrition_trends(user_id):
+    """Daily rolling trends of one user, optionally limited with ?from= and ?to=."""
+    from backend.utils.queries import get_trend_series
+    
+    try:
+        start, end = date_range()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'user_id': user_id,
+        'from': start.isoformat() if start else None,
+        'to': end.isoformat() if end else None,
+        'data': get_trend_series(user_id, start, end)
+    }), 200
+
+@nutrition_bp.route('/users/<int:user_id>/summary', methods=['GET'])
+def nutrition_summary(user_id):
+    """Totals and daily averages of one user, optionally limited with ?from= and ?to=."""
+    from backend.utils.queries import get_nutrition_summary
+    
+    try:
+        start, end = date_range()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    summary = get_nutrition_summary(user_id, start, end)
+    if summary is None:
+        return jsonify({'error': f'No data found for user {user_id}'}), 404
+
+    return jsonify({'user_id': user_id, **summary}), 200
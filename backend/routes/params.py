@@ -0,0 +1,19 @@
+from flask import request
+from datetime import date
+
+def date_range():
+    """The optional ?from= and ?to= dates (YYYY-MM-DD) of the request, as (start, end)."""
+    start = parse_date('from')
+    end = parse_date('to')
+    if start and end and start > end:
+        raise ValueError("'from' must not be after 'to'")
+    return start, end
+
+def parse_date(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid '{name}' date '{value}'. Expected YYYY-MM-DD")
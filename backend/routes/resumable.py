@@ -0,0 +1,179 @@
+from flask import Blueprint, request, jsonify, current_app, url_for, g
+from werkzeug.utils import secure_filename
+import logging
+
+from backend.routes.upload import allowed_file, _upload_result
+from backend.utils.jobs import get_job_manager, get_resumable_job_manager, QueueFullError
+from backend.utils.resumable import ResumableUpload, purge_stale_uploads
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+resumable_bp = Blueprint('resumable', __name__, url_prefix='/api')
+
+@resumable_bp.route('/uploads', methods=['POST'])
+def start_upload():
+    """
+    Start a resumable upload: {"filename": "export.csv.gz", "size": <bytes>}.
+    The response gives the upload id, chunk size and number of chunks.
+    """
+    body = request.get_json(silent=True) or {}
+    filename = secure_filename(str(body.get('filename') or ''))
+    size = body.get('size')
+
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed. Please upload a .csv, .csv.gz, .csv.zst or .zip file.'}), 400
+    if type(size) is not int or size <= 0:
+        return jsonify({'error': 'size must be the file size in bytes.'}), 400
+    if size > current_app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'error': f"The file is larger than the {current_app.config['MAX_CONTENT_LENGTH']:,} byte limit."}), 413
+
+    folder = current_app.config['RESUMABLE_FOLDER']
+    purge_stale_uploads(folder, current_app.config['RESUMABLE_UPLOAD_TTL'])
+    upload = ResumableUpload.create(folder, filename, size, current_app.config['RESUMABLE_CHUNK_SIZE'])
+
+    return jsonify(_upload_status(upload)), 201
+
+@resumable_bp.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Report the received byte ranges and missing chunks of an upload."""
+    upload = ResumableUpload.load(current_app.config['RESUMABLE_FOLDER'], upload_id)
+    if upload is None:
+        return jsonify({'error': f'Unknown upload: {upload_id}'}), 404
+
+    return jsonify(_upload_status(upload)), 200
+
+@resumable_bp.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_chunk(upload_id, index):
+    """
+    Store chunk index (the raw request body), checked against its
+    X-Chunk-SHA256 header. Resending a received chunk is a no-op. Once the
+    first chunk is in, the upload starts parsing in the background if a
+    RESUMABLE_PARSE_WORKERS worker is free.
+    """
+    upload = ResumableUpload.load(current_app.config['RESUMABLE_FOLDER'], upload_id)
+    if upload is None:
+        return jsonify({'error': f'Unknown upload: {upload_id}'}), 404
+
+    try:
+        expected = upload.chunk_length(index)
+        if request.content_length is not None and request.content_length != expected:
+            raise ValueError(f"Chunk {index} must be {expected} bytes, got {request.content_length}.")
+        written = upload.write_chunk(index, request.get_data(cache=False), request.headers.get('X-Chunk-SHA256'))
+    except ValueError as e:
+        logger.warning(f"Rejected chunk {index} of upload {upload_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+    if written and upload.is_received(0):
+        try:
+            _start_parse(upload, get_resumable_job_manager())
+        except QueueFullError:
+            # Parsing starts on a later chunk or on completion instead.
+            logger.info(f"Upload queue full, deferring the parse of upload {upload_id}")
+
+    return jsonify({'index': index, 'duplicate': not written, 'job_id': upload.parse_job()}), 200
+
+@resumable_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """
+    Finish an upload once every chunk is in. Answers 202 with the job that
+    parses it, which usually started while the chunks were being sent.
+    """
+    upload = ResumableUpload.load(current_app.config['RESUMABLE_FOLDER'], upload_id)
+    if upload is None:
+        return jsonify({'error': f'Unknown upload: {upload_id}'}), 404
+
+    missing = upload.missing_chunks()
+    if missing:
+        return jsonify({'error': f'{len(missing)} chunk(s) have not been received.', 'missing_chunks': missing}), 409
+
+    upload.mark_complete()
+
+    # A parse that failed while chunks were arriving (e.g. the client stalled)
+    # is started again on the complete file.
+    job_id = upload.parse_job()
+    status = get_job_manager().get(job_id) if job_id else None
+    if status is not None and status['state'] == 'failed':
+        upload.release_parse()
+
+    try:
+        job_id = _start_parse(upload, get_job_manager())
+    except QueueFullError as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+
+    if job_id is None:
+        response = jsonify({'error': 'The upload is still starting to parse. Please retry shortly.'})
+        response.headers['Retry-After'] = '1'
+        return response, 409
+
+    if status is not None and status['state'] == 'succeeded':
+        upload.remove()
+
+    logger.info(f"Completed resumable upload {upload_id} ({upload.size} bytes), parsed by job {job_id}")
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('jobs.job_status', job_id=job_id)
+    }), 202
+
+@resumable_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload(upload_id):
+    """Discard an upload; a parse still waiting for its chunks stops, keeping the rows it has committed."""
+    upload = ResumableUpload.load(current_app.config['RESUMABLE_FOLDER'], upload_id)
+    if upload is None:
+        return jsonify({'error': f'Unknown upload: {upload_id}'}), 404
+
+    upload.remove()
+    logger.info(f"Cancelled resumable upload {upload_id}")
+    return '', 204
+
+def _upload_status(upload):
+    status = upload.to_dict()
+    status['upload_url'] = url_for('resumable.upload_status', upload_id=upload.id)
+    if status['job_id']:
+        status['status_url'] = url_for('jobs.job_status', job_id=status['job_id'])
+    return status
+
+def _start_parse(upload, manager):
+    """
+    Submit the background job that parses upload to manager unless one has
+    been submitted already, by any process. Returns the job id, or None
+    while another request is still submitting it.
+    """
+    if not upload.claim_parse():
+        return upload.parse_job()
+
+    try:
+        job = manager.submit(current_app._get_current_object(), upload.filename,
+                             _run_resumable_job, upload, manager)
+    except Exception:
+        upload.release_parse()
+        raise
+
+    upload.set_parse_job(job.id)
+    logger.info(f"Parsing resumable upload {upload.id} as job {job.id}")
+    return job.id
+
+def _run_resumable_job(job, upload, manager):
+    """
+    Parse an upload. One still arriving is read up to the received prefix,
+    committing chunk by chunk (see process_upload); a complete one is
+    parsed like any other file.
+    """
+    from backend.utils.pipeline import process_upload
+
+    g.metrics_endpoint = 'upload.resumable_job'
+    try:
+        source = None if upload.is_complete() else upload.open_reader(current_app.config['RESUMABLE_STALL_TIMEOUT'])
+        summary = process_upload(upload.file_path, source=source, upload_id=upload.id,
+                                 progress=lambda phase, rows: manager.update(job, phase, rows))
+        job.rows_processed = summary['rows']
+        return _upload_result(summary, upload.filename)
+    finally:
+        # Until the client completes the upload it may still resume it after
+        # a failed parse, so the chunks are kept.
+        if upload.is_complete():
+            upload.remove()
@@ -0,0 +1,22 @@
+from flask import Blueprint, jsonify
+import logging
+
+from backend.utils.cache import get_query_cache
+
+logging.basicConfig(level=logging.INFO, 
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+status_bp = Blueprint('status', __name__, url_prefix='/api')
+
+@status_bp.route('/db/pool', methods=['GET'])
+def pool_status():
+    """Report connection pool usage for the worker that serves the request."""
+    from backend.utils.db_client import get_pool_stats
+    
+    return jsonify(get_pool_stats()), 200
+
+@status_bp.route('/cache', methods=['GET'])
+def cache_status():
+    """Report hit, miss and eviction counters of the read API cache in this worker."""
+    return jsonify(get_query_cache().stats()), 200
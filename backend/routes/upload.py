@@ -1,14 +1,12 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, url_for, g
 import os
 from werkzeug.utils import secure_filename
 import uuid
 import logging
-import pandas as pd
 import traceback
 
-from backend.utils.csv_parser import parse_csv
-from backend.utils.data_transform import transform_data
-from backend.utils.db_client import insert_fitness_data
+from backend.utils.jobs import get_job_manager, QueueFullError
+from backend.utils.profiling import requested_profiler, profiled
 
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -17,9 +15,8 @@ logger = logging.getLogger(__name__)
 upload_bp = Blueprint('upload', __name__, url_prefix='/api')
 
 def allowed_file(filename):
-    """Check if the uploaded file has an allowed extension."""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+    """Check if the uploaded file has an allowed extension (csv, csv.gz, csv.zst or zip)."""
+    return any(filename.lower().endswith(f'.{extension}') for extension in current_app.config['ALLOWED_EXTENSIONS'])
 
 @upload_bp.route('/upload', methods=['POST'])
 def upload_file():
@@ -47,52 +44,21 @@ def upload_file():
         file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
         file.save(file_path)
         
+        profiler = requested_profiler(request.headers.get('X-Profile'))
+        
+        if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+            return _submit_upload_job(file_path, original_filename, profiler)
+        
         try:
-            try:
-                preview_df = pd.read_csv(file_path, nrows=5)
-                if preview_df.empty:
-                    raise ValueError("The CSV file is empty")
-                
-                if len(preview_df.columns) < 3:
-                    raise ValueError("CSV does not have enough columns. Expected at least 3 columns including user_id, date, and nutrition data.")
-                
-                logger.info(f"Valid CSV format detected with {len(preview_df.columns)} columns")
-            except pd.errors.EmptyDataError:
-                raise ValueError("The CSV file is empty")
-            except pd.errors.ParserError:
-                raise ValueError("Invalid CSV format. Please check the file and try again.")
-            
-            logger.info(f"Parsing CSV file: {original_filename}")
-            parsed_data = parse_csv(file_path)
-            
-            if parsed_data.empty:
-                raise ValueError("No valid data found in the CSV file after parsing")
+            from backend.utils.pipeline import process_upload
             
-            unique_users = parsed_data['user_id'].unique()
-            logger.info(f"Found data for {len(unique_users)} user(s): {', '.join(map(str, unique_users))}")
-            
-            logger.info("Transforming data")
-            transformed_data = transform_data(parsed_data)
-            
-            logger.info("Inserting data into database")
-            rows_affected = insert_fitness_data(transformed_data)
+            logger.info(f"Processing CSV file: {original_filename}")
+            with profiled(profiler, original_filename) as report:
+                summary = process_upload(file_path)
             
             os.remove(file_path)
             
-            user_summary = ""
-            if len(unique_users) == 1:
-                user_summary = f"Data for user ID {unique_users[0]} processed successfully."
-            else:
-                user_summary = f"Data for {len(unique_users)} users processed successfully."
-            
-            return jsonify({
-                'success': True,
-                'message': f'File uploaded and processed successfully. {rows_affected} records inserted. {user_summary}',
-                'filename': original_filename,
-                'users_processed': len(unique_users),
-                'users_processed_details': unique_users.tolist(),  
-                'records_inserted': rows_affected
-            }), 200
+            return jsonify(_upload_result(summary, original_filename, report)), 200
             
         except ValueError as e:
             logger.error(f"Validation error: {str(e)}")
@@ -116,4 +82,74 @@ def upload_file():
             }), 500
     
     logger.warning(f"File type not allowed: {file.filename}")
-    return jsonify({'error': 'File type not allowed. Please upload a CSV file.'}), 400 
\ No newline at end of file
+    return jsonify({'error': 'File type not allowed. Please upload a .csv, .csv.gz, .csv.zst or .zip file.'}), 400 
+
+def _submit_upload_job(file_path, original_filename, profiler=None):
+    """Hand a saved upload to the background pool and return its job id."""
+    try:
+        job = get_job_manager().submit(current_app._get_current_object(), original_filename,
+                                       _run_upload_job, file_path, original_filename, profiler,
+                                       on_abandon=lambda: _remove_upload(file_path))
+    except QueueFullError as e:
+        logger.warning(f"Upload queue full, rejecting {original_filename}")
+        os.remove(file_path)
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    
+    logger.info(f"Queued upload job {job.id} for {original_filename}")
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status_url': url_for('jobs.job_status', job_id=job.id)
+    }), 202
+
+def _run_upload_job(job, file_path, original_filename, profiler=None):
+    """Body of a background upload; its return value becomes the job result."""
+    from backend.utils.pipeline import process_upload
+    
+    manager = get_job_manager()
+    g.metrics_endpoint = 'upload.job'
+    try:
+        with profiled(profiler, original_filename) as report:
+            summary = process_upload(file_path, progress=lambda phase, rows: manager.update(job, phase, rows))
+        job.rows_processed = summary['rows']
+        return _upload_result(summary, original_filename, report)
+    finally:
+        _remove_upload(file_path)
+
+def _remove_upload(file_path):
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+def _upload_result(summary, original_filename, report=None):
+    """Response body describing a processed upload."""
+    unique_users = summary['users']
+    logger.info(f"Found data for {len(unique_users)} user(s): {', '.join(map(str, unique_users))}")
+    
+    user_summary = ""
+    if len(unique_users) == 1:
+        user_summary = f"Data for user ID {unique_users[0]} processed successfully."
+    else:
+        user_summary = f"Data for {len(unique_users)} users processed successfully."
+    
+    return {
+        'success': True,
+        'message': f'File uploaded and processed successfully. {summary["inserted"]} records inserted, {summary["updated"]} records updated, {summary["unchanged"]} unchanged records skipped, {summary["rejected"]["rows"]} invalid rows rejected. {user_summary}',
+        'filename': original_filename,
+        'users_processed': len(unique_users),
+        'users_processed_details': unique_users,  
+        'records_processed': summary['rows'],
+        'csv_bytes': summary['csv_bytes'],
+        'records_inserted': summary['inserted'],
+        'records_updated': summary['updated'],
+        'records_unchanged': summary['unchanged'],
+        'duplicate_file': summary['duplicate_file'],
+        'records_rejected': summary['rejected']['rows'],
+        'rejected_by_reason': summary['rejected']['reasons'],
+        'upload_id': summary['upload_id'],
+        'seconds': summary['seconds'],
+        'phase_seconds': summary['phase_seconds'],
+        'db_round_trips': summary['db_round_trips'],
+        **(report or {})
+    }
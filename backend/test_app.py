@@ -1,9 +1,23 @@
+import gzip
+import io
+import json
+import os
+import subprocess
+import sys
+import zipfile
+
 import pytest
+import pandas as pd
+from sqlalchemy import text
+
 from backend.app import app
+from backend.utils.db_client import insert_fitness_data
 
 @pytest.fixture
-def client():
+def client(tmp_path, monkeypatch):
     app.config['TESTING'] = True
+    monkeypatch.setitem(app.config, 'ARCHIVE_UPLOADS', True)
+    monkeypatch.setitem(app.config, 'ARCHIVE_FOLDER', str(tmp_path / 'archive'))
     with app.test_client() as client:
         yield client
 
@@ -13,4 +27,242 @@ def test_index_route(client):
 
 def test_grafana_redirect(client):
     response = client.get('/grafana')
-    assert response.status_code == 302  # Redirect status code 
\ No newline at end of file
+    assert response.status_code == 302  # Redirect status code 
+
+def test_app_starts_without_database_or_data_libraries():
+    script = ("import sys; from backend.app import app; "
+              "assert app.test_client().get('/').status_code == 200; "
+              "print(sorted({'pandas', 'numpy', 'sqlalchemy'} & set(sys.modules)))")
+    env = dict(os.environ, DB_HOST='db.invalid')
+    
+    result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), timeout=60)
+    
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '[]'
+
+def test_wsgi_preloads_data_libraries_without_database():
+    script = ("import sys; import backend.wsgi; from backend.utils import db_client; "
+              "assert not db_client._engines; "
+              "print(sorted({'pandas', 'numpy', 'sqlalchemy'} & set(sys.modules)))")
+    env = dict(os.environ, DB_HOST='db.invalid')
+
+    result = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), timeout=60)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "['numpy', 'pandas', 'sqlalchemy']"
+
+def test_gunicorn_config_reads_environment(tmp_path, monkeypatch):
+    import runpy
+
+    monkeypatch.setenv('WEB_CONCURRENCY', '3')
+    monkeypatch.setenv('GUNICORN_TIMEOUT', '600')
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path / 'metrics'))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    config = runpy.run_path(os.path.join(root, 'gunicorn.conf.py'))
+
+    assert (config['workers'], config['timeout'], config['preload_app']) == (3, 600, True)
+    assert config['max_requests'] > 0 and config['max_requests_jitter'] > 0
+    assert os.path.isdir(tmp_path / 'metrics')
+
+def test_gunicorn_worker_exit_in_master_is_a_no_op(tmp_path, monkeypatch):
+    import runpy
+    from types import SimpleNamespace
+    from backend.utils import jobs
+
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path / 'metrics'))
+    monkeypatch.setattr(jobs, 'stop_job_managers', lambda *args: pytest.fail('stopped the master\'s jobs'))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    config = runpy.run_path(os.path.join(root, 'gunicorn.conf.py'))
+    # What Arbiter.kill_worker passes when the worker is already gone: the
+    # master's Worker object, which post_fork never ran on.
+    server = SimpleNamespace(cfg=SimpleNamespace(graceful_timeout=30))
+    worker = SimpleNamespace(pid=os.getpid() + 1, tmp=None)
+
+    config['worker_exit'](server, worker)
+
+def test_migrate_command_records_schema_version(test_db):
+    runner = app.test_cli_runner()
+    
+    assert 'is up to date' in runner.invoke(args=['migrate']).output
+    assert 'Applied schema version' in runner.invoke(args=['migrate', '--force']).output
+    with test_db.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM schema_migrations")).scalar() == 1
+
+def test_pool_status(client):
+    response = client.get('/api/db/pool')
+    assert response.status_code == 200
+    assert {'checked_out', 'idle', 'avg_wait_ms'} <= set(response.json)
+
+def test_nutrition_series_is_cached_until_user_rows_change(client, test_db):
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id = 904"))
+    
+    df = pd.DataFrame({'user_id': [904], 'date': pd.to_datetime(['2014-09-01']), 'calories': [1800.0]})
+    with app.app_context():
+        insert_fitness_data(df.copy())
+    
+    url = '/api/users/904/nutrition?from=2014-09-01&to=2014-09-30'
+    first = client.get(url)
+    hits = client.get('/api/cache').json['hits']
+    assert client.get(url).json == first.json
+    assert client.get('/api/cache').json['hits'] == hits + 1
+    assert [row['calories'] for row in first.json['data']] == [1800.0]
+    
+    df['calories'] = [2100.0]
+    with app.app_context():
+        insert_fitness_data(df.copy())
+    
+    assert [row['calories'] for row in client.get(url).json['data']] == [2100.0]
+    assert client.get('/api/users/904/summary').json['days'] == 1
+
+def test_nutrition_series_is_reloaded_after_a_write_by_another_process(client, test_db):
+    df = pd.DataFrame({'user_id': [905], 'date': pd.to_datetime(['2014-09-01']), 'calories': [1800.0]})
+    with app.app_context():
+        insert_fitness_data(df.copy())
+
+    url = '/api/users/905/nutrition?from=2014-09-01&to=2014-09-30'
+    assert [row['calories'] for row in client.get(url).json['data']] == [1800.0]
+
+    # Another worker's upload: this process' cache is not told about it.
+    with test_db.begin() as conn:
+        conn.execute(text("UPDATE fitness_data SET calories = 2100 WHERE user_id = 905"))
+        conn.execute(text("UPDATE users SET updated_at = clock_timestamp() WHERE user_id = 905"))
+
+    assert [row['calories'] for row in client.get(url).json['data']] == [2100.0]
+
+def test_nutrition_series_rejects_bad_parameters(client):
+    assert client.get('/api/users/904/nutrition?granularity=year').status_code == 400
+    assert client.get('/api/users/904/nutrition?from=09-01-2014').status_code == 400
+    assert client.get('/api/users/904/nutrition?from=2014-09-02&to=2014-09-01').status_code == 400
+    assert client.get('/api/users/999999/summary').status_code == 404
+
+def test_upload_reports_phase_timings_and_metrics(client, tmp_path, monkeypatch, test_db):
+    csv = b'user,day,data\n905,2014-09-01,"{""Calories"": 1800}"\n905,2014-09-02,no nutrition\n'
+    monkeypatch.setitem(app.config, 'PROFILE_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.config, 'PROFILE_HEADER_ENABLED', True)
+    
+    response = client.post('/api/upload', data={'file': (io.BytesIO(csv), 'export.csv')},
+                           headers={'X-Profile': 'cprofile'}, content_type='multipart/form-data')
+    
+    assert response.status_code == 200
+    assert {'parse', 'transform', 'insert', 'rollup', 'commit'} <= set(response.json['phase_seconds'])
+    assert response.json['db_round_trips'] > 0
+    assert (tmp_path / response.json['profile']).exists()
+    
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'upload_phase_duration_seconds_bucket{le="0.005",phase="insert"}' in body
+    assert 'uploads_total{outcome="success"}' in body
+    assert 'csv_null_records_total' in body
+    assert 'db_round_trips_total{endpoint="upload.upload_file",kind="copy"}' in body
+    assert 'db_pool_checked_out{database=' in body
+
+def test_profile_header_is_ignored_unless_enabled(monkeypatch):
+    from backend.utils.profiling import requested_profiler
+    
+    monkeypatch.setitem(app.config, 'PROFILE_UPLOADS', '')
+    with app.app_context():
+        monkeypatch.setitem(app.config, 'PROFILE_HEADER_ENABLED', False)
+        assert requested_profiler('cprofile') is None
+        monkeypatch.setitem(app.config, 'PROFILE_HEADER_ENABLED', True)
+        assert requested_profiler('cprofile') == 'cprofile'
+
+def test_upload_accepts_compressed_exports(client, test_db, monkeypatch):
+    header = b'user,day,data\n'
+    first = header + b'905,2014-09-01,"{""Calories"": 1800}"\n'
+    second = header + b'906,2014-09-01,"{""Calories"": 2100}"\n'
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr('first.csv', first)
+        zf.writestr('second.csv', second)
+    archive.seek(0)
+    
+    response = client.post('/api/upload', data={'file': (archive, 'export.zip')}, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.json['records_processed'] == 2
+    assert response.json['csv_bytes'] == len(first) + len(second)
+    
+    response = client.post('/api/upload', data={'file': (io.BytesIO(gzip.compress(first)), 'export.csv.gz')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    
+    monkeypatch.setitem(app.config, 'MAX_DECOMPRESSED_LENGTH', 16)
+    response = client.post('/api/upload', data={'file': (io.BytesIO(gzip.compress(second)), 'export.csv.gz')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert 'byte limit' in response.json['error']
+    
+    with test_db.connect() as conn:
+        rows = conn.execute(text("SELECT user_id, calories FROM fitness_data WHERE user_id IN (905, 906) "
+                                 "AND date = '2014-09-01' ORDER BY user_id")).fetchall()
+    assert [tuple(row) for row in rows] == [(905, 1800), (906, 2100)]
+
+def test_export_streams_csv_ndjson_and_gzip(client, test_db, monkeypatch):
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id = 906"))
+    df = pd.DataFrame({'user_id': [906] * 3, 'date': pd.to_datetime(['2014-09-01', '2014-09-02', '2014-09-03']),
+                       'calories': [1800.0, None, 2000.0]})
+    with app.app_context():
+        insert_fitness_data(df)
+    monkeypatch.setitem(app.config, 'EXPORT_BATCH_SIZE', 2)
+    
+    response = client.get('/api/export?user_id=906&from=2014-09-02')
+    lines = response.get_data(as_text=True).splitlines()
+    assert response.headers['Content-Disposition'] == 'attachment; filename="fitness_data_user906_2014-09-02.csv"'
+    assert lines[0].startswith('user_id,date,calories,')
+    assert [line.split(',')[:3] for line in lines[1:]] == [['906', '2014-09-02', ''], ['906', '2014-09-03', '2000.0']]
+    
+    rows = [json.loads(line) for line in client.get('/api/export?user_id=906&format=ndjson').get_data().splitlines()]
+    assert [(row['date'], row['calories']) for row in rows] == [
+        ('2014-09-01', 1800.0), ('2014-09-02', None), ('2014-09-03', 2000.0)]
+    
+    response = client.get('/api/export?user_id=906&gzip=1')
+    assert response.mimetype == 'application/gzip'
+    assert gzip.decompress(response.get_data()).decode().count('\n906,') == 3
+
+def test_export_rejects_bad_parameters(client):
+    assert client.get('/api/export?format=xml').status_code == 400
+    assert client.get('/api/export?user_id=abc').status_code == 400
+    assert client.get('/api/export?from=2014-09-02&to=2014-09-01').status_code == 400
+
+def test_export_parquet(client, test_db):
+    pq = pytest.importorskip('pyarrow.parquet')
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id = 907"))
+    with app.app_context():
+        insert_fitness_data(pd.DataFrame({'user_id': [907, 907], 'date': pd.to_datetime(['2014-09-01', '2014-09-02']),
+                                          'calories': [1800.0, None]}))
+    
+    table = pq.read_table(io.BytesIO(client.get('/api/export?user_id=907&format=parquet').get_data()))
+    assert table.column('calories').to_pylist() == [1800.0, None]
+    assert str(table.schema.field('date').type) == 'date32[day]'
+
+def test_upload_is_archived_and_reprocessed(client, test_db):
+    csv = b'user,day,data\n908,2014-09-01,"{""Calories"": 1800, ""Carbs"": 200}"\n908,2014-09-02,"{""Carbs"": 50}"\n'
+    assert client.post('/api/upload', data={'file': (io.BytesIO(csv), 'export.csv')},
+                       content_type='multipart/form-data').status_code == 200
+    with test_db.begin() as conn:
+        conn.execute(text("UPDATE fitness_data SET carbs_calories = NULL WHERE user_id = 908"))
+    
+    result = app.test_cli_runner().invoke(args=['archive', 'reprocess', '--user-id', '908'])
+    
+    assert 'Reprocessed 2 rows of 1 user(s): 0 inserted, 2 updated.' in result.output
+    with test_db.connect() as conn:
+        rows = conn.execute(text("SELECT carbs_calories FROM fitness_data WHERE user_id = 908 ORDER BY date")).all()
+    assert [row[0] for row in rows] == [800.0, 200.0]
+
+def test_lifetime_summary_matches_range_summary(client, test_db):
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id = 909"))
+        conn.execute(text("DELETE FROM users WHERE user_id = 909"))
+    with app.app_context():
+        insert_fitness_data(pd.DataFrame({'user_id': [909] * 3,
+                                          'date': pd.to_datetime(['2014-09-01', '2014-09-02', '2014-09-04']),
+                                          'calories': [1800.0, None, 2000.0], 'steps': [5000, 7000, None]}))
+    
+    lifetime = client.get('/api/users/909/summary').json
+    
+    assert lifetime == client.get('/api/users/909/summary?from=2014-01-01&to=2014-12-31').json
+    assert (lifetime['days'], lifetime['avg_calories'], lifetime['total_steps']) == (3, 1900.0, 12000)
@@ -0,0 +1,58 @@
+import datetime
+import os
+
+import pandas as pd
+import pytest
+
+from backend.utils.archive import UploadArchive, archived_user_ids, read_user_archive
+from backend.utils.csv_parser import NUTRIENT_COLUMNS
+
+def make_chunk(user_ids, dates, calories):
+    df = pd.DataFrame({'user_id': pd.array(user_ids, dtype='Int32'), 'date': pd.to_datetime(dates)})
+    for nutrient in NUTRIENT_COLUMNS:
+        df[nutrient] = pd.array(calories if nutrient == 'calories' else [None] * len(dates), dtype='Float32')
+    return df
+
+def test_archive_keeps_latest_row_per_day(tmp_path):
+    first = UploadArchive(str(tmp_path))
+    first.write(make_chunk([1, 1, 2], ['2014-09-01', '2014-10-01', '2014-09-01'], [1800, 2000, 1500]))
+    first.write(make_chunk([1], ['2014-09-01'], [1850]))
+    first.publish()
+    
+    second = UploadArchive(str(tmp_path))
+    second.write(make_chunk([1], ['2014-10-01'], [2100]))
+    second.publish()
+    
+    discarded = UploadArchive(str(tmp_path))
+    discarded.write(make_chunk([3], ['2014-09-01'], [900]))
+    discarded.discard()
+    
+    assert archived_user_ids(str(tmp_path)) == [1, 2]
+    rows = read_user_archive(str(tmp_path), 1)
+    assert rows['calories'].tolist() == [1850, 2100]
+    assert list(rows.columns) == ['user_id', 'date'] + NUTRIENT_COLUMNS
+    assert read_user_archive(str(tmp_path), 1, start=datetime.date(2014, 9, 2))['calories'].tolist() == [2100]
+
+def test_archive_writes_each_partition_once_per_flush(tmp_path):
+    archive = UploadArchive(str(tmp_path), flush_rows=4)
+    archive.write(make_chunk([1, 2], ['2014-09-01', '2014-09-01'], [1800, 1500]))
+    archive.write(make_chunk([1, 2], ['2014-09-02', '2014-09-02'], [1900, 1600]))
+    archive.write(make_chunk([1], ['2014-09-03'], [2000]))
+    
+    # The first two chunks were flushed together, the last on publish.
+    assert archive.publish() == 3
+    assert sorted(len(files) for _, _, files in os.walk(tmp_path) if files) == [1, 2]
+    assert read_user_archive(str(tmp_path), 1)['calories'].tolist() == [1800, 1900, 2000]
+
+def test_query_archive_latest_view(tmp_path):
+    pytest.importorskip('duckdb')
+    from backend.utils.analytics import query_archive
+    
+    for calories in ([1800], [1900]):
+        archive = UploadArchive(str(tmp_path))
+        archive.write(make_chunk([5], ['2014-09-01'], calories))
+        archive.publish()
+    
+    result = query_archive("SELECT user_id, calories FROM fitness_latest", str(tmp_path))
+    assert result.values.tolist() == [[5, 1900.0]]
+    assert query_archive("SELECT count(*) AS n FROM fitness_archive", str(tmp_path))['n'][0] == 2
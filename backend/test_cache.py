@@ -0,0 +1,78 @@
+from backend.utils.cache import QueryCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryCache(max_entries=2, ttl=60)
+    cache.set((1, 'a'), 'a')
+    cache.set((1, 'b'), 'b')
+    cache.get((1, 'a'))
+    cache.set((2, 'c'), 'c')
+
+    assert cache.get((1, 'b')) == (False, None)
+    assert cache.get((1, 'a')) == (True, 'a')
+    assert cache.stats()['evictions'] == 1
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = QueryCache(max_entries=10, ttl=5, clock=clock)
+    cache.set((1, 'a'), 'a')
+
+    clock.now = 4.9
+    assert cache.get((1, 'a')) == (True, 'a')
+    clock.now = 5.0
+    assert cache.get((1, 'a')) == (False, None)
+    assert cache.stats()['expirations'] == 1
+
+def test_invalidate_users_only_drops_their_entries():
+    cache = QueryCache(max_entries=10, ttl=60)
+    cache.set((1, 'a'), 'a')
+    cache.set((1, 'b'), 'b')
+    cache.set((2, 'a'), 'c')
+
+    cache.invalidate_users([1])
+
+    assert cache.get((1, 'a'))[0] is False
+    assert cache.get((2, 'a')) == (True, 'c')
+    stats = cache.stats()
+    assert (stats['entries'], stats['invalidations'], stats['hits'], stats['misses']) == (1, 2, 1, 1)
+
+def test_result_loaded_across_an_invalidation_is_not_cached():
+    cache = QueryCache(max_entries=10, ttl=60)
+
+    def load_old_rows():
+        # A write for user 7 commits while the read is still running.
+        cache.invalidate_users([7])
+        return 'old rows'
+
+    assert cache.get_or_load((7, 'a'), load_old_rows) == 'old rows'
+    assert cache.get((7, 'a')) == (False, None)
+    assert cache.get_or_load((7, 'a'), lambda: 'new rows') == 'new rows'
+    assert cache.get((7, 'a')) == (True, 'new rows')
+
+def test_entry_with_another_version_is_stale():
+    cache = QueryCache(max_entries=10, ttl=60)
+    cache.set((1, 'a'), 'a', version='v1')
+
+    assert cache.get((1, 'a'), 'v1') == (True, 'a')
+    # Another process wrote user 1's rows, so the database has a new version.
+    assert cache.get_or_load((1, 'a'), lambda: 'b', 'v2') == 'b'
+    assert cache.get((1, 'a'), 'v2') == (True, 'b')
+    assert cache.stats()['stale'] == 1
+
+def test_generations_are_only_kept_while_a_load_runs():
+    cache = QueryCache(max_entries=10, ttl=60)
+    cache.invalidate_users(range(1000))
+    
+    def load():
+        cache.invalidate_users([7])
+        assert cache._generations == {7: 1}
+        return 'rows'
+    
+    cache.get_or_load((7, 'a'), load)
+    assert cache._generations == {} and cache._loading == {}
@@ -0,0 +1,52 @@
+import gzip
+import io
+import zipfile
+
+import pytest
+import zstandard
+
+from backend.utils.compression import DecompressedSizeGuard, detect_compression, iter_csv_streams
+
+CSV = b'user,day,data\n905,2014-09-01,"{""Calories"": 1800}"\n906,2014-09-01,"{""Calories"": 2100}"\n'
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+@pytest.mark.parametrize('kind, payload', [
+    (None, CSV),
+    ('gzip', gzip.compress(CSV)),
+    ('zstd', zstandard.ZstdCompressor().compress(CSV)),
+    ('zip', _zip({'export.csv': CSV}))
+])
+def test_streams_are_decompressed_and_counted(tmp_path, kind, payload):
+    file_path = tmp_path / 'upload'
+    file_path.write_bytes(payload)
+    guard = DecompressedSizeGuard(0)
+    
+    assert detect_compression(file_path) == kind
+    assert [stream.read() for _, stream in iter_csv_streams(file_path, guard)] == [CSV]
+    assert guard.bytes == len(CSV)
+
+def test_zip_members_and_size_limit(tmp_path):
+    file_path = tmp_path / 'upload.zip'
+    file_path.write_bytes(_zip({'b.csv': CSV, '__MACOSX/._b.csv': b'x', 'notes.txt': b'x', 'a/c.csv': CSV}))
+    
+    assert [name for name, _ in iter_csv_streams(file_path, DecompressedSizeGuard(0))] == ['b.csv', 'a/c.csv']
+    
+    with pytest.raises(ValueError, match='byte limit'):
+        list(iter_csv_streams(file_path, DecompressedSizeGuard(len(CSV))))
+    
+    bomb = tmp_path / 'bomb.csv.gz'
+    bomb.write_bytes(gzip.compress(b'0' * (4 * 1024 * 1024)))
+    with pytest.raises(ValueError, match='byte limit'):
+        for _, stream in iter_csv_streams(bomb, DecompressedSizeGuard(1024 * 1024)):
+            stream.read()
+    
+    empty = tmp_path / 'empty.zip'
+    empty.write_bytes(_zip({'notes.txt': b'x'}))
+    with pytest.raises(ValueError, match='does not contain any CSV'):
+        list(iter_csv_streams(empty, DecompressedSizeGuard(0)))
@@ -0,0 +1,70 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.utils.csv_parser import parse_csv, extract_nutrition_data, NUTRIENT_COLUMNS
+from backend.utils.data_transform import transform_data
+
+MEAL_JSON = json.dumps({'meal': 'Lunch', 'dishes': [{'name': 'Rice', 'nutrition': [
+    {'name': 'Calories', 'value': '250'},
+    {'name': 'Carbs', 'value': '45.5'},
+    {'name': 'Fat', 'value': '2'},
+    {'name': 'Protein', 'value': '5'},
+    {'name': 'Sodium', 'value': '10mg'},
+    {'name': 'Sugar', 'value': ''},
+]}]})
+
+@pytest.fixture
+def export_csv(tmp_path):
+    flat = '{"Calories": 1800, "Carbs": 200, "Fat": 60, "Protein": 90, "Sodium": 2300, "Sugar": 40}'
+    df = pd.DataFrame({
+        'user': [1, 1, 2, 2],
+        'day': ['01-09-2014', '02-09-2014', '01-09-2014', '02-09-2014'],
+        'part_1': [flat[:20], MEAL_JSON[:30], 'no nutrition here', "{'Calories': 1200}"],
+        'part_2': [flat[20:], MEAL_JSON[30:], np.nan, np.nan],
+    })
+    path = tmp_path / 'export.csv'
+    df.to_csv(path, index=False)
+    return path
+
+def test_parse_csv_extracts_all_shapes(export_csv):
+    result = parse_csv(str(export_csv))
+
+    assert list(result.columns) == ['user_id', 'date'] + NUTRIENT_COLUMNS
+    assert result['user_id'].tolist() == [1, 1, 2, 2]
+    assert result['date'].iloc[1] == pd.Timestamp('2014-09-02')
+    assert result.iloc[0][NUTRIENT_COLUMNS].tolist() == [1800, 200, 60, 90, 2300, 40]
+    assert result.iloc[1][['calories', 'carbs', 'sodium']].tolist() == [250, 45.5, 10]
+    assert pd.isna(result.iloc[1]['sugar'])
+    assert result.iloc[2][NUTRIENT_COLUMNS].isna().all()
+    assert result.iloc[3]['calories'] == 1200
+
+def test_parse_csv_matches_row_by_row_extraction(export_csv):
+    result = parse_csv(str(export_csv))
+    raw = pd.read_csv(export_csv)
+
+    for i, row in raw.iterrows():
+        json_str = ''.join(str(v) for v in row.iloc[2:] if pd.notna(v)).replace("'", '"')
+        expected = extract_nutrition_data(json_str, row.iloc[0], None)[0]
+        for nutrient in NUTRIENT_COLUMNS:
+            value = result.iloc[i][nutrient]
+            assert (pd.isna(value) if expected[nutrient] is None else value == expected[nutrient])
+
+def test_parse_csv_keeps_compact_dtypes(export_csv):
+    result = transform_data(parse_csv(str(export_csv)))
+
+    assert result['user_id'].dtype == 'Int32'
+    assert result['date'].dtype == 'datetime64[ns]'
+    assert (result.drop(columns=['user_id', 'date']).dtypes == 'Float32').all()
+    assert result['carbs_calories'].tolist()[:3] == [800, 182, 0]
+
+def test_parallel_parse_matches_serial(tmp_path):
+    from backend.benchmarks.generator import write_export
+    from backend.utils.parallel_parse import MIN_SHARD_ROWS
+    
+    path = tmp_path / 'large.csv'
+    write_export(path, 3 * MIN_SHARD_ROWS, users=9, seed=11, date_style='dmy')
+    
+    pd.testing.assert_frame_equal(parse_csv(path, workers=3), parse_csv(path))
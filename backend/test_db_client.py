@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from backend.utils.data_transform import transform_data
+from backend.utils.db_client import insert_fitness_data
+
+def make_frame(calories):
+    return transform_data(pd.DataFrame({
+        'user_id': [901, 901, 902],
+        'date': pd.to_datetime(['2014-09-01', '2014-09-02', '2014-09-01']),
+        'calories': calories,
+        'carbs': [100.0, None, 80.0],
+    }))
+
+@pytest.fixture
+def clean_table(test_app, test_db):
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id IN (901, 902)"))
+    yield test_db
+
+@pytest.mark.parametrize('mode', ['bulk', 'orm'])
+def test_insert_fitness_data_upserts(test_app, clean_table, mode):
+    with test_app.app_context():
+        assert insert_fitness_data(make_frame([1800.0, 2000.0, 1500.0]), mode=mode) == {'inserted': 3, 'updated': 0}
+        assert insert_fitness_data(make_frame([1900.0, 2100.0, 1600.0]), mode=mode) == {'inserted': 0, 'updated': 3}
+
+    with clean_table.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT user_id, calories, carbs FROM fitness_data WHERE user_id IN (901, 902) ORDER BY user_id, date"
+        )).fetchall()
+    assert [tuple(row) for row in rows] == [(901, 1900.0, 100.0), (901, 2100.0, None), (902, 1600.0, 80.0)]
+
+def test_bulk_upsert_last_row_wins_within_frame(test_app, clean_table):
+    df = make_frame([1800.0, 2000.0, 1500.0])
+    df.loc[3] = df.loc[0]
+    df.loc[3, 'calories'] = 2500.0
+
+    with test_app.app_context():
+        assert insert_fitness_data(df, mode='bulk') == {'inserted': 3, 'updated': 0}
+
+    with clean_table.connect() as conn:
+        calories = conn.execute(text(
+            "SELECT calories FROM fitness_data WHERE user_id = 901 AND date = '2014-09-01'")).scalar_one()
+    assert calories == 2500.0
+
+@pytest.mark.parametrize('mode', ['bulk', 'orm'])
+def test_user_totals_follow_inserts_and_updates(test_app, test_db, mode):
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id = 903"))
+        conn.execute(text("DELETE FROM users WHERE user_id = 903"))
+    first = pd.DataFrame({'user_id': [903, 903], 'date': pd.to_datetime(['2014-09-02', '2014-09-03']),
+                          'calories': [1800.0, 2000.0], 'steps': [4000, 6000]})
+    # Overwrites one day without steps and adds an earlier day.
+    second = transform_data(pd.DataFrame({'user_id': [903, 903], 'date': pd.to_datetime(['2014-09-01', '2014-09-03']),
+                                          'calories': [1500.0, 2500.0], 'carbs': [None, 100.0]}))
+
+    with test_app.app_context():
+        insert_fitness_data(first, mode=mode)
+        insert_fitness_data(second, mode=mode)
+
+    with test_db.connect() as conn:
+        totals = conn.execute(text("SELECT first_date::text, last_date::text, days, sum_calories, count_calories, "
+                                   "sum_carbs, count_carbs, sum_steps, count_steps "
+                                   "FROM users WHERE user_id = 903")).one()
+        expected = conn.execute(text("SELECT min(date)::text, max(date)::text, count(*), sum(calories), count(calories), "
+                                     "sum(carbs), count(carbs), sum(steps), count(steps) "
+                                     "FROM fitness_data WHERE user_id = 903")).one()
+    assert tuple(totals) == ('2014-09-01', '2014-09-03', 3, 5800.0, 3, 100.0, 1, 10000.0, 2)
+    assert tuple(totals) == tuple(expected)
@@ -0,0 +1,74 @@
+import hashlib
+import io
+
+import pytest
+from sqlalchemy import text
+
+from backend.app import app
+from backend.utils import dedupe
+from backend.utils.dedupe import file_sha256
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    app.config['TESTING'] = True
+    monkeypatch.setitem(app.config, 'ARCHIVE_FOLDER', str(tmp_path / 'archive'))
+    with app.test_client() as client:
+        yield client
+
+def test_file_sha256_reads_in_blocks(tmp_path):
+    # Several 1 MiB blocks and a partial one.
+    content = bytes(range(256)) * (5 * 4096 + 3)
+    path = tmp_path / 'export.csv'
+    path.write_bytes(content)
+
+    assert file_sha256(str(path)) == hashlib.sha256(content).hexdigest()
+    (tmp_path / 'empty.csv').write_bytes(b'')
+    assert file_sha256(str(tmp_path / 'empty.csv')) == hashlib.sha256(b'').hexdigest()
+
+def _upload(client, rows):
+    csv = 'user,day,data\n' + ''.join(f'{user_id},{day},"{{""Calories"": {calories}}}"\n'
+                                      for user_id, day, calories in rows)
+    response = client.post('/api/upload', data={'file': (io.BytesIO(csv.encode()), 'export.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200, response.json
+    return response.json
+
+def test_reuploads_only_write_changed_rows(client, test_db):
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id = 921"))
+    week = [(921, f'2014-09-0{day}', 1800 + day) for day in range(1, 8)]
+
+    first = _upload(client, week)
+    assert (first['records_inserted'], first['records_unchanged'], first['duplicate_file']) == (7, 0, False)
+
+    again = _upload(client, week)
+    assert again['duplicate_file'] is True
+    assert (again['records_inserted'], again['records_updated'], again['records_unchanged']) == (0, 0, 7)
+
+    # One day corrected and one day added.
+    changed = week[:6] + [(921, '2014-09-07', 2500), (921, '2014-09-08', 1900)]
+    result = _upload(client, changed)
+    assert (result['records_inserted'], result['records_updated'], result['records_unchanged']) == (1, 1, 6)
+
+    # The first file no longer matches what is stored, so it is not skipped.
+    result = _upload(client, week)
+    assert result['duplicate_file'] is False
+    assert (result['records_inserted'], result['records_updated'], result['records_unchanged']) == (0, 1, 6)
+
+    with test_db.connect() as conn:
+        calories = conn.execute(text("SELECT calories FROM fitness_data WHERE user_id = 921 "
+                                     "AND date = '2014-09-07'")).scalar()
+    assert calories == 1807
+
+def test_identical_file_is_processed_again_after_a_processing_change(client, test_db, monkeypatch):
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id = 922"))
+    rows = [(922, '2014-09-01', 1800)]
+
+    assert _upload(client, rows)['duplicate_file'] is False
+    assert _upload(client, rows)['duplicate_file'] is True
+
+    monkeypatch.setattr(dedupe, 'PROCESSING_VERSION', dedupe.PROCESSING_VERSION + 1)
+    result = _upload(client, rows)
+    assert (result['duplicate_file'], result['records_unchanged']) == (False, 1)
+    assert _upload(client, rows)['duplicate_file'] is True
@@ -0,0 +1,42 @@
+import datetime
+
+import pytest
+
+from backend.benchmarks.generator import write_export
+from backend.utils.csv_parser import parse_csv, NUTRIENT_COLUMNS
+
+@pytest.mark.parametrize('date_style', ['dmy', 'ymd'])
+def test_generated_export_parses_for_every_user(tmp_path, date_style):
+    path = tmp_path / 'export.csv'
+    write_export(path, 500, users=7, seed=1, date_style=date_style, data_columns=4)
+
+    df = parse_csv(path)
+
+    assert len(df) == 500
+    assert sorted(df['user_id'].unique()) == list(range(1, 8))
+    assert df['date'].min().strftime('%Y-%m-%d') == '2014-01-01'
+    # Only the deliberately empty rows come out without nutrients.
+    assert 0 < df[NUTRIENT_COLUMNS].isna().all(axis=1).sum() < 50
+
+def test_generated_export_is_deterministic_per_seed(tmp_path):
+    paths = [tmp_path / name for name in ('a.csv', 'b.csv', 'c.csv')]
+    for path, seed in zip(paths, (3, 3, 4)):
+        write_export(path, 200, seed=seed, date_style='random')
+
+    assert paths[0].read_bytes() == paths[1].read_bytes()
+    assert paths[0].read_bytes() != paths[2].read_bytes()
+
+@pytest.mark.parametrize('rows', [6000, 30000])
+def test_long_exports_end_by_today(tmp_path, rows):
+    # One user: 6000 days reach back before 2014, 30000 days wrap around since 1970.
+    path = tmp_path / 'export.csv'
+    write_export(path, rows, users=1, seed=2)
+
+    df = parse_csv(path)
+
+    assert df['date'].notna().all()
+    assert df['date'].max().date() <= datetime.date.today()
+    assert df['date'].min().date() >= datetime.date(1970, 1, 1)
+    if rows == 6000:
+        assert df['date'].max().date() == datetime.date.today()
+        assert df['date'].is_unique
@@ -0,0 +1,188 @@
+import datetime
+import threading
+
+import pytest
+from sqlalchemy import text
+
+from backend.utils.ingest import is_retryable
+from backend.utils.pipeline import process_upload
+
+USERS = list(range(9101, 9111))
+
+DAYS = 60
+
+UPLOADS = 8
+
+def _write_upload(path, calories):
+    """Every user on every day, all with the same calories, in day-major order."""
+    start = datetime.date(2014, 9, 1)
+    with open(path, 'w') as f:
+        f.write('user,day,data\n')
+        for day in range(DAYS):
+            for user_id in USERS:
+                f.write(f'{user_id},{start + datetime.timedelta(days=day)},"{{""Calories"": {calories}}}"\n')
+
+def test_concurrent_uploads_of_the_same_users(test_app, test_db, tmp_path, monkeypatch):
+    monkeypatch.setitem(test_app.config, 'UPLOAD_TRANSACTION', 'user')
+    monkeypatch.setitem(test_app.config, 'INGEST_WORKERS', 3)
+    monkeypatch.setitem(test_app.config, 'ARCHIVE_UPLOADS', False)
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id BETWEEN 9101 AND 9110"))
+        conn.execute(text("DELETE FROM fitness_data_rollup WHERE user_id BETWEEN 9101 AND 9110"))
+        conn.execute(text("DELETE FROM users WHERE user_id BETWEEN 9101 AND 9110"))
+    
+    paths = []
+    for index in range(UPLOADS):
+        paths.append(tmp_path / f'upload_{index}.csv')
+        _write_upload(paths[-1], 1000 + index)
+    
+    # Chunks of 20 days, so the uploads interleave chunk by chunk.
+    chunk_rows = 20 * len(USERS)
+    barrier = threading.Barrier(UPLOADS)
+    results, errors = [], []
+    
+    def upload(path):
+        with test_app.app_context():
+            barrier.wait()
+            try:
+                results.append(process_upload(str(path), chunk_size=chunk_rows))
+            except Exception as e:
+                errors.append(e)
+    
+    threads = [threading.Thread(target=upload, args=(path,)) for path in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+    
+    assert errors == []
+    assert len(results) == UPLOADS
+    assert sum(result['inserted'] for result in results) == DAYS * len(USERS)
+    
+    with test_db.connect() as conn:
+        assert conn.execute(text("""
+            SELECT count(*), count(DISTINCT (user_id, date)) FROM fitness_data
+            WHERE user_id BETWEEN 9101 AND 9110""")).one() == (DAYS * len(USERS), DAYS * len(USERS))
+        
+        # Each user's rows of one chunk are committed together, so they all
+        # come from the same upload.
+        mixed = conn.execute(text("""
+            SELECT count(*) FROM (
+                SELECT user_id, (date - DATE '2014-09-01') / 20 AS chunk FROM fitness_data
+                WHERE user_id BETWEEN 9101 AND 9110
+                GROUP BY 1, 2 HAVING count(DISTINCT calories) > 1) mixed""")).scalar()
+        assert mixed == 0
+        
+        # The rollups match the rows that won.
+        stale = conn.execute(text("""
+            SELECT count(*) FROM fitness_data_rollup r
+            JOIN (SELECT user_id, CAST(date_trunc('month', date) AS date) AS period_start,
+                         count(*) AS days, sum(calories) AS sum_calories
+                  FROM fitness_data WHERE user_id BETWEEN 9101 AND 9110 GROUP BY 1, 2) f
+              USING (user_id, period_start)
+            WHERE r.granularity = 'month' AND (r.days, r.sum_calories) IS DISTINCT FROM (f.days, f.sum_calories)
+        """)).scalar()
+        assert stale == 0
+        
+        # So do the users' running totals.
+        stale = conn.execute(text("""
+            SELECT count(*) FROM users u
+            JOIN (SELECT user_id, count(*) AS days, sum(calories) AS sum_calories
+                  FROM fitness_data WHERE user_id BETWEEN 9101 AND 9110 GROUP BY 1) f USING (user_id)
+            WHERE (u.days, u.sum_calories) IS DISTINCT FROM (f.days, f.sum_calories)
+        """)).scalar()
+        assert stale == 0
+
+def test_chunked_upload_is_written_in_one_transaction(test_app, test_db, tmp_path, monkeypatch):
+    monkeypatch.setitem(test_app.config, 'UPLOAD_TRANSACTION', 'file')
+    monkeypatch.setitem(test_app.config, 'ARCHIVE_UPLOADS', False)
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id BETWEEN 9101 AND 9110"))
+    path = tmp_path / 'upload.csv'
+    _write_upload(path, 1500)
+    
+    with test_app.app_context():
+        summary = process_upload(str(path), chunk_size=7 * len(USERS))
+    
+    assert (summary['chunks'], summary['rows'], summary['inserted']) == (-(-DAYS // 7), DAYS * len(USERS),
+                                                                         DAYS * len(USERS))
+    with test_db.connect() as conn:
+        assert conn.execute(text("SELECT count(*), sum(calories) FROM fitness_data "
+                                 "WHERE user_id BETWEEN 9101 AND 9110")).one() == (DAYS * len(USERS),
+                                                                                  1500 * DAYS * len(USERS))
+    
+    # A malformed row in the last chunk undoes the chunks written before it.
+    _write_upload(path, 1600)
+    with open(path, 'a') as f:
+        f.write('9101,2014-12-31,"{""Calories"": 1600}",extra\n')
+    with test_app.app_context():
+        with pytest.raises(ValueError, match='Invalid CSV format'):
+            process_upload(str(path), chunk_size=7 * len(USERS))
+    
+    with test_db.connect() as conn:
+        assert conn.execute(text("SELECT DISTINCT calories FROM fitness_data "
+                                 "WHERE user_id BETWEEN 9101 AND 9110")).scalars().all() == [1500]
+
+def test_file_uploads_reaching_shared_users_in_different_orders(test_app, test_db, tmp_path, monkeypatch):
+    monkeypatch.setitem(test_app.config, 'UPLOAD_TRANSACTION', 'file')
+    monkeypatch.setitem(test_app.config, 'ARCHIVE_UPLOADS', False)
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id BETWEEN 9101 AND 9110"))
+        conn.execute(text("DELETE FROM users WHERE user_id BETWEEN 9101 AND 9110"))
+    
+    # User-major files in opposite user orders, in chunks of half the users:
+    # each upload locks the users of its first chunk, then needs the other's.
+    paths = [tmp_path / 'forward.csv', tmp_path / 'backward.csv']
+    for path, users, calories in zip(paths, (USERS, USERS[::-1]), (1000, 2000)):
+        start = datetime.date(2014, 9, 1)
+        with open(path, 'w') as f:
+            f.write('user,day,data\n')
+            for user_id in users:
+                for day in range(DAYS):
+                    f.write(f'{user_id},{start + datetime.timedelta(days=day)},"{{""Calories"": {calories}}}"\n')
+    
+    barrier = threading.Barrier(len(paths))
+    results, errors = [], []
+    
+    def upload(path):
+        with test_app.app_context():
+            barrier.wait()
+            try:
+                results.append(process_upload(str(path), chunk_size=DAYS * len(USERS) // 2))
+            except Exception as e:
+                errors.append(e)
+    
+    threads = [threading.Thread(target=upload, args=(path,)) for path in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+    
+    # A deadlock aborts one upload, which is then run again.
+    assert errors == []
+    assert len(results) == len(paths)
+    with test_db.connect() as conn:
+        # Each upload is all or nothing, so every row comes from the one that committed last.
+        assert conn.execute(text("SELECT count(DISTINCT calories) FROM fitness_data "
+                                 "WHERE user_id BETWEEN 9101 AND 9110")).scalar() == 1
+        stale = conn.execute(text("""
+            SELECT count(*) FROM users u
+            JOIN (SELECT user_id, count(*) AS days, sum(calories) AS sum_calories
+                  FROM fitness_data WHERE user_id BETWEEN 9101 AND 9110 GROUP BY 1) f USING (user_id)
+            WHERE (u.days, u.sum_calories) IS DISTINCT FROM (f.days, f.sum_calories)
+        """)).scalar()
+        assert stale == 0
+
+def test_is_retryable_follows_the_exception_chain():
+    class DeadlockDetected(Exception):
+        pgcode = '40P01'
+    
+    try:
+        try:
+            raise DeadlockDetected('deadlock detected')
+        except DeadlockDetected as e:
+            raise ValueError('Database error') from e
+    except ValueError as e:
+        assert is_retryable(e)
+    
+    assert not is_retryable(ValueError('No valid data found'))
@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+from flask import Flask
+
+from backend.utils.jobs import JobManager, QueueFullError, fail_unfinished_jobs
+
+@pytest.fixture
+def manager(tmp_path):
+    return JobManager(max_workers=1, max_pending=1, status_folder=str(tmp_path))
+
+def test_job_reports_result(manager):
+    app = Flask(__name__)
+    job = manager.submit(app, 'export.csv', lambda job: {'rows': 3})
+    manager.executor.shutdown(wait=True)
+
+    status = manager.get(job.id)
+    assert status['state'] == 'succeeded'
+    assert status['result'] == {'rows': 3}
+
+def test_queue_full_raises(manager):
+    app = Flask(__name__)
+    release = threading.Event()
+
+    manager.submit(app, 'a.csv', lambda job: release.wait(5))
+    manager.submit(app, 'b.csv', lambda job: None)
+    with pytest.raises(QueueFullError):
+        manager.submit(app, 'c.csv', lambda job: None)
+
+    release.set()
+    manager.executor.shutdown(wait=True)
+
+def test_failed_job_keeps_error(manager):
+    def fail(job):
+        raise ValueError('bad export')
+
+    job = manager.submit(Flask(__name__), 'bad.csv', fail)
+    manager.executor.shutdown(wait=True)
+
+    assert manager.get(job.id)['state'] == 'failed'
+    assert manager.get(job.id)['error'] == 'bad export'
+
+def test_stop_fails_queued_and_unfinished_jobs(manager, tmp_path):
+    app = Flask(__name__)
+    release = threading.Event()
+    beats = []
+
+    started = threading.Event()
+
+    quick = manager.submit(app, 'a.csv', lambda job: started.set() or release.wait(0.2))
+    queued = manager.submit(app, 'b.csv', lambda job: None)
+    assert started.wait(5)
+    manager.stop()
+    assert manager.wait(5, heartbeat=lambda: beats.append(1)) == 0
+    assert beats
+    assert manager.get(quick.id)['state'] == 'succeeded'
+    assert manager.get(queued.id)['state'] == 'failed'
+
+    stuck = JobManager(max_workers=1, max_pending=0, status_folder=str(tmp_path))
+    job = stuck.submit(app, 'c.csv', lambda job: release.wait(5))
+    assert stuck.wait(0.1) == 1
+    assert 'server stopped' in stuck.get(job.id)['error']
+    release.set()
+
+def test_stop_cleans_up_jobs_that_never_started(manager, tmp_path):
+    app = Flask(__name__)
+    release = threading.Event()
+    running_input, queued_input = tmp_path / 'a.csv', tmp_path / 'b.csv'
+    running_input.write_text('a')
+    queued_input.write_text('b')
+
+    started = threading.Event()
+
+    running = manager.submit(app, 'a.csv', lambda job: started.set() or release.wait(5), on_abandon=running_input.unlink)
+    queued = manager.submit(app, 'b.csv', lambda job: None, on_abandon=queued_input.unlink)
+    assert started.wait(5)
+    manager.stop()
+    release.set()
+    manager.wait(5)
+
+    assert manager.get(running.id)['state'] == 'succeeded'
+    assert manager.get(queued.id)['state'] == 'failed'
+    assert running_input.exists() and not queued_input.exists()
+
+def test_fail_unfinished_jobs(manager, tmp_path):
+    app = Flask(__name__)
+    release = threading.Event()
+    running = manager.submit(app, 'a.csv', lambda job: release.wait(5))
+    done = JobManager(max_workers=1, max_pending=0, status_folder=str(tmp_path))
+    finished = done.submit(app, 'b.csv', lambda job: None)
+    done.executor.shutdown(wait=True)
+
+    # As a new server finds the status files of one that was killed.
+    assert fail_unfinished_jobs(str(tmp_path)) == 1
+    fresh = JobManager(max_workers=1, max_pending=0, status_folder=str(tmp_path))
+    assert fresh.get(running.id)['state'] == 'failed'
+    assert fresh.get(finished.id)['state'] == 'succeeded'
+    release.set()
+    manager.executor.shutdown(wait=True)
@@ -0,0 +1,145 @@
+import datetime
+import gzip
+import hashlib
+import threading
+import time
+
+import pytest
+from sqlalchemy import text
+
+from backend.app import app
+from backend.utils.resumable import ResumableUpload
+
+CSV = ''.join(['user,day,data\n'] + [f'{907 + i % 2},2014-09-{1 + i // 2:02d},"{{""Calories"": {1500 + i}}}"\n'
+                                      for i in range(40)]).encode()
+
+def _put(client, upload_id, index, data, chunk_size):
+    chunk = data[index * chunk_size:(index + 1) * chunk_size]
+    return client.put(f'/api/uploads/{upload_id}/chunks/{index}', data=chunk,
+                      headers={'X-Chunk-SHA256': hashlib.sha256(chunk).hexdigest()})
+
+def _wait_for_job(client, status_url):
+    for _ in range(200):
+        status = client.get(status_url).json
+        if status['state'] in ('succeeded', 'failed'):
+            return status
+        time.sleep(0.05)
+    raise AssertionError('upload job did not finish')
+
+def test_reader_follows_chunks_as_they_arrive(tmp_path):
+    data = bytes(range(256)) * 10
+    upload = ResumableUpload.create(str(tmp_path), 'export.csv', len(data), 1000)
+    chunk = lambda index: data[index * 1000:(index + 1) * 1000]
+    
+    upload.write_chunk(1, chunk(1), hashlib.sha256(chunk(1)).hexdigest())
+    upload.write_chunk(0, chunk(0), hashlib.sha256(chunk(0)).hexdigest())
+    assert upload.received_ranges() == [[0, 2000]]
+    assert upload.missing_chunks() == [2]
+    
+    with pytest.raises(ValueError, match='Checksum'):
+        upload.write_chunk(2, chunk(2), hashlib.sha256(b'other').hexdigest())
+    
+    reader = upload.open_reader(timeout=5)
+    assert reader.read(2000) == data[:2000]
+    
+    late = threading.Timer(0.2, lambda: upload.write_chunk(2, chunk(2), hashlib.sha256(chunk(2)).hexdigest()))
+    late.start()
+    assert reader.read() == data[2000:]
+    late.join()
+    reader.close()
+    
+    stalled = ResumableUpload.create(str(tmp_path), 'export.csv', 10, 5)
+    stalled.write_chunk(0, b'12345', hashlib.sha256(b'12345').hexdigest())
+    with pytest.raises(ValueError, match='arrived'):
+        stalled.open_reader(timeout=0.2).read()
+
+def test_resumable_upload_parses_while_chunks_arrive(test_db, tmp_path, monkeypatch):
+    app.config['TESTING'] = True
+    monkeypatch.setitem(app.config, 'RESUMABLE_FOLDER', str(tmp_path / 'resumable'))
+    monkeypatch.setitem(app.config, 'RESUMABLE_CHUNK_SIZE', 32)
+    monkeypatch.setitem(app.config, 'ARCHIVE_UPLOADS', False)
+    data = gzip.compress(CSV, mtime=0)
+    
+    with app.test_client() as client:
+        response = client.post('/api/uploads', json={'filename': 'export.csv.gz', 'size': len(data)})
+        assert response.status_code == 201
+        upload = response.json
+        upload_id, chunks = upload['upload_id'], upload['chunks']
+        assert chunks > 2
+        
+        assert client.post('/api/uploads', json={'filename': 'export.txt', 'size': 10}).status_code == 400
+        assert client.put(f'/api/uploads/{upload_id}/chunks/0', data=data[:32],
+                          headers={'X-Chunk-SHA256': '0' * 64}).status_code == 400
+        
+        # The parse starts with the first chunk and waits for the rest.
+        response = _put(client, upload_id, 0, data, 32)
+        assert response.status_code == 200
+        job_id = response.json['job_id']
+        assert job_id
+        
+        assert client.post(f'/api/uploads/{upload_id}/complete').status_code == 409
+        for index in reversed(range(1, chunks)):
+            assert _put(client, upload_id, index, data, 32).status_code == 200
+        assert _put(client, upload_id, 1, data, 32).json['duplicate'] is True
+        
+        status = client.get(f'/api/uploads/{upload_id}').json
+        assert status['received_ranges'] == [[0, len(data)]]
+        assert status['missing_chunks'] == []
+        
+        response = client.post(f'/api/uploads/{upload_id}/complete')
+        assert response.status_code == 202
+        assert response.json['job_id'] == job_id
+        
+        job = _wait_for_job(client, response.json['status_url'])
+        assert job['state'] == 'succeeded', job['error']
+        assert job['result']['records_processed'] == 40
+        assert job['result']['csv_bytes'] == len(CSV)
+    
+    with test_db.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM fitness_data WHERE user_id IN (907, 908)")).scalar() == 40
+    assert not (tmp_path / 'resumable' / upload_id).exists()
+
+def test_resumable_parse_commits_while_waiting_for_chunks(test_db, tmp_path, monkeypatch):
+    app.config['TESTING'] = True
+    monkeypatch.setitem(app.config, 'RESUMABLE_FOLDER', str(tmp_path / 'resumable'))
+    monkeypatch.setitem(app.config, 'RESUMABLE_CHUNK_SIZE', 64 * 1024)
+    monkeypatch.setitem(app.config, 'CSV_CHUNK_SIZE', 1000)
+    monkeypatch.setitem(app.config, 'ARCHIVE_UPLOADS', False)
+    days = [(datetime.date(2010, 1, 1) + datetime.timedelta(days=day)).isoformat() for day in range(2000)]
+    data = ''.join(['user,day,data\n'] + [f'{910 + i % 8},{days[i // 8]},"{{""Calories"": {1500 + i % 500}}}"\n'
+                                          for i in range(16000)]).encode()
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id BETWEEN 910 AND 917"))
+    
+    with app.test_client() as client:
+        upload = client.post('/api/uploads', json={'filename': 'export.csv', 'size': len(data)}).json
+        upload_id, chunks = upload['upload_id'], upload['chunks']
+        try:
+            for index in range(chunks // 2 + 1):
+                assert _put(client, upload_id, index, data, 64 * 1024).status_code == 200
+            
+            # The rows parsed so far are committed while the parse waits for the rest.
+            for _ in range(200):
+                with test_db.connect() as conn:
+                    stored = conn.execute(text("SELECT count(*) FROM fitness_data "
+                                               "WHERE user_id BETWEEN 910 AND 917")).scalar()
+                    idle = conn.execute(text("SELECT count(*) FROM pg_stat_activity WHERE datname = "
+                                             "current_database() AND state = 'idle in transaction'")).scalar()
+                if stored and not idle:
+                    break
+                time.sleep(0.05)
+            assert 0 < stored < 16000
+            assert idle == 0
+            
+            for index in range(chunks // 2 + 1, chunks):
+                assert _put(client, upload_id, index, data, 64 * 1024).status_code == 200
+            response = client.post(f'/api/uploads/{upload_id}/complete')
+            job = _wait_for_job(client, response.json['status_url'])
+        finally:
+            # A parse still waiting for chunks gives up once the upload is gone.
+            client.delete(f'/api/uploads/{upload_id}')
+    
+    assert job['state'] == 'succeeded', job['error']
+    assert job['result']['records_processed'] == 16000
+    with test_db.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM fitness_data WHERE user_id BETWEEN 910 AND 917")).scalar() == 16000
@@ -0,0 +1,44 @@
+import datetime
+
+import pandas as pd
+from sqlalchemy import text
+
+from backend.utils.db_client import insert_fitness_data, get_session
+from backend.utils.rollups import touched_buckets, refresh_rollups
+
+def test_touched_buckets_start_on_monday_and_first_of_month():
+    df = pd.DataFrame({'user_id': [7, 7], 'date': pd.to_datetime(['2014-09-03', '2014-10-01'])})
+
+    buckets = touched_buckets(df)
+
+    assert buckets['week'] == {(7, datetime.date(2014, 9, 1)), (7, datetime.date(2014, 9, 29))}
+    assert buckets['month'] == {(7, datetime.date(2014, 9, 1)), (7, datetime.date(2014, 10, 1))}
+
+def test_refresh_rollups_recomputes_touched_buckets(test_app, test_db):
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id = 903"))
+        conn.execute(text("DELETE FROM fitness_data_rollup WHERE user_id = 903"))
+
+    df = pd.DataFrame({
+        'user_id': [903, 903, 903],
+        'date': pd.to_datetime(['2014-09-01', '2014-09-02', '2014-09-08']),
+        'calories': [1000.0, 3000.0, 2000.0],
+    })
+    with test_app.app_context():
+        session = get_session()
+        insert_fitness_data(df.copy(), session=session)
+        refresh_rollups(session, touched_buckets(df))
+        session.commit()
+        session.close()
+
+    with test_db.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT granularity, period_start, days, avg_calories, max_calories
+            FROM fitness_data_rollup WHERE user_id = 903 ORDER BY granularity, period_start
+        """)).fetchall()
+
+    assert [tuple(row) for row in rows] == [
+        ('month', datetime.date(2014, 9, 1), 3, 2000.0, 3000.0),
+        ('week', datetime.date(2014, 9, 1), 2, 2000.0, 3000.0),
+        ('week', datetime.date(2014, 9, 8), 1, 2000.0, 2000.0),
+    ]
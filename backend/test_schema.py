@@ -0,0 +1,94 @@
+import datetime
+
+import pytest
+from sqlalchemy import Column, MetaData, Table, text
+from sqlalchemy.exc import IntegrityError
+
+from backend.utils import schema
+from backend.utils.db_client import FitnessData
+
+def test_month_helpers_wrap_across_years():
+    assert schema.month_start(datetime.date(2014, 12, 31)) == datetime.date(2014, 12, 1)
+    assert schema.add_months(datetime.date(2014, 12, 1), 1) == datetime.date(2015, 1, 1)
+    assert schema.add_months(datetime.date(2015, 1, 1), -13) == datetime.date(2013, 12, 1)
+    assert schema.partition_name('fitness_data', datetime.date(2015, 3, 1)) == 'fitness_data_y2015m03'
+
+def test_user_date_index_covers_macros_on_request(test_db):
+    schema.ensure_user_date_index(test_db, 'fitness_data', include_macros=True)
+    try:
+        with test_db.connect() as conn:
+            definition = conn.execute(text(
+                "SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conname = 'uq_fitness_data_user_date'"
+            )).scalar()
+            user_id_index = conn.execute(text("SELECT to_regclass('ix_fitness_data_user_id')")).scalar()
+    finally:
+        schema.ensure_user_date_index(test_db, 'fitness_data')
+
+    assert definition == 'UNIQUE (user_id, date) INCLUDE (calories, carbs, fat, protein)'
+    assert user_id_index is None
+
+def test_migrate_populated_table_to_partitions(test_db):
+    # A copy of fitness_data, so the other tests keep their plain table.
+    name = 'fitness_data_partition_test'
+    table = Table(name, MetaData(), *(Column(column.name, column.type, primary_key=column.primary_key,
+                                             nullable=column.nullable, index=column.index)
+                                      for column in FitnessData.__table__.columns))
+    upsert = text(f"""
+        INSERT INTO {name} (user_id, date, calories) VALUES (:user_id, :date, :calories)
+        ON CONFLICT (user_id, date) DO UPDATE SET calories = EXCLUDED.calories RETURNING id""")
+
+    table.create(test_db)
+    try:
+        with test_db.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {name} ADD {schema.user_date_constraint_sql(name, False)}"))
+            conn.execute(text(f"INSERT INTO {name} (user_id, date, calories) VALUES "
+                              "(1, '2014-08-31', 1800), (1, '2014-09-01', 1900), (2, '2014-09-01', 2000)"))
+
+        schema.migrate_to_partitioned(test_db, table)
+
+        with test_db.connect() as conn:
+            assert schema.is_partitioned(conn, name)
+            assert conn.execute(text(f"SELECT count(*) FROM {name}")).scalar() == 3
+            september = schema.partition_name(name, datetime.date(2014, 9, 1))
+            assert conn.execute(text(f"SELECT count(*) FROM {september}")).scalar() == 2
+            assert conn.execute(text(f"SELECT to_regclass('{name}_unpartitioned')")).scalar() is None
+
+        with pytest.raises(IntegrityError):
+            with test_db.begin() as conn:
+                conn.execute(text(f"INSERT INTO {name} (user_id, date) VALUES (1, '2014-09-01')"))
+
+        # A month with no partition yet is created on demand, then upserted into.
+        schema.ensure_partitions(test_db, name, [datetime.date(2014, 10, 5)])
+        with test_db.begin() as conn:
+            new_id = conn.execute(upsert, {'user_id': 1, 'date': '2014-10-05', 'calories': 2100}).scalar()
+            assert conn.execute(upsert, {'user_id': 1, 'date': '2014-10-05', 'calories': 2200}).scalar() == new_id
+            rows = conn.execute(text(f"SELECT date, calories FROM {name} WHERE user_id = 1 ORDER BY date")).all()
+        assert new_id > 3
+        assert [tuple(row) for row in rows] == [(datetime.date(2014, 8, 31), 1800), (datetime.date(2014, 9, 1), 1900),
+                                                (datetime.date(2014, 10, 5), 2200)]
+    finally:
+        with test_db.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {name}, {name}_unpartitioned CASCADE"))
+        schema._known_partitions.pop((test_db.url.render_as_string(), name), None)
+
+def test_ensure_partitions_accepts_months_created_by_another_process(test_db):
+    name = 'fitness_data_partition_race_test'
+    months = [datetime.date(2014, 9, 1), datetime.date(2014, 10, 1), datetime.date(2014, 11, 1)]
+    with test_db.begin() as conn:
+        conn.execute(text(f"CREATE TABLE {name} (user_id integer, date date) PARTITION BY RANGE (date)"))
+    try:
+        # Another worker got to October first, without IF NOT EXISTS.
+        with test_db.begin() as conn:
+            conn.execute(text(f"CREATE TABLE {schema.partition_name(name, months[1])} PARTITION OF {name} "
+                              "FOR VALUES FROM ('2014-10-01') TO ('2014-11-01')"))
+
+        schema.ensure_partitions(test_db, name, months)
+
+        with test_db.connect() as conn:
+            for month in months:
+                assert conn.execute(text(f"SELECT to_regclass('{schema.partition_name(name, month)}')")).scalar()
+        assert schema._known_partitions[(test_db.url.render_as_string(), name)] == set(months)
+    finally:
+        with test_db.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {name} CASCADE"))
+        schema._known_partitions.pop((test_db.url.render_as_string(), name), None)
@@ -0,0 +1,104 @@
+import datetime
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from backend.utils.data_transform import transform_data
+from backend.utils.db_client import insert_fitness_data, get_session
+from backend.utils.trends import TREND_COLUMNS, REBUILD_SQL, touched_spans, refresh_trends, rebuild_trends
+
+def _write(test_app, df):
+    df = transform_data(df)
+    with test_app.app_context():
+        session = get_session()
+        insert_fitness_data(df.copy(), session=session)
+        refresh_trends(session, touched_spans(df))
+        session.commit()
+        session.close()
+
+def _trends(conn, user_id):
+    rows = conn.execute(text(f"SELECT {', '.join(TREND_COLUMNS)} FROM fitness_trends "
+                             "WHERE user_id = :user_id ORDER BY date"), {'user_id': user_id}).all()
+    return [tuple(row) for row in rows]
+
+def test_trends_use_calendar_windows_and_follow_later_writes(test_app, test_db):
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id IN (904, 905)"))
+        conn.execute(text("DELETE FROM fitness_trends WHERE user_id IN (904, 905)"))
+
+    # Every other day for three weeks; 905 only checks that other users are left alone.
+    days = pd.date_range('2014-09-01', '2014-09-21', freq='2D')
+    _write(test_app, pd.DataFrame({
+        'user_id': [904] * len(days) + [905],
+        'date': list(days) + [pd.Timestamp('2014-09-01')],
+        'calories': [2000.0] * len(days) + [1500.0],
+        'carbs': [250.0] * len(days) + [100.0],
+        'fat': [50.0] * len(days) + [50.0],
+        'protein': [100.0] * len(days) + [100.0],
+    }))
+
+    with test_db.connect() as conn:
+        trends = {row.date: row for row in conn.execute(text(
+            "SELECT * FROM fitness_trends WHERE user_id = 904 ORDER BY date")).all()}
+        untouched = _trends(conn, 905)
+    first_week = trends[datetime.date(2014, 9, 7)]
+    assert (first_week.days_7d, first_week.calories_avg_7d, first_week.calories_wow_change) == (4, 2000.0, None)
+    assert first_week.carbs_share_7d == pytest.approx(1000 / 1850)
+    assert trends[datetime.date(2014, 9, 15)].calories_wow_change == 0.0
+
+    # A higher day on the 16th moves the trends of the following 29 days,
+    # including days after it that were already stored.
+    _write(test_app, pd.DataFrame({
+        'user_id': [904], 'date': pd.to_datetime(['2014-09-16']),
+        'calories': [3600.0], 'carbs': [650.0], 'fat': [50.0], 'protein': [100.0],
+    }))
+
+    with test_db.connect() as conn:
+        refreshed = _trends(conn, 904)
+        assert _trends(conn, 905) == untouched
+        later = conn.execute(text("SELECT days_7d, calories_avg_7d, calories_wow_change FROM fitness_trends "
+                                  "WHERE user_id = 904 AND date = '2014-09-17'")).one()
+        assert tuple(later) == (5, 2320.0, 320.0)
+
+        # Incremental refreshes give the same values as computing everything again.
+        conn.execute(text("DELETE FROM fitness_trends"))
+        conn.execute(text(REBUILD_SQL))
+        rebuilt = _trends(conn, 904)
+        conn.rollback()
+    assert refreshed == rebuilt
+
+def test_trends_endpoint(test_app, test_db):
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id = 906"))
+        conn.execute(text("DELETE FROM fitness_trends WHERE user_id = 906"))
+    _write(test_app, pd.DataFrame({
+        'user_id': [906, 906, 906],
+        'date': pd.to_datetime(['2014-09-01', '2014-09-02', '2014-09-03']),
+        'calories': [1000.0, 2000.0, 3000.0],
+    }))
+
+    with test_app.test_client() as client:
+        response = client.get('/api/users/906/trends?from=2014-09-02')
+        invalid = client.get('/api/users/906/trends?from=yesterday')
+
+    assert response.status_code == 200
+    assert [(row['date'], row['days_7d'], row['calories_avg_7d']) for row in response.json['data']] == [
+        ('2014-09-02', 2, 1500.0), ('2014-09-03', 3, 2000.0)]
+    assert invalid.status_code == 400
+
+def test_rebuilt_trends_are_not_served_from_the_cache(test_app, test_db):
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id = 907"))
+    _write(test_app, pd.DataFrame({'user_id': [907], 'date': pd.to_datetime(['2014-09-01']), 'calories': [1000.0]}))
+    
+    with test_app.test_client() as client:
+        url = '/api/users/907/trends'
+        assert [row['calories_avg_7d'] for row in client.get(url).json['data']] == [1000.0]
+        
+        # Changed with plain SQL, then repaired with `flask rebuild-trends`.
+        with test_db.begin() as conn:
+            conn.execute(text("UPDATE fitness_data SET calories = 1200 WHERE user_id = 907"))
+            rebuild_trends(conn)
+        
+        assert [row['calories_avg_7d'] for row in client.get(url).json['data']] == [1200.0]
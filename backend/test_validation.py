@@ -0,0 +1,113 @@
+import datetime
+import io
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from backend.app import app
+from backend.utils.validation import RowValidator
+
+def _frame(rows):
+    df = pd.DataFrame(rows, columns=['user_id', 'date', 'calories', 'carbs', 'fat', 'protein'])
+    df['user_id'] = df['user_id'].astype('Int32')
+    df['date'] = pd.to_datetime(df['date'])
+    for nutrient in ('calories', 'carbs', 'fat', 'protein', 'sodium', 'sugar'):
+        df[nutrient] = df.get(nutrient, pd.Series(index=df.index, dtype='float64')).astype('Float32')
+    return df
+
+def test_rules_and_duplicates_across_chunks():
+    validator = RowValidator(today=datetime.date(2015, 1, 1))
+    first = _frame([
+        (1, '2014-09-01', 1800, 200, 60, 100),
+        (None, '2014-09-02', 1800, None, None, None),
+        (1, None, 1800, None, None, None),
+        (1, '2014-09-03', None, None, None, None),
+        (1, '2014-09-04', -5, None, None, None),
+        (1, '2014-09-05', 3000, 50, 10, 20),
+        (1, '2015-01-02', 1800, None, None, None),
+        (1, '2014-09-01', 1900, None, None, None)
+    ])
+    second = _frame([
+        (1, '2014-09-01', 2000, None, None, None),
+        (2, '2014-09-01', 2000, None, None, None),
+        (1, '2014-09-04', 1800, None, None, None)
+    ])
+
+    valid, rejects, superseded = validator.split(first)
+    assert valid['calories'].tolist() == [1900]
+    assert rejects['row_number'].tolist() == [1, 2, 3, 4, 5, 6, 7]
+    assert rejects['reasons'].tolist() == ['duplicate', 'missing_user_id', 'missing_date', 'no_nutrients',
+                                           'out_of_range', 'calorie_mismatch', 'future_date']
+    assert superseded.empty
+
+    # A later chunk repeating a kept row supersedes it; one repeating a rejected row does not.
+    valid, rejects, superseded = validator.split(second)
+    assert valid['user_id'].tolist() == [1, 2, 1]
+    assert rejects.empty
+    assert superseded['row_number'].tolist() == [8]
+    assert validator.summary() == {'rows': 8, 'reasons': {
+        'missing_user_id': 1, 'missing_date': 1, 'no_nutrients': 1, 'out_of_range': 1,
+        'calorie_mismatch': 1, 'future_date': 1, 'duplicate': 2}}
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    app.config['TESTING'] = True
+    monkeypatch.setitem(app.config, 'ARCHIVE_FOLDER', str(tmp_path / 'archive'))
+    with app.test_client() as client:
+        yield client
+
+def test_upload_stores_rejects_and_reports_them(client, test_db):
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id = 931"))
+    csv = (b'user,day,data\n'
+           b'931,2014-09-01,"{""Calories"": 1800}"\n'
+           b'931,not a date,"{""Calories"": 1800}"\n'
+           b'931,2014-09-02,"no nutrition logged"\n'
+           b'931,2014-09-01,"{""Calories"": 1900}"\n')
+
+    response = client.post('/api/upload', data={'file': (io.BytesIO(csv), 'export.csv')},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    body = response.json
+    assert (body['records_inserted'], body['records_rejected']) == (1, 3)
+    assert body['rejected_by_reason'] == {'duplicate': 1, 'missing_date': 1, 'no_nutrients': 1}
+    with test_db.connect() as conn:
+        rejects = conn.execute(text("SELECT row_number, reasons FROM fitness_data_rejects "
+                                    "WHERE upload_id = :upload_id ORDER BY row_number"),
+                               {'upload_id': body['upload_id']}).all()
+        calories = conn.execute(text("SELECT calories FROM fitness_data WHERE user_id = 931")).scalars().all()
+    assert [tuple(row) for row in rejects] == [(1, ['duplicate']), (2, ['missing_date']), (3, ['no_nutrients'])]
+    assert calories == [1900]
+
+def test_upload_without_valid_rows_is_refused(client):
+    csv = b'user,day,data\n932,2014-09-01,"no nutrition logged"\n'
+
+    response = client.post('/api/upload', data={'file': (io.BytesIO(csv), 'export.csv')},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 400
+    assert '1 no_nutrients' in response.json['error']
+
+def test_later_chunk_supersedes_an_earlier_row(client, test_db, monkeypatch):
+    monkeypatch.setitem(app.config, 'CSV_CHUNK_SIZE', 2)
+    with test_db.begin() as conn:
+        conn.execute(text("DELETE FROM fitness_data WHERE user_id = 933"))
+    csv = (b'user,day,data\n'
+           b'933,2014-09-01,"{""Calories"": 1800}"\n'
+           b'933,2014-09-02,"{""Calories"": 1700}"\n'
+           b'933,2014-09-01,"{""Calories"": 2100}"\n')
+
+    response = client.post('/api/upload', data={'file': (io.BytesIO(csv), 'export.csv')},
+                           content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert response.json['rejected_by_reason'] == {'duplicate': 1}
+    with test_db.connect() as conn:
+        rejects = conn.execute(text("SELECT row_number, calories, reasons FROM fitness_data_rejects "
+                                    "WHERE upload_id = :upload_id"), {'upload_id': response.json['upload_id']}).all()
+        calories = conn.execute(text("SELECT calories FROM fitness_data WHERE user_id = 933 "
+                                     "ORDER BY date")).scalars().all()
+    assert [tuple(row) for row in rejects] == [(1, 1800, ['duplicate'])]
+    assert calories == [2100, 1700]
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import logging
+import os
+
+from backend.utils.archive import iter_archive
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+COHORT_MEASURES = ['calories', 'carbs', 'fat', 'protein']
+
+MACROS = {'carbs': 4, 'fat': 9, 'protein': 4}
+
+# Analytical scans read the Parquet archive rather than Postgres, one user at
+# a time, so they neither load fitness_data nor hold more than one user's rows.
+
+def cohort_averages(folder, start=None, end=None):
+    """
+    Daily averages per cohort and month of activity. A user's cohort is the
+    month of their first archived day; month 0 is that month, month 1 the
+    next, and so on. Returns one row per (cohort, month) with the number of
+    users and the average of each measure over their logged days.
+    """
+    totals = {}
+    for _, frame in iter_archive(folder, start=start, end=end):
+        if frame.empty:
+            continue
+        
+        months = frame['date'].dt.year * 12 + frame['date'].dt.month
+        cohort = frame['date'].min().strftime('%Y-%m')
+        values = frame[COHORT_MEASURES].astype('float64')
+        grouped = pd.concat([values.fillna(0), values.notna()], axis=1, keys=['sum', 'count']) \
+            .groupby((months - months.min()).to_numpy()).sum()
+        
+        for offset, row in grouped.iterrows():
+            entry = totals.setdefault((cohort, offset), {'users': 0, 'sum': 0, 'count': 0})
+            entry['users'] += 1
+            entry['sum'] = entry['sum'] + row['sum']
+            entry['count'] = entry['count'] + row['count']
+    
+    rows = [{'cohort': cohort, 'month': offset, 'users': entry['users'],
+             **(entry['sum'] / entry['count'].replace(0, np.nan)).round(2).to_dict()}
+            for (cohort, offset), entry in sorted(totals.items())]
+    return pd.DataFrame(rows, columns=['cohort', 'month', 'users'] + COHORT_MEASURES)
+
+def macro_distribution(folder, start=None, end=None, bins=10):
+    """
+    How the share of macro calories from carbs, fat and protein is spread
+    over all logged days: for each share range, the fraction of days that
+    fall in it. Days without any macro calories are left out.
+    """
+    edges = np.linspace(0, 1, bins + 1)
+    counts = {macro: np.zeros(bins, dtype=np.int64) for macro in MACROS}
+    days = 0
+    
+    for _, frame in iter_archive(folder, start=start, end=end):
+        calories = pd.DataFrame({macro: frame[macro].astype('float64').fillna(0) * factor
+                                 for macro, factor in MACROS.items()})
+        total = calories.sum(axis=1)
+        shares = calories[total > 0].div(total[total > 0], axis=0)
+        days += len(shares)
+        for macro in MACROS:
+            counts[macro] += np.histogram(shares[macro], bins=edges)[0]
+    
+    result = pd.DataFrame({'share_from': edges[:-1].round(3), 'share_to': edges[1:].round(3)})
+    for macro in MACROS:
+        result[macro] = (counts[macro] / days).round(4) if days else 0.0
+    return result
+
+def query_archive(sql, folder):
+    """
+    Run a DuckDB SQL query over the archive and return a DataFrame. Two views
+    are available: fitness_archive (every archived row, including superseded
+    re-uploads) and fitness_latest (one row per user and day, the latest).
+    """
+    if duckdb is None:
+        raise ValueError("Archive queries need the duckdb package, which is not installed.")
+    
+    pattern = os.path.join(folder, 'user_id=*', 'month=*', '*.parquet').replace("'", "''")
+    conn = duckdb.connect()
+    try:
+        conn.execute(f"""
+            CREATE VIEW fitness_archive AS
+            SELECT * FROM read_parquet('{pattern}', hive_partitioning = true, union_by_name = true)
+        """)
+        conn.execute("""
+            CREATE VIEW fitness_latest AS
+            SELECT * EXCLUDE (upload_id, ingested_at, upload_row)
+            FROM fitness_archive
+            QUALIFY row_number() OVER (PARTITION BY user_id, date ORDER BY ingested_at DESC, upload_row DESC) = 1
+        """)
+        return conn.execute(sql).df()
+    finally:
+        conn.close()
@@ -0,0 +1,166 @@
+import pyarrow as pa
+import pyarrow.dataset as ds
+import numpy as np
+import pandas as pd
+import logging
+import os
+import re
+import shutil
+import uuid
+
+from backend.utils.csv_parser import NUTRIENT_COLUMNS
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Parsed rows as they came out of parse_csv, plus which upload they came from
+# and their position in it, so re-uploaded days resolve as in fitness_data.
+# Files are laid out as <folder>/user_id=<id>/month=<YYYY-MM>/<upload>-*.parquet.
+ARCHIVE_SCHEMA = pa.schema(
+    [('user_id', pa.int32()), ('month', pa.string()), ('date', pa.date32())] +
+    [(nutrient, pa.float32()) for nutrient in NUTRIENT_COLUMNS] +
+    [('upload_id', pa.string()), ('ingested_at', pa.timestamp('ms', tz='UTC')), ('upload_row', pa.int64())])
+
+PARTITIONING = ds.partitioning(pa.schema([('user_id', pa.int32()), ('month', pa.string())]), flavor='hive')
+
+_USER_PARTITIONING = ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+
+_USER_DIR_PATTERN = re.compile(r'^user_id=(-?\d+)$')
+
+# Rows an upload buffers before writing them out. Each flush writes one file
+# per (user, month) it holds, so an upload of this many rows or fewer writes
+# every partition once, however many chunks it was parsed in.
+FLUSH_ROWS = 1_000_000
+
+# Partitions are small (at most a month of one user per upload), where
+# dictionary pages cost more time than they save space, except for the
+# upload id, which is the same on every row.
+_FILE_OPTIONS = ds.ParquetFileFormat().make_write_options(use_dictionary=['upload_id'])
+
+# Uploads are staged here until their transaction commits. Dataset discovery
+# skips names starting with '_', so staged files are never read.
+STAGING_DIR = '_staging'
+
+class UploadArchive:
+    """
+    Parsed chunks of one upload, buffered in memory, written to a staging
+    directory every flush_rows rows, and moved into the archive once the
+    upload's database transaction has committed.
+    """
+    
+    def __init__(self, folder, upload_id=None, flush_rows=FLUSH_ROWS):
+        self.folder = folder
+        self.upload_id = upload_id or uuid.uuid4().hex
+        self.ingested_at = pd.Timestamp.now(tz='UTC').floor('ms')
+        self.staging = os.path.join(folder, STAGING_DIR, self.upload_id)
+        self.flush_rows = flush_rows
+        self.flushes = 0
+        self.rows = 0
+        self._buffer = []
+        self._buffered_rows = 0
+    
+    def write(self, chunk):
+        """Buffer one parsed chunk (user_id, date and nutrient columns)."""
+        frame = chunk[['user_id', 'date'] + NUTRIENT_COLUMNS].copy(deep=False)
+        frame['month'] = _month_labels(frame['date'])
+        frame['upload_id'] = self.upload_id
+        frame['ingested_at'] = self.ingested_at
+        frame['upload_row'] = range(self.rows, self.rows + len(frame))
+        
+        self._buffer.append(pa.Table.from_pandas(frame, preserve_index=False)
+                            .select(ARCHIVE_SCHEMA.names).cast(ARCHIVE_SCHEMA))
+        self._buffered_rows += len(frame)
+        self.rows += len(frame)
+        if self._buffered_rows >= self.flush_rows:
+            self.flush()
+    
+    def flush(self):
+        """Stage the buffered rows, one file per (user, month) partition."""
+        if not self._buffer:
+            return
+        
+        # Grouped by partition, so a partition's file is finished before the
+        # next is opened even when there are more than max_open_files of them.
+        table = pa.concat_tables(self._buffer).sort_by([('user_id', 'ascending'), ('month', 'ascending')])
+        self._buffer = []
+        self._buffered_rows = 0
+        ds.write_dataset(table, self.staging, format='parquet', partitioning=PARTITIONING,
+                         basename_template=f'{self.upload_id}-{self.flushes}-{{i}}.parquet', file_options=_FILE_OPTIONS,
+                         existing_data_behavior='overwrite_or_ignore', max_partitions=1_000_000)
+        self.flushes += 1
+    
+    def publish(self):
+        """Move the staged files into the archive; returns how many were moved."""
+        self.flush()
+        moved = 0
+        for root, _, files in os.walk(self.staging):
+            target = os.path.join(self.folder, os.path.relpath(root, self.staging))
+            for name in files:
+                os.makedirs(target, exist_ok=True)
+                os.replace(os.path.join(root, name), os.path.join(target, name))
+                moved += 1
+        
+        self.discard()
+        logger.info(f"Archived upload {self.upload_id} as {moved} file(s).")
+        return moved
+    
+    def discard(self):
+        self._buffer = []
+        self._buffered_rows = 0
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+def _month_labels(dates):
+    """'YYYY-MM' of every date, formatting each distinct month once."""
+    codes, months = pd.factorize(dates.dt.year * 100 + dates.dt.month)
+    labels = np.array([f'{month // 100:04d}-{month % 100:02d}' for month in months], dtype=object)
+    return labels[codes]
+
+def archived_user_ids(folder):
+    """User ids with archived rows, from the partition directory names."""
+    if not os.path.isdir(folder):
+        return []
+    matches = (_USER_DIR_PATTERN.match(name) for name in os.listdir(folder))
+    return sorted(int(match.group(1)) for match in matches if match)
+
+def read_user_archive(folder, user_id, start=None, end=None):
+    """
+    The archived rows of one user between start and end (inclusive, either
+    may be None), in the parse_csv layout. A day uploaded more than once
+    keeps the most recently ingested row, as fitness_data does.
+    """
+    path = os.path.join(folder, f'user_id={user_id}')
+    columns = ['date'] + NUTRIENT_COLUMNS + ['ingested_at', 'upload_row']
+    if not os.path.isdir(path):
+        return _to_frame(user_id, pa.Table.from_pylist([], ARCHIVE_SCHEMA.remove(0)).select(columns))
+    
+    dataset = ds.dataset(path, schema=ARCHIVE_SCHEMA.remove(0), format='parquet', partitioning=_USER_PARTITIONING)
+    
+    # Month bounds prune whole partition directories; the date bounds trim
+    # the first and last month.
+    conditions = []
+    if start is not None:
+        conditions += [ds.field('month') >= start.strftime('%Y-%m'), ds.field('date') >= start]
+    if end is not None:
+        conditions += [ds.field('month') <= end.strftime('%Y-%m'), ds.field('date') <= end]
+    condition = None
+    for expression in conditions:
+        condition = expression if condition is None else condition & expression
+    
+    return _to_frame(user_id, dataset.to_table(columns=columns, filter=condition))
+
+def iter_archive(folder, user_ids=None, start=None, end=None):
+    """Yield (user_id, frame) for every archived user, or just the given ones."""
+    for user_id in (archived_user_ids(folder) if user_ids is None else sorted(user_ids)):
+        yield user_id, read_user_archive(folder, user_id, start, end)
+
+def _to_frame(user_id, table):
+    frame = table.to_pandas(types_mapper={pa.float32(): pd.Float32Dtype()}.get, date_as_object=False)
+    frame = (frame.sort_values(['ingested_at', 'upload_row'])
+             .drop_duplicates('date', keep='last')
+             .sort_values('date')
+             .reset_index(drop=True))
+    
+    frame.insert(0, 'user_id', pd.array([user_id] * len(frame), dtype='Int32'))
+    frame['date'] = frame['date'].astype('datetime64[ns]')
+    return frame[['user_id', 'date'] + NUTRIENT_COLUMNS]
@@ -0,0 +1,171 @@
+from collections import OrderedDict
+from flask import current_app
+import logging
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class QueryCache:
+    """
+    Size-bounded LRU cache whose entries also expire after ttl seconds.
+
+    Keys are tuples whose first element is the user_id the result belongs
+    to, so every cached result for a user can be dropped when their rows
+    change. A user with a load in progress also has a generation, bumped on
+    invalidation, so a result loaded while their rows changed is not cached.
+    Generations are dropped when the user's last load finishes, so they do
+    not accumulate for every user ever written.
+
+    Invalidation only reaches the process that wrote the rows. Entries can
+    therefore also carry a version of the user's data read from the
+    database, and a lookup with a different version misses, whichever
+    process made the write.
+    """
+
+    def __init__(self, max_entries, ttl, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        self._generations = {}
+        self._loading = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def get(self, key, version=None):
+        """
+        Return (True, value) for a fresh entry stored with this version,
+        otherwise (False, None).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            elif entry is not None and entry[2] != version:
+                self._remove(key)
+                self.stale += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, key, value, version=None):
+        with self._lock:
+            self._store(key, value, version)
+
+    def get_or_load(self, key, loader, version=None):
+        """
+        Return the cached value for key, calling loader() to fill a miss.
+        The loaded value is not cached if the user was invalidated meanwhile,
+        since it may predate their latest write. version must be read before
+        loader() runs, so a write committed in between makes it outdated
+        rather than the cached value.
+        """
+        found, value = self.get(key, version)
+        if found:
+            return value
+        
+        user_id = key[0]
+        with self._lock:
+            generation = self._generation(user_id)
+            self._loading[user_id] = self._loading.get(user_id, 0) + 1
+        try:
+            value = loader()
+            with self._lock:
+                if self._generation(user_id) == generation:
+                    self._store(key, value, version)
+        finally:
+            with self._lock:
+                self._loading[user_id] -= 1
+                if not self._loading[user_id]:
+                    del self._loading[user_id]
+                    self._generations.pop(user_id, None)
+        return value
+
+    def invalidate_users(self, user_ids):
+        """Drop every cached result for the given users."""
+        with self._lock:
+            for user_id in user_ids:
+                # Only a load already running can return rows older than this write.
+                if user_id in self._loading:
+                    self._generations[user_id] = self._generations.get(user_id, 0) + 1
+                for key in self._user_keys.pop(user_id, ()):
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    def _generation(self, user_id):
+        return self._epoch, self._generations.get(user_id, 0)
+
+    def _store(self, key, value, version=None):
+        if self.max_entries <= 0:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (self._clock() + self.ttl, value, version)
+        self._user_keys.setdefault(key[0], set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        del self._entries[key]
+        keys = self._user_keys[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._user_keys[key[0]]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'stale': self.stale
+            }
+
+_cache_lock = threading.Lock()
+
+def get_query_cache():
+    """The query cache of the current app, created on first use."""
+    cache = current_app.extensions.get('query_cache')
+    if cache is None:
+        with _cache_lock:
+            cache = current_app.extensions.get('query_cache')
+            if cache is None:
+                config = current_app.config
+                cache = QueryCache(config['QUERY_CACHE_SIZE'], config['QUERY_CACHE_TTL'])
+                current_app.extensions['query_cache'] = cache
+    return cache
@@ -0,0 +1,131 @@
+from contextlib import contextmanager
+import gzip
+import io
+import logging
+import os
+import zipfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Uploads are recognised by their first bytes rather than their name.
+MAGIC_NUMBERS = {
+    'gzip': b'\x1f\x8b',
+    'zstd': b'\x28\xb5\x2f\xfd',
+    'zip': b'PK\x03\x04'
+}
+
+# Decompressed data is read in blocks of this size.
+READ_SIZE = 1024 * 1024
+
+def detect_compression(file_path):
+    """'gzip', 'zstd', 'zip', or None for an uncompressed file."""
+    with open(file_path, 'rb') as f:
+        head = f.read(4)
+    for kind, magic in MAGIC_NUMBERS.items():
+        if head.startswith(magic):
+            return kind
+    return None
+
+class DecompressedSizeGuard:
+    """Counts the decompressed bytes of an upload and stops it at a limit."""
+    
+    def __init__(self, limit):
+        self.limit = limit
+        self.bytes = 0
+    
+    def add(self, size):
+        self.bytes += size
+        if self.limit and self.bytes > self.limit:
+            raise ValueError(f"The decompressed upload is larger than the {self.limit:,} byte limit.")
+
+class _GuardedReader(io.RawIOBase):
+    """Read-only stream that charges every byte it returns to a DecompressedSizeGuard."""
+    
+    def __init__(self, raw, guard):
+        super().__init__()
+        self._raw = raw
+        self._guard = guard
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        data = self._raw.read(len(buffer))
+        self._guard.add(len(data))
+        buffer[:len(data)] = data
+        return len(data)
+
+def iter_csv_streams(file_path, guard, source=None):
+    """
+    Yield (name, binary stream) for every CSV in an upload: the file itself,
+    its gzip or zstd content, or each .csv member of a zip, in archive order.
+    Streams decompress as they are read and are closed when the next one is
+    requested. All of them count towards the same guard.
+    
+    source, if given, is an open binary stream of file_path to read instead,
+    such as a resumable upload that is still arriving; its first bytes must
+    already be in file_path. A zip needs its central directory, so it is only
+    opened once source has been read to the end.
+    """
+    kind = detect_compression(file_path)
+    name = os.path.basename(file_path)
+    
+    if kind == 'zip':
+        if source is not None:
+            with source:
+                while source.read(READ_SIZE):
+                    pass
+        yield from _iter_zip_members(file_path, guard)
+        return
+    
+    with _open_stream(file_path, kind, source) as raw:
+        yield name, io.BufferedReader(_GuardedReader(raw, guard), READ_SIZE)
+
+@contextmanager
+def _open_stream(file_path, kind, source=None):
+    if kind == 'zstd' and zstandard is None:
+        raise ValueError("Zstandard-compressed uploads need the zstandard package, which is not installed.")
+    
+    with source or open(file_path, 'rb') as f:
+        if kind == 'gzip':
+            with gzip.GzipFile(fileobj=f) as raw:
+                yield raw
+        elif kind == 'zstd':
+            with zstandard.ZstdDecompressor().stream_reader(f, read_size=READ_SIZE) as raw:
+                yield raw
+        else:
+            yield f
+
+def _iter_zip_members(file_path, guard):
+    try:
+        archive = zipfile.ZipFile(file_path)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Invalid zip file: {str(e)}")
+    
+    with archive:
+        # Skip folders and the metadata files macOS adds to zips it creates.
+        members = [info for info in archive.infolist()
+                   if not info.is_dir() and info.filename.lower().endswith('.csv')
+                   and not info.filename.startswith('__MACOSX/')
+                   and not os.path.basename(info.filename).startswith('.')]
+        if not members:
+            raise ValueError("The zip file does not contain any CSV files.")
+        
+        # The sizes in the zip directory can be forged, so the guard still
+        # counts the bytes actually read; this only rejects honest oversize
+        # archives before any work is done.
+        declared = sum(info.file_size for info in members)
+        if guard.limit and declared > guard.limit:
+            raise ValueError(f"The decompressed upload is larger than the {guard.limit:,} byte limit.")
+        
+        logger.info(f"Reading {len(members)} CSV file(s) from zip upload.")
+        for info in members:
+            with archive.open(info) as raw:
+                yield info.filename, io.BufferedReader(_GuardedReader(raw, guard), READ_SIZE)
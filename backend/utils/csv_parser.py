@@ -4,104 +4,89 @@ import logging
 import json
 import re
 
+from backend.utils.metrics import observe_phase, CSV_NULL_RECORDS, CSV_JSON_FALLBACK_ROWS
+
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def parse_csv(file_path):
-   
+NUTRIENT_COLUMNS = ['calories', 'carbs', 'fat', 'protein', 'sodium', 'sugar']
+
+_NUTRIENT_NAMES = '|'.join(NUTRIENT_COLUMNS)
+_NUTRIENT_INDEX = {name: i for i, name in enumerate(NUTRIENT_COLUMNS)}
+
+# The three strategies used by extract_value, each compiled once and covering
+# all six nutrients so a single scan of the column finds every match.
+NAME_QUOTED_VALUE_PATTERN = re.compile(
+    f'"name"\\s*:\\s*"({_NUTRIENT_NAMES})"\\s*,\\s*"value"\\s*:\\s*"([^"]*)"', re.IGNORECASE)
+NAME_NUMERIC_VALUE_PATTERN = re.compile(
+    f'"name"\\s*:\\s*"({_NUTRIENT_NAMES})"\\s*,\\s*"value"\\s*:\\s*([0-9\\.]+)', re.IGNORECASE)
+FLAT_VALUE_PATTERN = re.compile(
+    f'"({_NUTRIENT_NAMES})"\\s*:\\s*([0-9\\.]+)', re.IGNORECASE)
+
+NUTRIENT_PATTERNS = [NAME_QUOTED_VALUE_PATTERN, NAME_NUMERIC_VALUE_PATTERN, FLAT_VALUE_PATTERN]
+
+_NON_NUMERIC_PATTERN = re.compile(r'[^\d\.]')
+
+def parse_csv(file_path, workers=1):
+    """Parse a whole export into one frame. See iter_csv_chunks for large files."""
+    chunks = list(iter_csv_chunks(file_path, workers=workers))
+    result_df = pd.concat(chunks, ignore_index=True)
+    
+    logger.info(f"Successfully parsed CSV with {len(result_df)} records.")
+    
+    return result_df
+
+def iter_csv_chunks(file_path, chunk_size=None, workers=1):
+    """
+    Parse an export (a path or a binary stream) in chunks of at most
+    chunk_size rows, yielding one user_id/date/nutrient frame per chunk.
+    With chunk_size=None the file is read in one go. The date format is detected once, from the first row.
+    With workers > 1 the nutrient extraction of each chunk is spread over
+    that many processes.
+    """
     try:
-       
-        df = pd.read_csv(file_path)
-        
-        if df.empty:
-            raise ValueError("The uploaded CSV file is empty.")
-        
-        
-        if len(df.columns) < 3:
-            raise ValueError("CSV does not have enough columns. Expected at least 3 columns.")
-        
-       
-        column_mapping = {}
-        for i, col in enumerate(df.columns):
-            if i == 0:
-                column_mapping[col] = 'user_id'
-            elif i == 1:
-                column_mapping[col] = 'date'
+        with observe_phase('read_csv'):
+            if chunk_size:
+                reader = pd.read_csv(file_path, chunksize=chunk_size)
             else:
-                column_mapping[col] = f'data_{i-1}'
+                reader = iter([pd.read_csv(file_path)])
         
-        df = df.rename(columns=column_mapping)
+        column_mapping = None
+        date_format = None
         
-        
-        try:
-           
-            date_sample = df['date'].iloc[0] if not df.empty else ""
+        while True:
+            with observe_phase('read_csv'):
+                df = next(reader, None)
+            if df is None:
+                break
             
-            if re.match(r'^\d{2}-\d{2}-\d{4}$', str(date_sample)):
-              
-                date_format = '%d-%m-%Y'
-            elif re.match(r'^\d{4}-\d{2}-\d{2}$', str(date_sample)):
-                
-                date_format = '%Y-%m-%d'
-            else:
-               
-                date_format = None
+            if column_mapping is None:
+                if df.empty:
+                    raise ValueError("The uploaded CSV file is empty.")
                 
-            if date_format:
-                df['date'] = pd.to_datetime(df['date'], format=date_format)
-            else:
-                df['date'] = pd.to_datetime(df['date'])
+                if len(df.columns) < 3:
+                    raise ValueError("CSV does not have enough columns. Expected at least 3 columns.")
                 
-        except Exception as e:
-            logger.warning(f"Date format conversion warning: {str(e)}")
-           
-            df['date'] = pd.to_datetime(df['date'], errors='coerce')
-            
-            if df['date'].isna().any():
-                raise ValueError("Could not parse date column. Please check the date format.")
-        
-       
-        processed_data = []
-        
-        for _, row in df.iterrows():
-            user_id = row['user_id']
-            date = row['date']
+                column_mapping = _column_mapping(df.columns)
+                date_format = _detect_date_format(df.iloc[0, 1])
             
-           
-            json_data = ""
-            for col in df.columns:
-                if col.startswith('data_'):
-                    if pd.notna(row[col]):
-                        json_data += str(row[col])
+            df = df.rename(columns=column_mapping)
+            with observe_phase('dates'):
+                df['date'] = _parse_dates(df['date'], date_format)
             
+            with observe_phase('extract'):
+                data_columns = [col for col in df.columns if col.startswith('data_')]
+                json_data = combine_data_columns(df, data_columns)
+                result_df = extract_nutrition_frame(json_data, df['user_id'], df['date'], workers)
             
-            try:
-               
-                json_data = json_data.replace("'", '"')
-                
-                nutrition_data = extract_nutrition_data(json_data, user_id, date)
-                processed_data.extend(nutrition_data)
-                
-            except Exception as e:
-                logger.warning(f"Error processing JSON for user {user_id} on {date}: {str(e)}")
-               
-                processed_data.append({
-                    'user_id': user_id,
-                    'date': date,
-                    'calories': None,
-                    'carbs': None,
-                    'fat': None,
-                    'protein': None,
-                    'sodium': None,
-                    'sugar': None
-                })
+            yield result_df
         
-        result_df = pd.DataFrame(processed_data)
-        
-        logger.info(f"Successfully parsed CSV with {len(result_df)} records.")
+        if column_mapping is None:
+            raise ValueError("The uploaded CSV file is empty.")
         
-        return result_df
+    except pd.errors.EmptyDataError:
+        raise ValueError("The uploaded CSV file is empty.")
         
     except pd.errors.ParserError as e:
         logger.error(f"Error parsing CSV: {str(e)}")
@@ -111,6 +96,171 @@ def parse_csv(file_path):
         logger.error(f"Unexpected error while parsing CSV: {str(e)}")
         raise ValueError(f"Error processing the CSV file: {str(e)}")
 
+def _column_mapping(columns):
+    """First column is the user id, second the date, the rest nutrition data."""
+    column_mapping = {}
+    for i, col in enumerate(columns):
+        if i == 0:
+            column_mapping[col] = 'user_id'
+        elif i == 1:
+            column_mapping[col] = 'date'
+        else:
+            column_mapping[col] = f'data_{i-1}'
+    return column_mapping
+
+def _detect_date_format(date_sample):
+    
+    if re.match(r'^\d{2}-\d{2}-\d{4}$', str(date_sample)):
+        return '%d-%m-%Y'
+    elif re.match(r'^\d{4}-\d{2}-\d{2}$', str(date_sample)):
+        return '%Y-%m-%d'
+    return None
+
+def _parse_dates(dates, date_format):
+    """Parsed dates; values that cannot be parsed become NaT and are rejected by validation."""
+    try:
+        if date_format:
+            return pd.to_datetime(dates, format=date_format)
+        return pd.to_datetime(dates)
+            
+    except Exception as e:
+        logger.warning(f"Date format conversion warning: {str(e)}")
+        
+        parsed = pd.to_datetime(dates, format=date_format, errors='coerce')
+        if date_format:
+            # Rows in another format than the first one are still accepted.
+            parsed = parsed.fillna(pd.to_datetime(dates.where(parsed.isna()), errors='coerce'))
+        return parsed
+
+def combine_data_columns(df, data_columns):
+    """Concatenate the data_* columns of every row into one JSON-like string."""
+    json_data = pd.Series('', index=df.index, dtype=object)
+    
+    for col in data_columns:
+        values = df[col]
+        json_data = json_data + values.where(values.isna(), values.astype(str)).fillna('')
+    
+    return json_data.str.replace("'", '"', regex=False)
+
+def extract_nutrition_frame(json_data, user_ids, dates, workers=1):
+    """
+    Column-wise equivalent of calling extract_nutrition_data on every row.
+    Returns a frame with an Int32 user_id, the date and one Float32 column
+    per nutrient.
+    With workers > 1, large inputs are split across a process pool; the
+    result is the same as the serial one.
+    """
+    json_data = json_data.reset_index(drop=True)
+    
+    if workers > 1:
+        from backend.utils.parallel_parse import extract_nutrient_values_parallel
+        values, fallback_rows = extract_nutrient_values_parallel(json_data, workers)
+    else:
+        values, fallback_rows = extract_nutrient_values(json_data)
+    
+    # Compact nullable columns: missing nutrients are masked rather than NaN
+    # and become NULL only when written to the database.
+    result_df = pd.DataFrame({
+        'user_id': _user_id_column(user_ids),
+        'date': dates.to_numpy()
+    })
+    for i, nutrient in enumerate(NUTRIENT_COLUMNS):
+        column = values[:, i]
+        result_df[nutrient] = pd.arrays.FloatingArray(column.astype(np.float32), np.isnan(column))
+    
+    CSV_JSON_FALLBACK_ROWS.inc(fallback_rows)
+    CSV_NULL_RECORDS.inc(int(np.isnan(values).all(axis=1).sum()))
+    
+    return result_df
+
+def _user_id_column(user_ids):
+    """
+    User ids as a nullable int32 array, matching the integer column in the
+    database. Ids that are not whole int32 numbers become NA and are
+    rejected by validation.
+    """
+    try:
+        return pd.array(user_ids.to_numpy(), dtype='Int32')
+    except (TypeError, ValueError, OverflowError):
+        numbers = pd.to_numeric(pd.Series(user_ids.to_numpy()), errors='coerce')
+        whole = (numbers % 1 == 0) & numbers.between(np.iinfo(np.int32).min, np.iinfo(np.int32).max)
+        return pd.array(numbers.where(whole).to_numpy(), dtype='Int32')
+
+def extract_nutrient_values(json_data):
+    """
+    Nutrient values of every row of json_data as a float array with one
+    column per NUTRIENT_COLUMNS entry, plus the number of rows that needed
+    the per-row JSON fallback.
+    """
+    json_data = json_data.reset_index(drop=True)
+    
+    # Later patterns only run on the rows that still have a nutrient missing,
+    # which keeps the expensive flat pattern off fully matched JSON rows.
+    raw_values = pd.DataFrame(np.nan, index=json_data.index, columns=NUTRIENT_COLUMNS, dtype=object)
+    for pattern in NUTRIENT_PATTERNS:
+        pending = raw_values.isna().any(axis=1).to_numpy()
+        if not pending.any():
+            break
+        matches = _first_matches(json_data[pending], pattern)
+        raw_values.loc[pending] = raw_values.loc[pending].where(raw_values.loc[pending].notna(), matches)
+    
+    values = np.column_stack([_to_float_column(raw_values[nutrient]) for nutrient in NUTRIENT_COLUMNS]) \
+        if len(json_data) else np.empty((0, len(NUTRIENT_COLUMNS)))
+    
+    # Rows where the regexes found neither calories nor carbs may still carry
+    # the meal/dishes JSON shape, which only the per-row parser understands.
+    needs_json = (np.isnan(values[:, _NUTRIENT_INDEX['calories']]) & np.isnan(values[:, _NUTRIENT_INDEX['carbs']]) &
+                  json_data.str.contains('meal', regex=False).to_numpy(dtype=bool))
+    fallback_rows = np.flatnonzero(needs_json)
+    for idx in fallback_rows:
+        record = extract_nutrition_data(json_data.iat[idx], None, None)[0]
+        for i, nutrient in enumerate(NUTRIENT_COLUMNS):
+            values[idx, i] = np.nan if record[nutrient] is None else record[nutrient]
+    
+    return values, len(fallback_rows)
+
+def _first_matches(json_data, pattern):
+    """Return the first raw match of each nutrient per row as a string frame."""
+    found = [pattern.findall(text) for text in json_data.tolist()]
+    counts = np.fromiter((len(matches) for matches in found), dtype=np.int64, count=len(found))
+    values = np.full((len(found), len(NUTRIENT_COLUMNS)), np.nan, dtype=object)
+    
+    if counts.any():
+        pairs = [pair for matches in found for pair in matches]
+        rows = np.repeat(np.arange(len(found)), counts)
+        nutrients = np.array([_NUTRIENT_INDEX[name.lower()] for name, _ in pairs])
+        matched = np.array([value for _, value in pairs], dtype=object)
+        
+        # np.unique reports the first occurrence of each (row, nutrient) key,
+        # matching re.findall(...)[0] in extract_value.
+        _, first = np.unique(rows * len(NUTRIENT_COLUMNS) + nutrients, return_index=True)
+        values[rows[first], nutrients[first]] = matched[first]
+    
+    return pd.DataFrame(values, index=json_data.index, columns=NUTRIENT_COLUMNS)
+
+def _to_float_column(values):
+    """Convert raw matched strings to floats, converting each distinct string once."""
+    result = np.full(len(values), np.nan)
+    present = values.notna().to_numpy()
+    
+    if present.any():
+        codes, uniques = pd.factorize(values[present])
+        converted = np.array([_to_float(value) for value in uniques], dtype=float)
+        result[present] = converted[codes]
+    
+    return result
+
+def _to_float(value):
+    """Same conversion rules as extract_value: strip junk characters, else None."""
+    try:
+        return float(value)
+    except ValueError:
+        cleaned = _NON_NUMERIC_PATTERN.sub('', value)
+        try:
+            return float(cleaned) if cleaned else None
+        except ValueError:
+            return None
+
 def extract_nutrition_data(json_str, user_id, date):
    
     try:
@@ -167,7 +317,9 @@ def extract_nutrition_data(json_str, user_id, date):
         return data
         
     except Exception as e:
-        logger.error(f"Error extracting nutrition data: {str(e)}")
+        # Rows left without nutrients are rejected by validation, which
+        # reports them once per upload rather than once per row.
+        logger.debug(f"Error extracting nutrition data: {str(e)}")
         return [{
             'user_id': user_id,
             'date': date,
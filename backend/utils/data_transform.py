@@ -1,5 +1,3 @@
-import pandas as pd
-import numpy as np
 import logging
 
 logging.basicConfig(level=logging.INFO, 
@@ -7,25 +5,22 @@ logging.basicConfig(level=logging.INFO,
 logger = logging.getLogger(__name__)
 
 def transform_data(df):
-   
-    transformed_df = df.copy()
-    
-    transformed_df = transformed_df.replace({np.nan: None})
+    """
+    Add the macro calorie and net calorie columns.
     
+    The input columns are shared rather than copied and keep their dtypes;
+    missing values stay NA until insert_fitness_data writes them as NULL.
+    """
+    transformed_df = df.copy(deep=False)
     
     columns_to_check = ['carbs', 'fat', 'protein']
     if all(col in transformed_df.columns for col in columns_to_check):
-        calc_df = transformed_df[columns_to_check].fillna(0)
-        
-        transformed_df['carbs_calories'] = calc_df['carbs'] * 4  
-        transformed_df['fat_calories'] = calc_df['fat'] * 9     
-        transformed_df['protein_calories'] = calc_df['protein'] * 4  
+        transformed_df['carbs_calories'] = transformed_df['carbs'].fillna(0) * 4
+        transformed_df['fat_calories'] = transformed_df['fat'].fillna(0) * 9
+        transformed_df['protein_calories'] = transformed_df['protein'].fillna(0) * 4
     if 'calories' in transformed_df.columns and 'exercise_calories' in transformed_df.columns:
-        if 'exercise_calories' not in transformed_df.columns:
-            transformed_df['exercise_calories'] = 0
-        
-        calc_df = transformed_df[['calories', 'exercise_calories']].fillna(0)
-        transformed_df['net_calories'] = calc_df['calories'] - calc_df['exercise_calories']
+        transformed_df['net_calories'] = (transformed_df['calories'].fillna(0) -
+                                          transformed_df['exercise_calories'].fillna(0))
     
     logger.info(f"Data transformed successfully with {len(transformed_df)} records and {len(transformed_df.columns)} fields.")
     
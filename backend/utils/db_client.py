@@ -1,11 +1,21 @@
-from sqlalchemy import create_engine, Column, Integer, Float, Date, String, MetaData, Table, inspect
+from sqlalchemy import create_engine, make_url, ARRAY, BigInteger, Column, DateTime, Integer, Float, Date, String, Table, Text, UniqueConstraint, event, func, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
 from flask import current_app
 import pandas as pd
+import psycopg2.extensions
+import io
+import os
 import logging
+import threading
+import time
 from datetime import datetime
 
+from backend.utils import schema
+from backend.utils.cache import get_query_cache
+from backend.utils.metrics import record_db_round_trip
+
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -15,9 +25,12 @@ Base = declarative_base()
 class FitnessData(Base):
   
     __tablename__ = 'fitness_data'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'date', name='uq_fitness_data_user_date'),
+    )
     
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)
     date = Column(Date, nullable=False, index=True)
     calories = Column(Float)
     carbs = Column(Float)
@@ -31,22 +44,291 @@ class FitnessData(Base):
     fat_calories = Column(Float)
     protein_calories = Column(Float)
     net_calories = Column(Float)
+    # Fingerprint of the stored values (see row_fingerprints), so re-uploaded
+    # rows that have not changed can be skipped before they are written.
+    row_hash = Column(BigInteger)
     created_at = Column(Date, default=datetime.utcnow)
 
+ROLLUP_MEASURES = ['calories', 'carbs', 'fat', 'protein', 'sodium', 'sugar']
+
+ROLLUP_MACRO_CALORIES = ['carbs_calories', 'fat_calories', 'protein_calories']
+
+# Per user and per week/month aggregates of fitness_data, kept up to date by
+# backend.utils.rollups so dashboards do not scan the base table.
+fitness_rollup = Table(
+    'fitness_data_rollup', Base.metadata,
+    Column('granularity', String(8), primary_key=True),
+    Column('user_id', Integer, primary_key=True),
+    Column('period_start', Date, primary_key=True),
+    Column('days', Integer, nullable=False),
+    *[Column(f'{aggregate}_{measure}', Float)
+      for measure in ROLLUP_MEASURES for aggregate in ('sum', 'avg', 'min', 'max')],
+    *[Column(f'count_{measure}', Integer) for measure in ROLLUP_MEASURES],
+    *[Column(f'sum_{measure}', Float) for measure in ROLLUP_MACRO_CALORIES]
+)
+
+USER_TOTAL_MEASURES = ROLLUP_MEASURES + ROLLUP_MACRO_CALORIES + ['exercise_calories', 'steps']
+
+# One row per user with their first and last day and running sums and
+# counts of every measure. insert_fitness_data adjusts it by the difference
+# between the rows it writes and the rows they replace, so listing users and
+# lifetime averages never scan fitness_data.
+users_table = Table(
+    'users', Base.metadata,
+    Column('user_id', Integer, primary_key=True, autoincrement=False),
+    Column('first_date', Date),
+    Column('last_date', Date),
+    Column('days', Integer, nullable=False, server_default='0'),
+    *[Column(f'sum_{measure}', Float, nullable=False, server_default='0') for measure in USER_TOTAL_MEASURES],
+    *[Column(f'count_{measure}', Integer, nullable=False, server_default='0') for measure in USER_TOTAL_MEASURES],
+    Column('updated_at', DateTime(timezone=True), nullable=False, server_default=func.now())
+)
+
+TREND_MACROS = ['carbs', 'fat', 'protein']
+
+# Per user and logged day, rolling trends over the days up to it, kept up to
+# date by backend.utils.trends for the dates each write can affect:
+# 7 and 30-day average calories, the change of the 7-day average against the
+# 7 days before, and each macro's share of macro calories over 7 days and its
+# drift from the 30-day share.
+fitness_trends = Table(
+    'fitness_trends', Base.metadata,
+    Column('user_id', Integer, primary_key=True),
+    Column('date', Date, primary_key=True),
+    Column('days_7d', Integer, nullable=False),
+    Column('calories_avg_7d', Float),
+    Column('calories_avg_30d', Float),
+    Column('calories_wow_change', Float),
+    *[Column(f'{macro}_share_7d', Float) for macro in TREND_MACROS],
+    *[Column(f'{macro}_share_drift', Float) for macro in TREND_MACROS]
+)
+
+# SHA-256 of every upload file whose rows are all still stored as it wrote
+# them, so uploading the same file again can be answered without parsing it.
+# A write that changes any row of those users removes the entry.
+uploaded_files = Table(
+    'uploaded_files', Base.metadata,
+    Column('sha256', String(64), primary_key=True),
+    Column('user_ids', ARRAY(Integer).with_variant(Text, 'sqlite'), nullable=False),
+    Column('rows', Integer, nullable=False),
+    Column('recorded_at', DateTime(timezone=True), nullable=False, server_default=func.now())
+)
+
+# Uploaded rows that failed validation (see backend.utils.validation), with
+# their position in the upload and the codes of every rule they broke.
+fitness_rejects = Table(
+    'fitness_data_rejects', Base.metadata,
+    Column('id', BigInteger().with_variant(Integer, 'sqlite'), primary_key=True),
+    Column('upload_id', String(32), nullable=False, index=True),
+    Column('row_number', Integer, nullable=False),
+    Column('user_id', Integer),
+    Column('date', Date),
+    Column('calories', Float),
+    Column('carbs', Float),
+    Column('fat', Float),
+    Column('protein', Float),
+    Column('sodium', Float),
+    Column('sugar', Float),
+    Column('reasons', ARRAY(String(32)).with_variant(Text, 'sqlite'), nullable=False),
+    Column('rejected_at', DateTime(timezone=True), nullable=False, server_default=func.now())
+)
+
+WRITE_MODES = ('bulk', 'orm')
+
+UPSERT_COLUMNS = [column.name for column in FitnessData.__table__.columns
+                  if column.name not in ('id', 'created_at')]
+
+FINGERPRINT_COLUMNS = [column for column in UPSERT_COLUMNS if column not in ('user_id', 'date', 'row_hash')]
+
+INTEGER_COLUMNS = [column.name for column in FitnessData.__table__.columns
+                   if isinstance(column.type, Integer) and column.name in UPSERT_COLUMNS]
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait to check out a connection."""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+    
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self._wait_lock:
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """psycopg2 cursor that counts every statement sent to the server."""
+    
+    def execute(self, query, vars=None):
+        record_db_round_trip('execute')
+        return super().execute(query, vars)
+    
+    def executemany(self, query, vars_list):
+        record_db_round_trip('executemany')
+        return super().executemany(query, vars_list)
+    
+    def copy_expert(self, sql, file, size=8192):
+        record_db_round_trip('copy')
+        return super().copy_expert(sql, file, size)
+
+# One engine (and its pool) per worker process and database URI. Keying on the
+# pid means a forked worker never reuses connections opened by its parent.
+_engines = {}
+_engines_lock = threading.Lock()
+
 def get_engine():
-   
-    return create_engine(current_app.config['SQLALCHEMY_DATABASE_URI'])
+    """
+    Return the process-wide pooled engine, creating it on first use. The
+    first call in each process also makes sure the schema is current (see
+    ensure_schema).
+    """
+    engine = _get_entry()[0]
+    ensure_schema(engine)
+    return engine
+
+def _get_entry():
+    """The (engine, sessionmaker) of this process and database, without the schema check."""
+    config = current_app.config
+    key = (os.getpid(), config['SQLALCHEMY_DATABASE_URI'])
+    
+    entry = _engines.get(key)
+    if entry is None:
+        with _engines_lock:
+            entry = _engines.get(key)
+            if entry is None:
+                # The counting cursor is psycopg2-specific; other databases
+                # (SQLite in the benchmarks) use their default cursor.
+                is_postgres = make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'postgresql'
+                engine = create_engine(
+                    config['SQLALCHEMY_DATABASE_URI'],
+                    poolclass=InstrumentedQueuePool,
+                    pool_size=config['DB_POOL_SIZE'],
+                    max_overflow=config['DB_MAX_OVERFLOW'],
+                    pool_timeout=config['DB_POOL_TIMEOUT'],
+                    pool_recycle=config['DB_POOL_RECYCLE'],
+                    pool_pre_ping=config['DB_POOL_PRE_PING'],
+                    connect_args={'cursor_factory': InstrumentedCursor} if is_postgres else {})
+                entry = (engine, sessionmaker(bind=engine))
+                _engines[key] = entry
+                logger.info(f"Created database engine for process {os.getpid()} "
+                            f"(pool_size={config['DB_POOL_SIZE']}, max_overflow={config['DB_MAX_OVERFLOW']}).")
+    
+    return entry
 
 def get_session():
- 
-    engine = get_engine()
-    Session = sessionmaker(bind=engine)
-    return Session()
+    """Open a session bound to the pooled engine."""
+    get_engine()
+    return _get_entry()[1]()
+
+def get_pool_stats():
+    """Connection pool usage of the current worker process."""
+    return _pool_stats(get_engine().pool)
+
+def all_pool_stats():
+    """(database, pool stats) for every engine this process has created."""
+    return [(engine.url.database, _pool_stats(engine.pool))
+            for (pid, _), (engine, _) in list(_engines.items()) if pid == os.getpid()]
+
+def _pool_stats(pool):
+    return {
+        'pid': os.getpid(),
+        'pool_size': pool.size(),
+        'max_overflow': pool._max_overflow,
+        'checked_out': pool.checkedout(),
+        'idle': pool.checkedin(),
+        'overflow': max(pool.overflow(), 0),
+        'checkouts': pool.checkouts,
+        'avg_wait_ms': round(pool.total_wait / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+        'max_wait_ms': round(pool.max_wait * 1000, 3)
+    }
+
+# Bump when init_db gains a step that existing databases need, so the next
+# deployment runs it once. The schema settings are part of the recorded
+# version, since changing them also changes what init_db does.
+SCHEMA_VERSION = 5
+
+# Key of the Postgres advisory lock that serializes migrations across workers.
+SCHEMA_LOCK_KEY = 7305112
+
+# First key of the two-key advisory locks (namespace, user_id) that serialize
+# per-user writes (see backend.utils.ingest); two-key locks never collide
+# with single-key ones such as SCHEMA_LOCK_KEY.
+USER_LOCK_NAMESPACE = 7305113
+
+_checked_engines = set()
+_schema_lock = threading.Lock()
+
+def schema_version(config):
+    """The version string recorded in schema_migrations for these settings."""
+    return (f"{SCHEMA_VERSION};covering_index={config['DB_COVERING_INDEX']};"
+            f"partitioning={config['DB_PARTITIONING']}")
+
+def ensure_schema(engine):
+    """
+    Once per process and engine, migrate unless schema_migrations already
+    records the current version. Skipped with DB_AUTO_MIGRATE=false, where
+    `flask migrate` has to be run on deploy, and for non-Postgres databases.
+    """
+    if engine in _checked_engines:
+        return
+    with _schema_lock:
+        if engine in _checked_engines:
+            return
+        if engine.dialect.name == 'postgresql' and current_app.config['DB_AUTO_MIGRATE']:
+            migrate()
+        _checked_engines.add(engine)
+
+def applied_schema_version(conn):
+    """The most recently applied schema version, or None on a fresh database."""
+    if conn.execute(text("SELECT to_regclass('schema_migrations')")).scalar() is None:
+        return None
+    return conn.execute(text(
+        "SELECT version FROM schema_migrations ORDER BY applied_at DESC LIMIT 1")).scalar()
+
+def migrate(force=False):
+    """
+    Run init_db and record the schema version, unless that version is
+    already applied (or force is set). Concurrent callers wait on an advisory
+    lock, so only the first worker of a deployment does the work.
+    Returns True when init_db ran.
+    """
+    engine = _get_entry()[0]
+    version = schema_version(current_app.config)
+    
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {'key': SCHEMA_LOCK_KEY})
+        try:
+            if not force and applied_schema_version(conn) == version:
+                logger.info(f"Schema version {version} is already applied.")
+                return False
+            
+            init_db()
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version text PRIMARY KEY,
+                    applied_at timestamptz NOT NULL DEFAULT clock_timestamp()
+                )"""))
+            conn.execute(text("""
+                INSERT INTO schema_migrations (version) VALUES (:version)
+                ON CONFLICT (version) DO UPDATE SET applied_at = clock_timestamp()"""), {'version': version})
+            logger.info(f"Applied schema version {version}.")
+            return True
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': SCHEMA_LOCK_KEY})
 
 def init_db():
     
     try:
-        engine = get_engine()
+        engine = _get_entry()[0]
+        config = current_app.config
         inspector = inspect(engine)
         
        
@@ -55,24 +337,115 @@ def init_db():
             
          
             if 'user_id' not in columns:
-                logger.warning("Existing table doesn't have user_id column. Recreating table...")
-                
-                metadata = MetaData()
-                metadata.reflect(bind=engine)
-                if 'fitness_data' in metadata.tables:
-                    fitness_table = metadata.tables['fitness_data']
-                    fitness_table.drop(engine)
-                    logger.info("Dropped existing fitness_data table.")
+                logger.warning("Existing table doesn't have user_id column. Archiving it and creating a new one...")
+                schema.archive_table(engine, 'fitness_data')
         
+        with engine.begin() as conn:
+            partitioned = schema.is_partitioned(conn, 'fitness_data')
+            if config['DB_PARTITIONING'] and 'fitness_data' not in inspect(conn).get_table_names():
+                schema.create_partitioned_table(conn, FitnessData.__table__, config['DB_COVERING_INDEX'])
+                partitioned = True
         
         Base.metadata.create_all(engine)
+        schema.add_missing_columns(engine, FitnessData.__table__)
+        schema.ensure_user_date_index(engine, 'fitness_data', config['DB_COVERING_INDEX'])
+        
+        if config['DB_PARTITIONING']:
+            if not partitioned:
+                schema.migrate_to_partitioned(engine, FitnessData.__table__, config['DB_COVERING_INDEX'])
+            schema.premake_partitions(engine, 'fitness_data', config['DB_PARTITION_PREMAKE_MONTHS'])
+        elif partitioned:
+            logger.info("fitness_data is partitioned; partitions will keep being created on demand.")
+        
+        ensure_rollups_populated(engine)
+        ensure_user_totals_populated(engine)
+        ensure_trends_populated(engine)
         logger.info("Database tables created successfully.")
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
         raise
 
-def insert_fitness_data(df):
-   
+def ensure_rollups_populated(engine):
+    """Backfill fitness_data_rollup when it is empty but fitness_data is not."""
+    from backend.utils.rollups import rebuild_rollups
+    
+    with engine.begin() as conn:
+        has_rollups = conn.execute(text("SELECT EXISTS (SELECT 1 FROM fitness_data_rollup)")).scalar()
+        has_data = conn.execute(text("SELECT EXISTS (SELECT 1 FROM fitness_data)")).scalar()
+        
+        if has_data and not has_rollups:
+            logger.info("Backfilling fitness_data_rollup from existing data...")
+            rebuild_rollups(conn)
+
+def ensure_trends_populated(engine):
+    """Backfill fitness_trends when it is empty but fitness_data is not."""
+    from backend.utils.trends import rebuild_trends
+    
+    with engine.begin() as conn:
+        has_trends = conn.execute(text("SELECT EXISTS (SELECT 1 FROM fitness_trends)")).scalar()
+        has_data = conn.execute(text("SELECT EXISTS (SELECT 1 FROM fitness_data)")).scalar()
+        
+        if has_data and not has_trends:
+            logger.info("Backfilling fitness_trends from existing data...")
+            rebuild_trends(conn)
+
+_USER_TOTALS_AGGREGATES = ', '.join(
+    ['min(date)', 'max(date)', 'count(*)'] +
+    [f"COALESCE(sum({m}), 0)" for m in USER_TOTAL_MEASURES] +
+    [f"count({m})" for m in USER_TOTAL_MEASURES]
+)
+
+_USER_TOTALS_COLUMNS = ', '.join(
+    ['first_date', 'last_date', 'days'] +
+    [f'sum_{m}' for m in USER_TOTAL_MEASURES] + [f'count_{m}' for m in USER_TOTAL_MEASURES]
+)
+
+def ensure_user_totals_populated(engine):
+    """Backfill the users table when it is empty but fitness_data is not."""
+    with engine.begin() as conn:
+        has_users = conn.execute(text("SELECT EXISTS (SELECT 1 FROM users)")).scalar()
+        has_data = conn.execute(text("SELECT EXISTS (SELECT 1 FROM fitness_data)")).scalar()
+        
+        if has_data and not has_users:
+            logger.info("Backfilling users from existing data...")
+            rebuild_user_totals(conn)
+
+def rebuild_user_totals(conn):
+    """Recompute every user's totals from fitness_data."""
+    conn.execute(text("DELETE FROM users"))
+    conn.execute(text(f"""
+        INSERT INTO users (user_id, {_USER_TOTALS_COLUMNS})
+        SELECT user_id, {_USER_TOTALS_AGGREGATES} FROM fitness_data GROUP BY user_id
+    """))
+    logger.info("Rebuilt user totals.")
+
+_partitioned_tables = {}
+
+def _is_partitioned(engine):
+    """Whether fitness_data is partitioned, looked up once per engine."""
+    if engine.dialect.name != 'postgresql':
+        return False
+    if engine not in _partitioned_tables:
+        with engine.connect() as conn:
+            _partitioned_tables[engine] = schema.is_partitioned(conn, 'fitness_data')
+    return _partitioned_tables[engine]
+
+def insert_fitness_data(df, mode=None, session=None):
+    """
+    Upsert rows into fitness_data, last write wins per (user_id, date).
+    
+    mode is 'bulk' (COPY into a staging table, then one INSERT ... ON CONFLICT)
+    or 'orm' (row-by-row lookups); it defaults to the DB_WRITE_MODE setting.
+    Rows are stored with their row_hash fingerprint, computed here unless
+    df already has one.
+    When a session is passed the caller owns the transaction; otherwise the
+    rows are committed before returning.
+    Returns a dict with the number of rows inserted and updated.
+    """
+    mode = mode or current_app.config.get('DB_WRITE_MODE', 'bulk')
+    if mode not in WRITE_MODES:
+        raise ValueError(f"Unknown write mode '{mode}'. Expected one of: {', '.join(WRITE_MODES)}")
+    
     try:
        
         if df['date'].dtype != 'datetime64[ns]':
@@ -81,38 +454,231 @@ def insert_fitness_data(df):
             df['date'] = df['date'].dt.date
         
         
-        session = get_session()
+        if 'row_hash' not in df.columns:
+            df['row_hash'] = row_fingerprints(df)
+        
+        if _is_partitioned(get_engine()):
+            schema.ensure_partitions(get_engine(), 'fitness_data', df['date'].unique())
         
-        records_inserted = 0
+        owns_session = session is None
+        if owns_session:
+            session = get_session()
         
         try:
-            for _, row in df.iterrows():
-                existing = session.query(FitnessData).filter_by(
-                    user_id=row['user_id'],
-                    date=row['date']
-                ).first()
-                
-                if existing:
-                    for column, value in row.items():
-                        if column not in ['user_id', 'date'] and hasattr(existing, column):
-                            setattr(existing, column, value)
-                else:
-                    data_dict = row.to_dict()
-                    new_record = FitnessData(**data_dict)
-                    session.add(new_record)
-                
-                records_inserted += 1
+            _lock_users(session, df['user_id'])
+            if mode == 'bulk':
+                counts = _bulk_upsert(session, df)
+            else:
+                counts = _orm_upsert(session, df)
+            _track_written_users(session, df['user_id'])
+            if counts['inserted'] or counts['updated']:
+                _forget_uploaded_files(session, df['user_id'])
             
-            session.commit()
-            logger.info(f"Successfully inserted/updated {records_inserted} records.")
-            return records_inserted
+            if owns_session:
+                session.commit()
+                logger.info(f"Successfully inserted {counts['inserted']} and updated {counts['updated']} records.")
+            return counts
             
         except Exception as e:
-            session.rollback()
+            if owns_session:
+                session.rollback()
             raise e
         finally:
-            session.close()
+            if owns_session:
+                session.close()
             
     except Exception as e:
         logger.error(f"Error inserting data into PostgreSQL: {str(e)}")
-        raise ValueError(f"Database error: {str(e)}") 
\ No newline at end of file
+        raise ValueError(f"Database error: {str(e)}") from e
+
+def row_fingerprints(df):
+    """
+    64-bit fingerprint of each row's stored values (every upserted column but
+    user_id and date) as int64, to fit a bigint column. Columns the frame
+    lacks count as NULL and every value is hashed as float64, so the result
+    does not depend on column order or on the compact dtypes.
+    """
+    values = df.reindex(columns=FINGERPRINT_COLUMNS).astype('float64')
+    return pd.Series(pd.util.hash_pandas_object(values, index=False).to_numpy().view('int64'), index=df.index)
+
+def _forget_uploaded_files(session, user_ids):
+    """Drop the file hashes of these users' earlier uploads, whose rows were just overwritten."""
+    if session.get_bind().dialect.name != 'postgresql':
+        return
+    session.execute(text("DELETE FROM uploaded_files WHERE user_ids && CAST(:user_ids AS integer[])"),
+                    {'user_ids': sorted(int(u) for u in user_ids.dropna().unique())})
+
+def _lock_users(session, user_ids):
+    """
+    Create the users rows of these users if needed and lock them, in user_id
+    order, until the transaction ends. Writers of the same user thus read the
+    rows they replace only after the previous writer committed, which keeps
+    the running totals exact.
+    """
+    if session.get_bind().dialect.name != 'postgresql':
+        return
+    session.execute(text("""
+        INSERT INTO users (user_id) SELECT unnest(CAST(:user_ids AS integer[])) ORDER BY 1
+        ON CONFLICT (user_id) DO UPDATE SET updated_at = now()
+    """), {'user_ids': sorted(int(u) for u in user_ids.dropna().unique())})
+
+def _add_user_totals(session, deltas):
+    """Add per-user changes ({user_id: {'first_date', 'last_date', 'days', 'sum_*', 'count_*'}}) to users."""
+    if not deltas or session.get_bind().dialect.name != 'postgresql':
+        return
+    session.execute(text(f"""
+        UPDATE users SET
+            first_date = LEAST(first_date, :first_date), last_date = GREATEST(last_date, :last_date),
+            {', '.join(f'{c} = {c} + :{c}' for c in ['days'] + [f'{a}_{m}' for a in ('sum', 'count') for m in USER_TOTAL_MEASURES])},
+            updated_at = now()
+        WHERE user_id = :user_id
+    """), [{'user_id': user_id, **delta} for user_id, delta in sorted(deltas.items())])
+
+def _track_written_users(session, user_ids):
+    """Remember whose rows the session wrote, so their cached reads are dropped on commit."""
+    session.info.setdefault('written_users', set()).update(int(u) for u in user_ids.dropna().unique())
+    session.info['query_cache'] = get_query_cache()
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_written_users(session):
+    users = session.info.pop('written_users', None)
+    cache = session.info.pop('query_cache', None)
+    if users and cache is not None:
+        cache.invalidate_users(users)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_written_users(session):
+    session.info.pop('written_users', None)
+    session.info.pop('query_cache', None)
+
+def _db_records(df):
+    """
+    Rows of df as dicts of plain Python values, with None for missing ones.
+    float32 values are converted through their shortest decimal form, as in
+    the COPY path, so 12.3 is stored as 12.3 rather than 12.300000190734863.
+    """
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if values.dtype in ('float32', 'Float32'):
+            values = values.astype('string').astype('Float64')
+        columns[column] = values.astype(object).where(values.notna(), None).tolist()
+    
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+def _orm_upsert(session, df):
+    
+    counts = {'inserted': 0, 'updated': 0}
+    deltas = {}
+    
+    for row in _db_records(df):
+        existing = session.query(FitnessData).filter_by(
+            user_id=row['user_id'],
+            date=row['date']
+        ).first()
+        
+        if existing:
+            old = {measure: getattr(existing, measure) for measure in USER_TOTAL_MEASURES}
+            for column, value in row.items():
+                if column not in ['user_id', 'date'] and hasattr(existing, column):
+                    setattr(existing, column, value)
+            record = existing
+            counts['updated'] += 1
+        else:
+            old = None
+            record = FitnessData(**row)
+            session.add(record)
+            counts['inserted'] += 1
+        
+        _count_user_change(deltas, row, old, {measure: getattr(record, measure) for measure in USER_TOTAL_MEASURES})
+    
+    _add_user_totals(session, deltas)
+    return counts
+
+def _count_user_change(deltas, row, old, new):
+    """Fold one written row, and the values it replaced (None for a new day), into its user's totals change."""
+    delta = deltas.get(row['user_id'])
+    if delta is None:
+        delta = {'first_date': row['date'], 'last_date': row['date'], 'days': 0,
+                 **{f'{aggregate}_{measure}': 0 for aggregate in ('sum', 'count') for measure in USER_TOTAL_MEASURES}}
+        deltas[row['user_id']] = delta
+    
+    delta['first_date'] = min(delta['first_date'], row['date'])
+    delta['last_date'] = max(delta['last_date'], row['date'])
+    if old is None:
+        delta['days'] += 1
+    for values, sign in ((new, 1), (old or {}, -1)):
+        for measure, value in values.items():
+            if value is not None:
+                delta[f'sum_{measure}'] += sign * value
+                delta[f'count_{measure}'] += sign
+
+def _bulk_upsert(session, df):
+    """
+    Stage the frame with COPY FROM STDIN and merge it in a single statement.
+    Rows repeated within the frame are reduced to the last one first, since
+    ON CONFLICT cannot touch the same row twice in one command. Updates are
+    counted as staged keys already present (all CTEs share one snapshot),
+    because xmax cannot be read through a partitioned table. The same join
+    gives the values each row replaces, so the users totals are adjusted by
+    the difference in that statement too.
+    """
+    columns = [column for column in UPSERT_COLUMNS if column in df.columns]
+    staged = df[columns].drop_duplicates(['user_id', 'date'], keep='last')
+    
+    if staged.empty:
+        return {'inserted': 0, 'updated': 0}
+    
+    staged = staged.astype({column: 'Int64' for column in columns if column in INTEGER_COLUMNS})
+    
+    buffer = io.StringIO()
+    staged.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    
+    column_list = ', '.join(columns)
+    update_list = ', '.join(f"{column} = EXCLUDED.{column}"
+                            for column in columns if column not in ('user_id', 'date'))
+    
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS fitness_data_stage ON COMMIT DROP AS
+            SELECT {', '.join(UPSERT_COLUMNS)} FROM fitness_data WITH NO DATA
+        """)
+        cursor.execute("TRUNCATE fitness_data_stage")
+        cursor.copy_expert(f"COPY fitness_data_stage ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+        
+        # Columns the frame lacks keep their stored values.
+        new_values = ', '.join(f"{'s' if measure in columns else 'f'}.{measure} AS new_{measure}"
+                               for measure in USER_TOTAL_MEASURES)
+        cursor.execute(f"""
+            WITH changes AS (
+                SELECT s.user_id, s.date, f.user_id IS NOT NULL AS existed,
+                       {', '.join(f'f.{measure} AS old_{measure}' for measure in USER_TOTAL_MEASURES)}, {new_values}
+                FROM fitness_data_stage s LEFT JOIN fitness_data f USING (user_id, date)
+            ), deltas AS (
+                SELECT user_id, min(date) AS first_date, max(date) AS last_date,
+                       count(*) FILTER (WHERE NOT existed) AS days,
+                       {', '.join(f'COALESCE(sum(new_{m}), 0) - COALESCE(sum(old_{m}), 0) AS sum_{m}, '
+                                  f'count(new_{m}) - count(old_{m}) AS count_{m}' for m in USER_TOTAL_MEASURES)}
+                FROM changes GROUP BY user_id
+            ), upserted AS (
+                INSERT INTO fitness_data ({column_list}, created_at)
+                SELECT {column_list}, (now() AT TIME ZONE 'utc')::date FROM fitness_data_stage
+                ON CONFLICT (user_id, date) DO UPDATE SET {update_list or 'date = EXCLUDED.date'}
+                RETURNING 1
+            ), totals AS (
+                UPDATE users u SET
+                    first_date = LEAST(u.first_date, d.first_date), last_date = GREATEST(u.last_date, d.last_date),
+                    {', '.join(f'{c} = u.{c} + d.{c}' for c in ['days'] + [f'{a}_{m}' for a in ('sum', 'count') for m in USER_TOTAL_MEASURES])},
+                    updated_at = now()
+                FROM deltas d WHERE u.user_id = d.user_id
+            )
+            SELECT (SELECT count(*) FROM upserted), (SELECT count(*) FROM changes WHERE existed)
+        """)
+        total, updated = cursor.fetchone()
+        inserted = total - updated
+    finally:
+        cursor.close()
+    
+    return {'inserted': inserted, 'updated': updated}
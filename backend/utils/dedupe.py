@@ -0,0 +1,84 @@
+from sqlalchemy import bindparam, text
+import hashlib
+import logging
+
+import pandas as pd
+
+from backend.utils.db_client import SCHEMA_VERSION, row_fingerprints
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Bump when parsing, validation or transform_data change what a file's rows
+# become. Identical files are only skipped when recorded under the same
+# PROCESSING_VERSION and SCHEMA_VERSION, so a re-upload after such a change
+# is processed again.
+PROCESSING_VERSION = 1
+
+# Stored fingerprints of a chunk's users over its date range. One
+# (user_id, date) index range scan per user, rather than a lookup per row.
+_STORED_HASHES_SQL = text("""
+    SELECT user_id, date, row_hash FROM fitness_data
+    WHERE user_id IN :user_ids AND date BETWEEN :first AND :last
+""").bindparams(bindparam('user_ids', expanding=True))
+
+def file_sha256(file_path):
+    """Hex SHA-256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def split_unchanged(session, df):
+    """
+    Fingerprint df's rows into a row_hash column, keep the last row per
+    (user_id, date), and drop the rows already stored with the same
+    fingerprint. Returns (rows to write, number of unchanged rows).
+    """
+    df = df.drop_duplicates(['user_id', 'date'], keep='last').copy(deep=False)
+    df['row_hash'] = row_fingerprints(df)
+    if df.empty:
+        return df, 0
+
+    dates = pd.to_datetime(df['date'])
+    stored = pd.DataFrame(session.execute(_STORED_HASHES_SQL, {
+        'user_ids': sorted(int(user_id) for user_id in df['user_id'].unique()),
+        'first': dates.min().date(),
+        'last': dates.max().date()
+    }).fetchall(), columns=['user_id', 'date', 'row_hash'])
+    if stored.empty:
+        return df, 0
+
+    # Rows stored before fingerprints existed have no row_hash and never match.
+    hashes = pd.Series(stored['row_hash'].to_numpy(dtype=object), index=pd.MultiIndex.from_arrays(
+        [stored['user_id'].astype('int64'), pd.to_datetime(stored['date'])]))
+    current = hashes.reindex(pd.MultiIndex.from_arrays([df['user_id'].astype('int64'), dates]))
+    unchanged = current.to_numpy() == df['row_hash'].to_numpy(dtype=object)
+
+    return df[~unchanged], int(unchanged.sum())
+
+def find_uploaded_file(session, sha256):
+    """The users and row count recorded for an identical earlier upload, or None."""
+    if session.get_bind().dialect.name != 'postgresql':
+        return None
+
+    row = session.execute(text("SELECT user_ids, rows FROM uploaded_files WHERE sha256 = :sha256"),
+                          {'sha256': _uploaded_file_key(sha256)}).first()
+    return {'user_ids': list(row.user_ids), 'rows': row.rows} if row else None
+
+def record_uploaded_file(session, sha256, user_ids, rows):
+    """Remember that the file with this hash is now fully stored, in the caller's transaction."""
+    if session.get_bind().dialect.name != 'postgresql':
+        return
+
+    session.execute(text("""
+        INSERT INTO uploaded_files (sha256, user_ids, rows) VALUES (:sha256, CAST(:user_ids AS integer[]), :rows)
+        ON CONFLICT (sha256) DO UPDATE SET
+            user_ids = EXCLUDED.user_ids, rows = EXCLUDED.rows, recorded_at = now()
+    """), {'sha256': _uploaded_file_key(sha256), 'user_ids': sorted(int(user_id) for user_id in user_ids), 'rows': rows})
+
+def _uploaded_file_key(sha256):
+    """The uploaded_files key of a file: its SHA-256 combined with the processing and schema versions."""
+    return hashlib.sha256(f'{SCHEMA_VERSION}.{PROCESSING_VERSION}:{sha256}'.encode()).hexdigest()
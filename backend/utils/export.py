@@ -0,0 +1,144 @@
+from sqlalchemy import Date, Integer, text
+import csv
+import datetime
+import io
+import json
+import logging
+import zlib
+
+from backend.utils.db_client import FitnessData, get_engine
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+EXPORT_COLUMNS = [column.name for column in FitnessData.__table__.columns if column.name not in ('id', 'row_hash')]
+
+# Ordered by the (user_id, date) unique index, so rows stream without a sort
+# when a user is given. Open-ended filters are passed as NULL.
+_EXPORT_SQL = f"""
+    SELECT {', '.join(EXPORT_COLUMNS)}
+    FROM fitness_data
+    WHERE (CAST(:user_id AS integer) IS NULL OR user_id = :user_id)
+      AND (CAST(:start AS date) IS NULL OR date >= :start)
+      AND (CAST(:end AS date) IS NULL OR date <= :end)
+    ORDER BY user_id, date
+"""
+
+def export_chunks(export_format, user_id=None, start=None, end=None, batch_size=10000):
+    """
+    Encoded export of the matching fitness_data rows as an iterator of byte
+    chunks, one per batch_size rows. Arguments are checked right away; the
+    query only runs once the iterator is consumed.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}'. Expected one of: {', '.join(EXPORT_FORMATS)}")
+    if export_format == 'parquet' and _pyarrow() is None:
+        raise ValueError("Parquet export needs the pyarrow package, which is not installed.")
+    
+    encoders = {'csv': _csv_chunks, 'ndjson': _ndjson_chunks, 'parquet': _parquet_chunks}
+    return encoders[export_format](iter_export_batches(user_id, start, end, batch_size))
+
+def iter_export_batches(user_id=None, start=None, end=None, batch_size=10000):
+    """
+    Rows of fitness_data as lists of at most batch_size tuples, fetched
+    through a server-side cursor, so only one batch is held in memory.
+    """
+    params = {'user_id': user_id, 'start': start, 'end': end}
+    rows = 0
+    with get_engine().connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(text(_EXPORT_SQL), params)
+        for batch in result.partitions(batch_size):
+            rows += len(batch)
+            yield batch
+    logger.info(f"Exported {rows} rows (user_id={user_id}, from={start}, to={end}).")
+
+def gzip_chunks(chunks):
+    """Compress a stream of byte chunks into one gzip member as it goes."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_COLUMNS)
+    
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def _ndjson_chunks(batches):
+    for batch in batches:
+        lines = [json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=_json_value) for row in batch]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+def _json_value(value):
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+def _parquet_chunks(batches):
+    """One Parquet row group per batch; the footer is sent with the last chunk."""
+    pa = _pyarrow()
+    
+    def arrow_type(column):
+        if isinstance(column.type, Integer):
+            return pa.int32()
+        if isinstance(column.type, Date):
+            return pa.date32()
+        return pa.float64()
+    
+    schema = pa.schema([(column.name, arrow_type(column))
+                        for column in FitnessData.__table__.columns if column.name in EXPORT_COLUMNS])
+    sink = _ChunkSink()
+    
+    with pa.parquet.ParquetWriter(sink, schema, compression='snappy') as writer:
+        for batch in batches:
+            columns = list(zip(*batch))
+            writer.write_table(pa.table([pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                                        schema=schema))
+            yield sink.take()
+    
+    yield sink.take()
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only stream that hands out what was written since the last take()."""
+    
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+    
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
@@ -0,0 +1,136 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, g
+from sqlalchemy import text
+import logging
+import random
+import threading
+import time
+
+from backend.utils.db_client import USER_LOCK_NAMESPACE, get_session, insert_fitness_data
+from backend.utils.rollups import touched_buckets, refresh_rollups
+from backend.utils.trends import touched_spans, refresh_trends
+from backend.utils import metrics
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+UPLOAD_TRANSACTIONS = ('file', 'user')
+
+# SQLSTATEs worth retrying: serialization_failure and deadlock_detected.
+RETRYABLE_SQLSTATES = ('40001', '40P01')
+
+# One writer pool per process and size, shared by every upload, so concurrent
+# uploads together hold at most INGEST_WORKERS connections for their writes.
+_executors = {}
+_executors_lock = threading.Lock()
+
+def get_executor(workers):
+    with _executors_lock:
+        executor = _executors.get(workers)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest')
+            _executors[workers] = executor
+            logger.info(f"Started ingest pool with {workers} writer thread(s).")
+        return executor
+
+def insert_by_user(df, mode=None, workers=None, max_retries=None):
+    """
+    Upsert df one user at a time, each user's rows and rollup buckets in
+    their own short transaction, on up to `workers` threads.
+
+    Every transaction first takes a transaction-scoped advisory lock on its
+    user, so writers of the same user queue up across threads and worker
+    processes while different users proceed in parallel. A transaction only
+    ever holds one user's lock and touches one user's rows, so writers cannot
+    deadlock on each other. Each call starts at a random user, so concurrent
+    uploads of the same users spread out instead of queueing in step. Serialization failures and deadlocks raised
+    anyway (e.g. against a concurrent whole-file upload) are retried up to
+    max_retries times with jittered backoff.
+
+    Users are committed independently: if one fails, the users already
+    written stay written and a ValueError says how many there were.
+    Returns a dict with the number of rows inserted and updated.
+    """
+    config = current_app.config
+    workers = max(1, workers or config['INGEST_WORKERS'])
+    max_retries = config['INGEST_MAX_RETRIES'] if max_retries is None else max_retries
+
+    slices = [(int(user_id), rows) for user_id, rows in df.groupby('user_id', sort=True)]
+    counts = {'inserted': 0, 'updated': 0}
+    if not slices:
+        return counts
+
+    start = random.randrange(len(slices))
+    slices = slices[start:] + slices[:start]
+
+    # Bucketing once per chunk is much cheaper than once per user.
+    buckets = {user_id: {} for user_id, _ in slices}
+    for granularity, keys in touched_buckets(df).items():
+        for key in keys:
+            buckets[key[0]].setdefault(granularity, set()).add(key)
+    spans = touched_spans(df)
+
+    app = current_app._get_current_object()
+    endpoint = metrics.current_endpoint()
+
+    def write(user_id, rows):
+        with app.app_context():
+            g.metrics_endpoint = endpoint
+            result = _write_user(user_id, rows, buckets[user_id], spans[user_id], mode, max_retries)
+            return result, metrics.db_round_trips()
+
+    written, failures = 0, []
+    pool = get_executor(workers)
+    futures = [pool.submit(write, user_id, rows) for user_id, rows in slices]
+    for (user_id, _), future in zip(slices, futures):
+        try:
+            result, round_trips = future.result()
+        except Exception as e:
+            failures.append((user_id, e))
+            continue
+        written += 1
+        counts['inserted'] += result['inserted']
+        counts['updated'] += result['updated']
+        metrics.add_db_round_trips(round_trips)
+
+    if failures:
+        user_id, error = failures[0]
+        raise ValueError(f"Writing user {user_id} failed ({len(failures)} of {len(slices)} users failed, "
+                         f"{written} were written): {str(error)}")
+
+    logger.info(f"Inserted {counts['inserted']} and updated {counts['updated']} records "
+                f"for {len(slices)} user(s) in per-user transactions.")
+    return counts
+
+def _write_user(user_id, rows, buckets, span, mode, max_retries):
+    """Write one user's rows, rollups and trends in one transaction, retrying transient conflicts."""
+    for attempt in range(max_retries + 1):
+        session = get_session()
+        try:
+            if session.get_bind().dialect.name == 'postgresql':
+                session.execute(text("SELECT pg_advisory_xact_lock(:namespace, :user_id)"),
+                                {'namespace': USER_LOCK_NAMESPACE, 'user_id': user_id})
+            counts = insert_fitness_data(rows.copy(), mode=mode, session=session)
+            refresh_rollups(session, buckets)
+            refresh_trends(session, {user_id: span})
+            session.commit()
+            return counts
+        except Exception as e:
+            session.rollback()
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = min(0.05 * 2 ** attempt, 2.0) * random.uniform(0.5, 1.5)
+            logger.warning(f"Retrying user {user_id} in {delay:.2f}s after a transient conflict "
+                           f"(attempt {attempt + 1} of {max_retries}): {str(e)}")
+            time.sleep(delay)
+        finally:
+            session.close()
+
+def is_retryable(error):
+    """Whether error, or an exception it was raised from, is a serialization failure or deadlock."""
+    while error is not None:
+        if getattr(getattr(error, 'orig', error), 'pgcode', None) in RETRYABLE_SQLSTATES:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
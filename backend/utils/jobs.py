@@ -0,0 +1,268 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+import uuid
+
+logging.basicConfig(level=logging.INFO, 
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+INTERRUPTED_ERROR = "The server stopped before the upload finished. Please upload the file again."
+
+class QueueFullError(Exception):
+    """Raised when every worker is busy and the pending queue is full."""
+
+class UploadJob:
+    """Progress of one background upload, readable while it is running."""
+    
+    def __init__(self, filename, on_abandon=None):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.on_abandon = on_abandon
+        self.state = 'queued'
+        self.phase = 'queued'
+        self.rows_processed = 0
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.result = None
+    
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        
+        return {
+            'job_id': self.id,
+            'filename': self.filename,
+            'state': self.state,
+            'phase': self.phase,
+            'rows_processed': self.rows_processed,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.rows_processed / elapsed, 1) if elapsed else 0.0,
+            'error': self.error,
+            'result': self.result
+        }
+
+class JobManager:
+    """
+    Runs uploads on a bounded thread pool. At most max_workers jobs run at
+    once and at most max_pending more wait for a worker; beyond that submit
+    raises QueueFullError so the route can answer 429.
+    
+    Job status is also written to status_folder so that any worker process
+    sharing the folder can answer a status request.
+    """
+    
+    def __init__(self, max_workers, max_pending, status_folder, history_size=1000):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-job')
+        self.slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self.status_folder = status_folder
+        self.history_size = history_size
+        self.jobs = {}
+        self.lock = threading.Lock()
+        os.makedirs(status_folder, exist_ok=True)
+    
+    def submit(self, app, filename, func, *args, on_abandon=None):
+        """
+        Queue func(job, *args) to run inside an app context; returns the job.
+        on_abandon(), if given, is called instead when the server stops before
+        the job started, e.g. to remove the job's input file.
+        """
+        if not self.slots.acquire(blocking=False):
+            raise QueueFullError("Too many uploads in progress. Please retry shortly.")
+        
+        job = UploadJob(filename, on_abandon)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._prune()
+        self._persist(job)
+        
+        try:
+            self.executor.submit(self._run, app, job, func, args)
+        except Exception:
+            self.slots.release()
+            raise
+        
+        return job
+    
+    def get(self, job_id):
+        """Status dict of a job, or None if this host has never seen it."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        
+        try:
+            with open(self._status_path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def update(self, job, phase, rows_processed):
+        job.phase = phase
+        job.rows_processed = rows_processed
+        self._persist(job)
+    
+    def stop(self):
+        """Take no more jobs and fail the queued ones; running jobs carry on."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            # Marked under the lock so a worker picking one up now skips it.
+            queued = [job for job in self.jobs.values() if job.state == 'queued']
+            for job in queued:
+                job.state = 'failed'
+        for job in queued:
+            self._abandon(job)
+            if job.on_abandon is not None:
+                try:
+                    job.on_abandon()
+                except Exception as e:
+                    logger.warning(f"Could not clean up upload job {job.id}: {str(e)}")
+    
+    def wait(self, timeout, heartbeat=None):
+        """
+        Wait up to timeout seconds for the running jobs, calling heartbeat()
+        about once a second meanwhile. Jobs still running then are marked
+        failed; returns how many.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.lock:
+                running = [job for job in self.jobs.values() if not job.finished_at]
+            if not running or time.monotonic() >= deadline:
+                break
+            if heartbeat is not None:
+                heartbeat()
+            time.sleep(min(1.0, max(deadline - time.monotonic(), 0)))
+        
+        for job in running:
+            self._abandon(job)
+        return len(running)
+    
+    def _abandon(self, job):
+        logger.warning(f"Upload job {job.id} did not finish before the server stopped.")
+        job.state = 'failed'
+        job.error = INTERRUPTED_ERROR
+        job.finished_at = time.time()
+        self._persist(job)
+    
+    def _run(self, app, job, func, args):
+        with self.lock:
+            if job.state != 'queued':
+                # Abandoned by stop() just before this worker took it.
+                self.slots.release()
+                return
+            job.state = 'running'
+        job.started_at = time.time()
+        self._persist(job)
+        
+        try:
+            with app.app_context():
+                job.result = func(job, *args)
+            job.state = 'succeeded'
+            job.phase = 'done'
+        except Exception as e:
+            logger.error(f"Upload job {job.id} failed: {str(e)}")
+            logger.error(traceback.format_exc())
+            job.state = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self._persist(job)
+            self.slots.release()
+    
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at]
+        for job_id in finished[:max(len(self.jobs) - self.history_size, 0)]:
+            del self.jobs[job_id]
+            try:
+                os.remove(self._status_path(job_id))
+            except OSError:
+                pass
+    
+    def _status_path(self, job_id):
+        return os.path.join(self.status_folder, f"{os.path.basename(job_id)}.json")
+    
+    def _persist(self, job):
+        path = self._status_path(job.id)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(job.to_dict(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write status for job {job.id}: {str(e)}")
+
+_MANAGERS = ('upload_jobs', 'resumable_jobs')
+_manager_lock = threading.Lock()
+
+def get_job_manager():
+    """The job manager of the current app, created on first use."""
+    config = current_app.config
+    return _app_manager('upload_jobs', config['JOB_WORKERS'], config['JOB_QUEUE_SIZE'])
+
+def get_resumable_job_manager():
+    """
+    The job manager for resumable uploads parsed while their chunks arrive.
+    Those jobs mostly wait on the client, so they get their own workers
+    rather than holding up uploads that are ready to be parsed.
+    """
+    return _app_manager('resumable_jobs', current_app.config['RESUMABLE_PARSE_WORKERS'], 0)
+
+def _app_manager(name, max_workers, max_pending):
+    manager = current_app.extensions.get(name)
+    if manager is None:
+        with _manager_lock:
+            manager = current_app.extensions.get(name)
+            if manager is None:
+                manager = JobManager(max_workers, max_pending, current_app.config['JOB_STATUS_FOLDER'])
+                current_app.extensions[name] = manager
+    return manager
+
+def stop_job_managers(app, timeout, heartbeat=None):
+    """
+    Let the jobs of every job manager of app finish before the process
+    exits: queued jobs are failed right away, running ones get up to timeout
+    seconds in all. Returns how many jobs were cut short.
+    """
+    managers = [app.extensions[name] for name in _MANAGERS if name in app.extensions]
+    for manager in managers:
+        manager.stop()
+    
+    deadline = time.monotonic() + timeout
+    return sum(manager.wait(max(deadline - time.monotonic(), 0), heartbeat) for manager in managers)
+
+def fail_unfinished_jobs(status_folder):
+    """
+    Mark jobs a previous server left queued or running as failed, since no
+    process is running them any more. Returns how many there were.
+    """
+    try:
+        names = [name for name in os.listdir(status_folder) if name.endswith('.json')]
+    except FileNotFoundError:
+        return 0
+    
+    failed = 0
+    for name in names:
+        path = os.path.join(status_folder, name)
+        try:
+            with open(path) as f:
+                status = json.load(f)
+            if status.get('state') not in ('queued', 'running'):
+                continue
+            status.update(state='failed', error=INTERRUPTED_ERROR)
+            with open(f"{path}.tmp", 'w') as f:
+                json.dump(status, f)
+            os.replace(f"{path}.tmp", path)
+            failed += 1
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not check job status {name}: {str(e)}")
+    
+    if failed:
+        logger.warning(f"Marked {failed} unfinished upload job(s) as failed.")
+    return failed
@@ -0,0 +1,144 @@
+from flask import g, has_app_context, has_request_context, request
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+from contextlib import contextmanager
+import logging
+import os
+import sys
+import time
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request',
+    ['endpoint', 'method', 'outcome'], buckets=_LATENCY_BUCKETS)
+
+UPLOAD_PHASE_SECONDS = Histogram(
+    'upload_phase_duration_seconds',
+    'Time spent per chunk in each upload phase (hash, read_csv, dates, extract, validate, transform, fingerprint, '
+    'archive, insert, rollup, trends, commit)',
+    ['phase'], buckets=_LATENCY_BUCKETS)
+
+UPLOAD_SECONDS = Histogram(
+    'upload_duration_seconds', 'Time to process a whole upload', ['outcome'], buckets=_LATENCY_BUCKETS)
+
+UPLOAD_ROWS_PER_SECOND = Histogram(
+    'upload_rows_per_second', 'Throughput of successful uploads',
+    buckets=(100, 500, 1000, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000))
+
+UPLOADS = Counter('uploads', 'Uploads processed', ['outcome'])
+
+UPLOAD_ROWS = Counter('upload_rows', 'CSV rows parsed')
+
+UPLOAD_BYTES = Counter('upload_bytes', 'CSV bytes parsed')
+
+CSV_NULL_RECORDS = Counter('csv_null_records', 'Parsed rows in which no nutrient value was found')
+
+REJECTED_ROWS = Counter('rejected_rows', 'Uploaded rows rejected by validation, per broken rule', ['reason'])
+
+CSV_JSON_FALLBACK_ROWS = Counter('csv_json_fallback_rows', 'Rows parsed with the per-row meal/dishes JSON fallback')
+
+DB_ROUND_TRIPS = Counter('db_round_trips', 'Statements sent to the database', ['endpoint', 'kind'])
+
+def outcome_for_status(status_code):
+    if status_code < 400:
+        return 'success'
+    return 'client_error' if status_code < 500 else 'server_error'
+
+def current_endpoint():
+    """The request endpoint, or the label a background job set on g."""
+    if has_request_context() and request.endpoint:
+        return request.endpoint
+    if has_app_context():
+        return g.get('metrics_endpoint', 'background')
+    return 'background'
+
+@contextmanager
+def observe_phase(phase, timings=None):
+    """Time a block into upload_phase_duration_seconds and, optionally, a per-upload dict."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        UPLOAD_PHASE_SECONDS.labels(phase).observe(elapsed)
+        if timings is not None:
+            timings[phase] = timings.get(phase, 0.0) + elapsed
+
+def record_db_round_trip(kind):
+    DB_ROUND_TRIPS.labels(current_endpoint(), kind).inc()
+    if has_app_context():
+        g.db_round_trips = g.get('db_round_trips', 0) + 1
+
+def db_round_trips():
+    """Statements sent so far in the current app context."""
+    return g.get('db_round_trips', 0) if has_app_context() else 0
+
+def add_db_round_trips(count):
+    """Credit statements sent from helper threads' app contexts to the current one."""
+    if has_app_context():
+        g.db_round_trips = g.get('db_round_trips', 0) + count
+
+class PoolCollector:
+    """Exports the connection pool usage of this process's engines as gauges."""
+
+    def describe(self):
+        # Registering would otherwise call collect(), which needs db_client
+        # while it may still be importing this module.
+        return []
+
+    def collect(self):
+        # Before anything has used the database there are no pools to report,
+        # and importing db_client here would pull in pandas and SQLAlchemy.
+        db_client = sys.modules.get('backend.utils.db_client')
+
+        gauges = {
+            'checked_out': GaugeMetricFamily('db_pool_checked_out', 'Connections in use', labels=['database']),
+            'idle': GaugeMetricFamily('db_pool_idle', 'Idle connections in the pool', labels=['database']),
+            'overflow': GaugeMetricFamily('db_pool_overflow', 'Connections open beyond pool_size', labels=['database']),
+            'pool_size': GaugeMetricFamily('db_pool_size', 'Configured pool size', labels=['database']),
+            'checkouts': GaugeMetricFamily('db_pool_checkouts', 'Connections checked out since start', labels=['database']),
+            'max_wait_ms': GaugeMetricFamily('db_pool_max_wait_milliseconds', 'Longest wait for a connection', labels=['database'])
+        }
+        for database, stats in (db_client.all_pool_stats() if db_client else []):
+            for key, gauge in gauges.items():
+                gauge.add_metric([database], stats[key])
+
+        yield from gauges.values()
+
+REGISTRY.register(PoolCollector())
+
+def init_app(app):
+    """Time every request into http_request_duration_seconds."""
+
+    @app.before_request
+    def _start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            endpoint = request.endpoint or 'unmatched'
+            HTTP_REQUEST_SECONDS.labels(endpoint, request.method, outcome_for_status(response.status_code)).observe(
+                time.perf_counter() - started)
+        return response
+
+def collect_registry():
+    """
+    The registry to expose. Under a multi-process server with
+    PROMETHEUS_MULTIPROC_DIR set, metrics are merged from every worker.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+
+    from prometheus_client import multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(PoolCollector())
+    return registry
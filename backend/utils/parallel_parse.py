@@ -0,0 +1,108 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, shared_memory
+import numpy as np
+import pandas as pd
+import logging
+import threading
+
+from backend.utils.csv_parser import NUTRIENT_COLUMNS, extract_nutrient_values
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Below this many rows per worker the IPC and scheduling overhead outweighs
+# the extraction work, so smaller inputs are parsed serially.
+MIN_SHARD_ROWS = 5000
+
+# One pool per process and worker count, started lazily and reused across
+# uploads. Workers are forked: spawn/forkserver would re-import the main
+# module, and running backend/app.py as a script initializes the database
+# on import. Workers only run extraction code that takes no shared locks.
+_executors = {}
+_executors_lock = threading.Lock()
+
+def get_executor(workers):
+    with _executors_lock:
+        executor = _executors.get(workers)
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('fork'))
+            _executors[workers] = executor
+            logger.info(f"Started parse pool with {workers} worker process(es).")
+        return executor
+
+def shard_bounds(rows, workers, min_shard_rows=MIN_SHARD_ROWS):
+    """Contiguous [start, end) row ranges, at most one per worker and none below min_shard_rows."""
+    shards = max(1, min(workers, rows // max(min_shard_rows, 1)))
+    edges = np.linspace(0, rows, shards + 1).astype(int)
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+def extract_nutrient_values_parallel(json_data, workers, min_shard_rows=MIN_SHARD_ROWS):
+    """
+    extract_nutrient_values split across a process pool.
+
+    The rows are UTF-8 encoded into one shared-memory buffer with an offsets
+    array (the Arrow string layout), and every worker writes its rows of the
+    result straight into a shared float matrix. Only row ranges and block
+    names cross the process boundary, and because each shard owns a fixed
+    slice of the output, the merged result is identical to the serial one.
+    """
+    json_data = json_data.reset_index(drop=True)
+    bounds = shard_bounds(len(json_data), workers, min_shard_rows)
+    if len(bounds) == 1:
+        return extract_nutrient_values(json_data)
+
+    encoded = [text.encode('utf-8') for text in json_data.tolist()]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+
+    rows = len(encoded)
+    offsets_bytes = offsets.nbytes
+    source = shared_memory.SharedMemory(create=True, size=max(offsets_bytes + int(offsets[-1]), 1))
+    target = shared_memory.SharedMemory(create=True, size=rows * len(NUTRIENT_COLUMNS) * 8)
+    try:
+        np.ndarray(offsets.shape, dtype=np.int64, buffer=source.buf)[:] = offsets
+        source.buf[offsets_bytes:offsets_bytes + int(offsets[-1])] = b''.join(encoded)
+        del encoded
+
+        executor = get_executor(workers)
+        try:
+            futures = [executor.submit(_extract_shard, source.name, target.name, rows, start, end)
+                       for start, end in bounds]
+            fallback_rows = sum(future.result() for future in futures)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool next time.
+            with _executors_lock:
+                if _executors.get(workers) is executor:
+                    del _executors[workers]
+            raise
+
+        values = np.ndarray((rows, len(NUTRIENT_COLUMNS)), dtype=np.float64, buffer=target.buf).copy()
+    finally:
+        for block in (source, target):
+            block.close()
+            block.unlink()
+
+    return values, fallback_rows
+
+def _extract_shard(source_name, target_name, rows, start, end):
+    """Worker: extract rows [start, end) from the shared input into the shared output."""
+    source = shared_memory.SharedMemory(name=source_name)
+    target = shared_memory.SharedMemory(name=target_name)
+    try:
+        offsets = np.ndarray((rows + 1,), dtype=np.int64, buffer=source.buf)
+        data_start = offsets.nbytes
+        data = bytes(source.buf[data_start + offsets[start]:data_start + offsets[end]])
+        local = (offsets[start:end + 1] - offsets[start]).tolist()
+        texts = [data[a:b].decode('utf-8') for a, b in zip(local, local[1:])]
+
+        values, fallback_rows = extract_nutrient_values(pd.Series(texts, dtype=object))
+
+        output = np.ndarray((rows, len(NUTRIENT_COLUMNS)), dtype=np.float64, buffer=target.buf)
+        output[start:end] = values
+        del offsets, output
+        return fallback_rows
+    finally:
+        source.close()
+        target.close()
@@ -0,0 +1,306 @@
+from flask import current_app
+import logging
+import os
+import random
+import time
+import uuid
+
+from backend.utils.archive import UploadArchive, iter_archive
+from backend.utils.compression import DecompressedSizeGuard, iter_csv_streams
+from backend.utils.csv_parser import iter_csv_chunks
+from backend.utils.data_transform import transform_data
+from backend.utils.db_client import insert_fitness_data, get_session
+from backend.utils.dedupe import file_sha256, find_uploaded_file, record_uploaded_file, split_unchanged
+from backend.utils.ingest import UPLOAD_TRANSACTIONS, insert_by_user, is_retryable
+from backend.utils.rollups import touched_buckets, refresh_rollups
+from backend.utils.trends import touched_spans, merge_spans, refresh_trends
+from backend.utils.validation import RowValidator, write_rejects, write_superseded
+from backend.utils import metrics
+
+logging.basicConfig(level=logging.INFO, 
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def process_upload(file_path, chunk_size=None, mode=None, progress=None, source=None, upload_id=None):
+    """
+    Stream an export through parse -> transform -> upsert one chunk at a time,
+    so memory stays bounded by the chunk size rather than the file size.
+    gzip, zstd and zip uploads are decompressed as they are parsed; a zip
+    may hold several CSV files.
+    With UPLOAD_TRANSACTION='file', all chunks are written in a single
+    transaction: either the whole file is stored or none of it is. With
+    'user', each user's rows of a chunk are committed on their own (see
+    insert_by_user), so concurrent uploads of the same users only wait on
+    each other per user, and a failed upload can leave earlier users stored.
+    A 'file' transaction that hits a deadlock or serialization failure
+    (uploads locking shared users in different orders) is run again, up to
+    INGEST_MAX_RETRIES times.
+    With ARCHIVE_UPLOADS, the parsed chunks are also kept in the Parquet
+    archive once everything is committed.
+    
+    Re-uploads only cost what changed: a file identical to an earlier upload
+    whose rows are all still stored is not parsed at all, and rows whose
+    fingerprint matches the stored row are neither written, archived nor
+    rolled up. The summary counts them as 'unchanged'.
+    
+    Rows that fail validation (see RowValidator) are stored in
+    fitness_data_rejects under upload_id (a new id unless given) instead,
+    and the summary counts them per rule under 'rejected'.
+    
+    progress, if given, is called as progress(phase, rows_processed) whenever
+    the pipeline enters the parse, transform or insert phase of a chunk.
+    
+    source, if given, is a stream of file_path to parse instead of opening
+    it; a resumable upload passes one that waits for chunks still arriving.
+    Nothing may stay locked while it waits, so each chunk is then committed
+    (and archived) on its own, whatever UPLOAD_TRANSACTION says; a failed
+    parse leaves the earlier chunks stored, and parsing the file again skips
+    them as unchanged.
+    
+    The summary includes seconds spent per phase and the number of database
+    round trips; both are also exported as Prometheus metrics.
+    """
+    chunk_size = chunk_size or current_app.config['CSV_CHUNK_SIZE']
+    transaction = current_app.config['UPLOAD_TRANSACTION']
+    if transaction not in UPLOAD_TRANSACTIONS:
+        raise ValueError(f"Unknown upload transaction '{transaction}'. "
+                         f"Expected one of: {', '.join(UPLOAD_TRANSACTIONS)}")
+    upload_id = upload_id or uuid.uuid4().hex
+    
+    # A resumable source cannot be read twice, and its chunks are committed
+    # one by one anyway; per-user transactions retry on their own.
+    max_retries = current_app.config['INGEST_MAX_RETRIES'] if transaction == 'file' and source is None else 0
+    for attempt in range(max_retries + 1):
+        try:
+            return _process_upload(file_path, chunk_size, mode, progress, source, upload_id, transaction,
+                                   retryable=attempt < max_retries)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = min(0.05 * 2 ** attempt, 2.0) * random.uniform(0.5, 1.5)
+            logger.warning(f"Retrying upload {upload_id} in {delay:.2f}s after a transient conflict "
+                           f"(attempt {attempt + 1} of {max_retries}): {str(e)}")
+            time.sleep(delay)
+
+def _process_upload(file_path, chunk_size, mode, progress, source, upload_id, transaction, retryable):
+    """One attempt at process_upload; a retryable failure is recorded as 'retried'."""
+    summary = {'rows': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'chunks': 0}
+    users = {}
+    spans = {}
+    timings = {}
+    started = time.perf_counter()
+    round_trips = metrics.db_round_trips()
+    guard = DecompressedSizeGuard(current_app.config['MAX_DECOMPRESSED_LENGTH'])
+    validator = RowValidator()
+    
+    archive = UploadArchive(current_app.config['ARCHIVE_FOLDER'], upload_id) if current_app.config['ARCHIVE_UPLOADS'] else None
+    
+    session = get_session()
+    try:
+        # A resumable upload is hashed once it has fully arrived.
+        sha256 = None
+        if source is None:
+            with metrics.observe_phase('hash', timings):
+                sha256 = file_sha256(file_path)
+                previous = find_uploaded_file(session, sha256)
+            if previous is not None:
+                return _unchanged_upload(file_path, previous, started, timings, round_trips)
+        
+        chunks = _iter_upload_chunks(file_path, chunk_size, current_app.config['PARSE_WORKERS'], guard, source)
+        while True:
+            _report(progress, 'parse', summary['rows'])
+            with metrics.observe_phase('parse', timings):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            
+            rows = len(chunk)
+            with metrics.observe_phase('validate', timings):
+                chunk, rejects, superseded = validator.split(chunk)
+                write_rejects(session, upload_id, rejects)
+                write_superseded(session, upload_id, superseded)
+            
+            users.update(dict.fromkeys(chunk['user_id'].unique().tolist()))
+            
+            _report(progress, 'transform', summary['rows'])
+            with metrics.observe_phase('transform', timings):
+                transformed = transform_data(chunk)
+            with metrics.observe_phase('fingerprint', timings):
+                transformed, unchanged = split_unchanged(session, transformed)
+            
+            if archive is not None and not transformed.empty:
+                with metrics.observe_phase('archive', timings):
+                    archive.write(chunk.loc[transformed.index])
+            
+            _report(progress, 'insert', summary['rows'])
+            if transformed.empty:
+                counts = {'inserted': 0, 'updated': 0}
+            elif transaction == 'user':
+                # Rollups and trends are refreshed inside each user's transaction.
+                with metrics.observe_phase('insert', timings):
+                    counts = insert_by_user(transformed, mode=mode)
+            else:
+                with metrics.observe_phase('insert', timings):
+                    counts = insert_fitness_data(transformed, mode=mode, session=session)
+                with metrics.observe_phase('rollup', timings):
+                    refresh_rollups(session, touched_buckets(transformed))
+                # Trends are refreshed once per upload: chunks usually
+                # overlap in users and dates, and windows would be redone.
+                merge_spans(spans, touched_spans(transformed))
+            
+            summary['rows'] += rows
+            summary['inserted'] += counts['inserted']
+            summary['updated'] += counts['updated']
+            summary['unchanged'] += unchanged
+            summary['chunks'] += 1
+            
+            if source is not None:
+                with metrics.observe_phase('trends', timings):
+                    refresh_trends(session, spans)
+                spans = {}
+                with metrics.observe_phase('commit', timings):
+                    session.commit()
+                if archive is not None and not transformed.empty:
+                    _publish_archive(archive, timings)
+            logger.info(f"Processed chunk {summary['chunks']} ({summary['rows']} rows so far).")
+        
+        if summary['rows'] == 0:
+            raise ValueError("No valid data found in the CSV file after parsing")
+        
+        rejected = validator.summary()
+        if rejected['rows']:
+            logger.warning(f"Rejected {rejected['rows']} of {summary['rows']} rows of upload {upload_id}: "
+                           f"{', '.join(f'{reason}={count}' for reason, count in rejected['reasons'].items())}")
+        if rejected['rows'] == summary['rows']:
+            raise ValueError(f"None of the {summary['rows']} rows passed validation "
+                             f"({', '.join(f'{count} {reason}' for reason, count in rejected['reasons'].items())}).")
+        
+        with metrics.observe_phase('trends', timings):
+            refresh_trends(session, spans)
+        
+        with metrics.observe_phase('hash', timings):
+            # With per-user transactions, a concurrent write to these users
+            # between their commit and this one is not seen here, and a later
+            # identical upload would then be skipped.
+            record_uploaded_file(session, sha256 or file_sha256(file_path), users, summary['rows'] - rejected['rows'])
+        
+        with metrics.observe_phase('commit', timings):
+            session.commit()
+    except Exception as e:
+        session.rollback()
+        if archive is not None:
+            archive.discard()
+        if retryable and is_retryable(e):
+            _record_upload('retried', started)
+        else:
+            _record_upload('validation_error' if isinstance(e, ValueError) else 'error', started)
+        raise
+    finally:
+        session.close()
+    
+    if archive is not None:
+        _publish_archive(archive, timings)
+    
+    elapsed = _record_upload('success', started)
+    metrics.UPLOAD_ROWS.inc(summary['rows'])
+    metrics.UPLOAD_BYTES.inc(guard.bytes)
+    if elapsed > 0:
+        metrics.UPLOAD_ROWS_PER_SECOND.observe(summary['rows'] / elapsed)
+    
+    summary['users'] = list(users)
+    summary['rejected'] = rejected
+    summary['upload_id'] = upload_id
+    summary['duplicate_file'] = False
+    summary['bytes'] = os.path.getsize(file_path)
+    summary['csv_bytes'] = guard.bytes
+    summary['seconds'] = round(elapsed, 3)
+    summary['phase_seconds'] = {phase: round(seconds, 3) for phase, seconds in timings.items()}
+    summary['db_round_trips'] = metrics.db_round_trips() - round_trips
+    logger.info(f"Inserted {summary['inserted']} and updated {summary['updated']} records, "
+                f"skipped {summary['unchanged']} unchanged, from {summary['rows']} rows in {summary['chunks']} chunk(s).")
+    
+    return summary
+
+def _unchanged_upload(file_path, previous, started, timings, round_trips):
+    """Summary of an upload identical to one whose rows are all still stored."""
+    elapsed = _record_upload('unchanged', started)
+    logger.info(f"Upload is identical to an earlier one; its {previous['rows']} rows are already stored.")
+    
+    return {
+        'rows': previous['rows'],
+        'inserted': 0,
+        'updated': 0,
+        'unchanged': previous['rows'],
+        'chunks': 0,
+        'users': previous['user_ids'],
+        'rejected': {'rows': 0, 'reasons': {}},
+        'upload_id': None,
+        'duplicate_file': True,
+        'bytes': os.path.getsize(file_path),
+        'csv_bytes': 0,
+        'seconds': round(elapsed, 3),
+        'phase_seconds': {phase: round(seconds, 3) for phase, seconds in timings.items()},
+        'db_round_trips': metrics.db_round_trips() - round_trips
+    }
+
+def _iter_upload_chunks(file_path, chunk_size, workers, guard, source=None):
+    """Parsed chunks of every CSV in the upload, decompressed on the fly."""
+    for name, stream in iter_csv_streams(file_path, guard, source):
+        logger.info(f"Parsing {name}")
+        yield from iter_csv_chunks(stream, chunk_size, workers)
+
+def _publish_archive(archive, timings):
+    # The rows are already committed, so a failed publish is logged rather
+    # than failing the upload; the upload is then missing from the archive.
+    try:
+        with metrics.observe_phase('archive', timings):
+            archive.publish()
+    except Exception as e:
+        logger.error(f"Could not archive upload {archive.upload_id}: {str(e)}")
+        archive.discard()
+
+def reprocess_archive(user_ids=None, start=None, end=None, mode=None):
+    """
+    Rebuild fitness_data rows, including every derived column, from the
+    Parquet archive instead of the original files. Each user's rows are
+    transformed, upserted and committed together with their rollups and trends.
+    Every row is rewritten, fingerprint or not, so this also repairs rows
+    changed behind the pipeline's back.
+    Returns the number of users and rows written, inserted and updated.
+    """
+    summary = {'users': 0, 'rows': 0, 'inserted': 0, 'updated': 0}
+    
+    for user_id, frame in iter_archive(current_app.config['ARCHIVE_FOLDER'], user_ids, start, end):
+        if frame.empty:
+            continue
+        
+        transformed = transform_data(frame)
+        session = get_session()
+        try:
+            counts = insert_fitness_data(transformed, mode=mode, session=session)
+            refresh_rollups(session, touched_buckets(transformed))
+            refresh_trends(session, touched_spans(transformed))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        
+        summary['users'] += 1
+        summary['rows'] += len(frame)
+        summary['inserted'] += counts['inserted']
+        summary['updated'] += counts['updated']
+        logger.info(f"Reprocessed {len(frame)} archived rows of user {user_id}.")
+    
+    return summary
+
+def _record_upload(outcome, started):
+    elapsed = time.perf_counter() - started
+    metrics.UPLOADS.labels(outcome).inc()
+    metrics.UPLOAD_SECONDS.labels(outcome).observe(elapsed)
+    return elapsed
+
+def _report(progress, phase, rows):
+    if progress is not None:
+        progress(phase, rows)
@@ -0,0 +1,80 @@
+from flask import current_app
+from contextlib import contextmanager
+import cProfile
+import logging
+import os
+import pstats
+import time
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def requested_profiler(header_value=None):
+    """
+    The profiler to run for one upload: the X-Profile header value ('1' or
+    'cprofile', or 'pyinstrument') if PROFILE_HEADER_ENABLED, else the
+    PROFILE_UPLOADS setting, else None.
+    """
+    if not current_app.config['PROFILE_HEADER_ENABLED']:
+        header_value = None
+    value = (header_value or current_app.config['PROFILE_UPLOADS'] or '').strip().lower()
+    if value in ('', '0', 'false', 'no'):
+        return None
+    if value == 'pyinstrument':
+        if pyinstrument is not None:
+            return 'pyinstrument'
+        logger.warning("pyinstrument is not installed, profiling with cProfile instead.")
+    return 'cprofile'
+
+@contextmanager
+def profiled(profiler, name):
+    """
+    Run the block under the given profiler (None disables profiling) and
+    write the report to PROFILE_FOLDER. Yields a dict that receives the
+    report's file name under 'profile' when the block finishes.
+    """
+    report = {}
+    if profiler is None:
+        yield report
+        return
+
+    folder = current_app.config['PROFILE_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    base = os.path.join(folder, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}")
+
+    if profiler == 'pyinstrument':
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+        try:
+            yield report
+        finally:
+            profiler.stop()
+            with open(f"{base}.html", 'w') as f:
+                f.write(profiler.output_html())
+            report['profile'] = os.path.basename(f"{base}.html")
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Only one cProfile may be active at a time on newer Pythons.
+        logger.warning(f"Profiling skipped: {str(e)}")
+        yield report
+        return
+
+    try:
+        yield report
+    finally:
+        profiler.disable()
+        profiler.dump_stats(f"{base}.prof")
+        with open(f"{base}.txt", 'w') as f:
+            pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(40)
+        report['profile'] = os.path.basename(f"{base}.prof")
+        logger.info(f"Wrote upload profile to {base}.prof")
@@ -0,0 +1,127 @@
+from sqlalchemy import text
+import logging
+
+from backend.utils.cache import get_query_cache
+from backend.utils.db_client import ROLLUP_MEASURES, ROLLUP_MACRO_CALORIES, get_engine
+from backend.utils.rollups import GRANULARITIES
+from backend.utils.trends import TREND_COLUMNS
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SERIES_GRANULARITIES = ('day',) + GRANULARITIES
+
+# Open-ended ranges are passed as NULL and ignored by the WHERE clauses.
+_DAY_SQL = f"""
+    SELECT date, {', '.join(ROLLUP_MEASURES)}
+    FROM fitness_data
+    WHERE user_id = :user_id
+      AND (CAST(:start AS date) IS NULL OR date >= :start)
+      AND (CAST(:end AS date) IS NULL OR date <= :end)
+    ORDER BY date
+"""
+
+# Buckets are returned when they overlap the range, so a range starting
+# mid-week still includes that week.
+_ROLLUP_SQL = f"""
+    SELECT period_start AS date, days, {', '.join(f'avg_{m} AS {m}' for m in ROLLUP_MEASURES)}
+    FROM fitness_data_rollup
+    WHERE granularity = :granularity
+      AND user_id = :user_id
+      AND (CAST(:start AS date) IS NULL
+           OR period_start + CAST('1 ' || :granularity AS interval) > CAST(:start AS date))
+      AND (CAST(:end AS date) IS NULL OR period_start <= :end)
+    ORDER BY period_start
+"""
+
+_SUMMARY_SQL = f"""
+    SELECT count(*) AS days, min(date) AS first_date, max(date) AS last_date,
+           {', '.join(f'avg({m}) AS avg_{m}' for m in ROLLUP_MEASURES + ROLLUP_MACRO_CALORIES)},
+           sum(steps) AS total_steps, sum(exercise_calories) AS total_exercise_calories
+    FROM fitness_data
+    WHERE user_id = :user_id
+      AND (CAST(:start AS date) IS NULL OR date >= :start)
+      AND (CAST(:end AS date) IS NULL OR date <= :end)
+"""
+
+# Without a range the summary is read from the running totals in users.
+_LIFETIME_SUMMARY_SQL = f"""
+    SELECT days, first_date, last_date,
+           {', '.join(f'sum_{m} / NULLIF(count_{m}, 0) AS avg_{m}' for m in ROLLUP_MEASURES + ROLLUP_MACRO_CALORIES)},
+           CASE WHEN count_steps > 0 THEN CAST(sum_steps AS bigint) END AS total_steps,
+           CASE WHEN count_exercise_calories > 0 THEN sum_exercise_calories END AS total_exercise_calories
+    FROM users
+    WHERE user_id = :user_id
+"""
+
+_TRENDS_SQL = f"""
+    SELECT {', '.join(TREND_COLUMNS[1:])}
+    FROM fitness_trends
+    WHERE user_id = :user_id
+      AND (CAST(:start AS date) IS NULL OR date >= :start)
+      AND (CAST(:end AS date) IS NULL OR date <= :end)
+    ORDER BY date
+"""
+
+# Every write of a user's rows bumps users.updated_at in the same transaction
+# (see db_client._lock_users), which makes it the version of the user's
+# cached results in every worker process.
+_VERSION_SQL = "SELECT updated_at FROM users WHERE user_id = :user_id"
+
+def get_nutrition_series(user_id, start=None, end=None, granularity='day'):
+    """
+    Per day, week or month nutrition values of one user between start and
+    end (inclusive, either may be None). Week and month values are daily
+    averages read from the rollup table.
+    """
+    if granularity not in SERIES_GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}'. "
+                         f"Expected one of: {', '.join(SERIES_GRANULARITIES)}")
+
+    def load(conn):
+        sql = _DAY_SQL if granularity == 'day' else _ROLLUP_SQL
+        params = {'user_id': user_id, 'start': start, 'end': end, 'granularity': granularity}
+        rows = conn.execute(text(sql), params).mappings().all()
+        return [_serialize(row) for row in rows]
+
+    return _cached((user_id, 'nutrition', granularity, start, end), load)
+
+def get_nutrition_summary(user_id, start=None, end=None):
+    """Totals and daily averages of one user between start and end, or None without data."""
+    def load(conn):
+        if start is None and end is None:
+            row = conn.execute(text(_LIFETIME_SUMMARY_SQL), {'user_id': user_id}).mappings().first()
+        else:
+            row = conn.execute(text(_SUMMARY_SQL), {'user_id': user_id, 'start': start, 'end': end}).mappings().one()
+        return _serialize(row) if row and row['days'] else None
+
+    return _cached((user_id, 'summary', start, end), load)
+
+def get_trend_series(user_id, start=None, end=None):
+    """Per day rolling trends of one user between start and end (inclusive, either may be None)."""
+    def load(conn):
+        params = {'user_id': user_id, 'start': start, 'end': end}
+        rows = conn.execute(text(_TRENDS_SQL), params).mappings().all()
+        return [_serialize(row) for row in rows]
+
+    return _cached((user_id, 'trends', start, end), load)
+
+def _cached(key, load):
+    """
+    The cached result for key if the user's rows have not changed since it
+    was loaded, otherwise load(conn). A hit costs one primary key lookup.
+    """
+    with get_engine().connect() as conn:
+        version = conn.execute(text(_VERSION_SQL), {'user_id': key[0]}).scalar()
+        return get_query_cache().get_or_load(key, lambda: load(conn), version)
+
+def _serialize(row):
+    result = {}
+    for column, value in row.items():
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif isinstance(value, float):
+            value = round(value, 2)
+        result[column] = value
+    return result
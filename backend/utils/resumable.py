@@ -0,0 +1,268 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+class ResumableUpload:
+    """
+    An upload sent as numbered chunks, kept entirely on disk so that every
+    worker process sharing UPLOAD_FOLDER can accept its chunks:
+
+        <folder>/<upload_id>/upload.json   filename, size and chunk size
+        <folder>/<upload_id>/<filename>    staging file, chunk i at i * chunk_size
+        <folder>/<upload_id>/received/<i>  written once chunk i is in the staging file
+        <folder>/<upload_id>/parse         id of the job parsing the upload
+        <folder>/<upload_id>/complete      written when the client completes it
+    """
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.id = meta['upload_id']
+        self.filename = meta['filename']
+        self.size = meta['size']
+        self.chunk_size = meta['chunk_size']
+        self.chunks = meta['chunks']
+        self.created_at = meta['created_at']
+        self.file_path = os.path.join(path, self.filename)
+
+    @classmethod
+    def create(cls, folder, filename, size, chunk_size):
+        """Start a new upload of size bytes, received in chunks of chunk_size."""
+        if size <= 0:
+            raise ValueError("The upload size must be a positive number of bytes.")
+
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(folder, upload_id)
+        meta = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'size': size,
+            'chunk_size': chunk_size,
+            'chunks': -(-size // chunk_size),
+            'created_at': time.time()
+        }
+
+        os.makedirs(os.path.join(path, 'received'))
+        open(os.path.join(path, filename), 'wb').close()
+        with open(os.path.join(path, 'upload.json'), 'w') as f:
+            json.dump(meta, f)
+
+        logger.info(f"Started resumable upload {upload_id} of {filename} ({size} bytes, {meta['chunks']} chunks).")
+        return cls(path, meta)
+
+    @classmethod
+    def load(cls, folder, upload_id):
+        """The upload with this id, or None if it does not exist (any more)."""
+        if not _UPLOAD_ID.match(upload_id):
+            return None
+
+        path = os.path.join(folder, upload_id)
+        try:
+            with open(os.path.join(path, 'upload.json')) as f:
+                return cls(path, json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def chunk_length(self, index):
+        if not 0 <= index < self.chunks:
+            raise ValueError(f"Chunk index must be between 0 and {self.chunks - 1}.")
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def write_chunk(self, index, data, sha256):
+        """
+        Store chunk index after checking its length and SHA-256 digest.
+        Returns False if the chunk had already been received: it is not
+        written again, since a parse may already be reading it.
+        """
+        expected = self.chunk_length(index)
+        if len(data) != expected:
+            raise ValueError(f"Chunk {index} must be {expected} bytes, got {len(data)}.")
+        if hashlib.sha256(data).hexdigest() != (sha256 or '').lower():
+            raise ValueError(f"Checksum mismatch for chunk {index}.")
+
+        if self.is_received(index):
+            return False
+
+        fd = os.open(self.file_path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, index * self.chunk_size)
+        finally:
+            os.close(fd)
+
+        open(self._marker(index), 'wb').close()
+        return True
+
+    def is_received(self, index):
+        return os.path.exists(self._marker(index))
+
+    def received_chunks(self):
+        try:
+            names = os.listdir(os.path.join(self.path, 'received'))
+        except FileNotFoundError:
+            return []
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def missing_chunks(self):
+        received = set(self.received_chunks())
+        return [index for index in range(self.chunks) if index not in received]
+
+    def received_ranges(self):
+        """Received bytes as sorted [start, end) ranges."""
+        ranges = []
+        for index in self.received_chunks():
+            start = index * self.chunk_size
+            end = start + self.chunk_length(index)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+        return ranges
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, 'upload.json'))
+
+    def claim_parse(self):
+        """True for exactly one caller, across processes, until release_parse."""
+        try:
+            os.close(os.open(os.path.join(self.path, 'parse'), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    def set_parse_job(self, job_id):
+        tmp_path = os.path.join(self.path, f'parse.{job_id}.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(job_id)
+        os.replace(tmp_path, os.path.join(self.path, 'parse'))
+
+    def parse_job(self):
+        """Id of the job parsing this upload, or None if none has started."""
+        try:
+            with open(os.path.join(self.path, 'parse')) as f:
+                return f.read() or None
+        except OSError:
+            return None
+
+    def release_parse(self):
+        try:
+            os.remove(os.path.join(self.path, 'parse'))
+        except FileNotFoundError:
+            pass
+
+    def mark_complete(self):
+        open(os.path.join(self.path, 'complete'), 'wb').close()
+
+    def is_complete(self):
+        return os.path.exists(os.path.join(self.path, 'complete'))
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def open_reader(self, timeout):
+        """
+        Binary stream of the staging file that follows the upload as it
+        arrives: reads return the received prefix and then wait for the next
+        chunk. It ends once every chunk is in, and raises ValueError if the
+        upload is cancelled or no chunk arrives for timeout seconds.
+        """
+        return io.BufferedReader(_GrowingFileReader(self, timeout), self.chunk_size)
+
+    def to_dict(self):
+        received = self.received_chunks()
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'chunks': self.chunks,
+            'received_ranges': self.received_ranges(),
+            'received_bytes': sum(self.chunk_length(index) for index in received),
+            'missing_chunks': self.missing_chunks(),
+            'complete': self.is_complete(),
+            'job_id': self.parse_job()
+        }
+
+    def _marker(self, index):
+        return os.path.join(self.path, 'received', str(index))
+
+class _GrowingFileReader(io.RawIOBase):
+    """Reads the contiguous received prefix of a ResumableUpload, waiting for more."""
+
+    _POLL_SECONDS = (0.05, 1.0)
+
+    def __init__(self, upload, timeout):
+        super().__init__()
+        self._upload = upload
+        self._timeout = timeout
+        self._fd = os.open(upload.file_path, os.O_RDONLY)
+        self._position = 0
+        self._ready_chunks = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        available = self._wait_for_data()
+        if available <= self._position:
+            return 0
+
+        data = os.pread(self._fd, min(len(buffer), available - self._position), self._position)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            os.close(self._fd)
+        super().close()
+
+    def _available(self):
+        upload = self._upload
+        while self._ready_chunks < upload.chunks and upload.is_received(self._ready_chunks):
+            self._ready_chunks += 1
+        return min(self._ready_chunks * upload.chunk_size, upload.size)
+
+    def _wait_for_data(self):
+        poll, max_poll = self._POLL_SECONDS
+        deadline = time.monotonic() + self._timeout
+        while True:
+            available = self._available()
+            if available > self._position or available >= self._upload.size:
+                return available
+            if not self._upload.exists():
+                raise ValueError("The upload was cancelled.")
+            if time.monotonic() >= deadline:
+                raise ValueError(f"No chunk of the upload arrived for {self._timeout} seconds.")
+
+            time.sleep(poll)
+            poll = min(poll * 2, max_poll)
+
+def purge_stale_uploads(folder, max_age):
+    """Delete uploads started more than max_age seconds ago; returns how many."""
+    try:
+        upload_ids = os.listdir(folder)
+    except FileNotFoundError:
+        return 0
+
+    purged = 0
+    cutoff = time.time() - max_age
+    for upload_id in upload_ids:
+        upload = ResumableUpload.load(folder, upload_id)
+        if upload is not None and upload.created_at < cutoff:
+            upload.remove()
+            purged += 1
+
+    if purged:
+        logger.info(f"Removed {purged} resumable upload(s) older than {max_age} seconds.")
+    return purged
@@ -0,0 +1,97 @@
+from sqlalchemy import text
+import pandas as pd
+import logging
+
+from backend.utils.db_client import ROLLUP_MEASURES, ROLLUP_MACRO_CALORIES
+
+logging.basicConfig(level=logging.INFO, 
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ('week', 'month')
+
+_AGGREGATES = ', '.join(
+    [f"sum(f.{m}), avg(f.{m}), min(f.{m}), max(f.{m})" for m in ROLLUP_MEASURES] +
+    [f"count(f.{m})" for m in ROLLUP_MEASURES] +
+    [f"sum(f.{m})" for m in ROLLUP_MACRO_CALORIES]
+)
+
+_COLUMNS = (
+    [f"{aggregate}_{m}" for m in ROLLUP_MEASURES for aggregate in ('sum', 'avg', 'min', 'max')] +
+    [f"count_{m}" for m in ROLLUP_MEASURES] +
+    [f"sum_{m}" for m in ROLLUP_MACRO_CALORIES]
+)
+
+# Buckets are recomputed from fitness_data rather than patched with deltas, so
+# upserts that overwrite a day (and min/max) stay exact. Aggregating each
+# touched (user, period) in a LATERAL subquery, with a date (not timestamp)
+# upper bound, makes every bucket one (user_id, date) index range scan; a
+# plain join let the planner hash-join on user_id and scan the whole table.
+REFRESH_SQL = f"""
+    INSERT INTO fitness_data_rollup (granularity, user_id, period_start, days, {', '.join(_COLUMNS)})
+    SELECT :granularity, b.user_id, b.period_start, a.*
+    FROM unnest(CAST(:user_ids AS integer[]), CAST(:period_starts AS date[])) AS b(user_id, period_start)
+    CROSS JOIN LATERAL (
+        SELECT count(*) AS days, {_AGGREGATES}
+        FROM fitness_data f
+        WHERE f.user_id = b.user_id
+          AND f.date >= b.period_start
+          AND f.date < CAST(b.period_start + CAST('1 ' || :granularity AS interval) AS date)
+    ) a
+    WHERE a.days > 0
+    ON CONFLICT (granularity, user_id, period_start) DO UPDATE SET
+        days = EXCLUDED.days, {', '.join(f'{c} = EXCLUDED.{c}' for c in _COLUMNS)}
+"""
+
+REBUILD_SQL = f"""
+    INSERT INTO fitness_data_rollup (granularity, user_id, period_start, days, {', '.join(_COLUMNS)})
+    SELECT :granularity, f.user_id, CAST(date_trunc(:granularity, f.date) AS date), count(*), {_AGGREGATES}
+    FROM fitness_data f
+    GROUP BY f.user_id, CAST(date_trunc(:granularity, f.date) AS date)
+"""
+
+def touched_buckets(df):
+    """
+    The (user_id, period_start) buckets per granularity that the rows in df
+    fall into. Weeks start on Monday, matching date_trunc('week', ...).
+    """
+    dates = pd.to_datetime(df['date'])
+    user_ids = df['user_id'].astype('int64')
+    
+    starts = {
+        'week': dates - pd.to_timedelta(dates.dt.weekday, unit='D'),
+        'month': dates.dt.to_period('M').dt.start_time
+    }
+    
+    return {
+        granularity: set(zip(user_ids.tolist(), period_start.dt.date.tolist()))
+        for granularity, period_start in starts.items()
+    }
+
+def refresh_rollups(session, buckets):
+    """Recompute the given rollup buckets inside the caller's transaction."""
+    if session.get_bind().dialect.name != 'postgresql':
+        # The rollup SQL relies on unnest() and date intervals; other
+        # databases (SQLite in the benchmarks) skip rollups.
+        return
+    
+    for granularity in GRANULARITIES:
+        keys = sorted(buckets.get(granularity, ()))
+        if not keys:
+            continue
+        
+        session.execute(text(REFRESH_SQL), {
+            'granularity': granularity,
+            'user_ids': [user_id for user_id, _ in keys],
+            'period_starts': [period_start for _, period_start in keys]
+        })
+        logger.info(f"Refreshed {len(keys)} {granularity}ly rollup bucket(s).")
+
+def rebuild_rollups(conn):
+    """Recompute every rollup bucket from scratch, e.g. for data loaded before rollups existed."""
+    for granularity in GRANULARITIES:
+        conn.execute(text("DELETE FROM fitness_data_rollup WHERE granularity = :granularity"),
+                     {'granularity': granularity})
+        conn.execute(text(REBUILD_SQL), {'granularity': granularity})
+    
+    logger.info("Rebuilt weekly and monthly rollups.")
@@ -0,0 +1,223 @@
+from sqlalchemy import text, inspect
+from sqlalchemy.exc import IntegrityError, ProgrammingError
+from datetime import date, datetime
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Columns the Grafana panels read by (user_id, date); carrying them in the
+# unique index lets those queries run as index-only scans.
+COVERING_COLUMNS = ['calories', 'carbs', 'fat', 'protein']
+
+def user_date_constraint(table_name):
+    return f"uq_{table_name}_user_date"
+
+def user_date_constraint_sql(table_name, include_macros):
+    include = f" INCLUDE ({', '.join(COVERING_COLUMNS)})" if include_macros else ""
+    return f"CONSTRAINT {user_date_constraint(table_name)} UNIQUE (user_id, date){include}"
+
+def ensure_user_date_index(engine, table_name, include_macros=False):
+    """
+    Make (user_id, date) the table's composite unique index, optionally
+    covering the macro columns, and drop the single-column user_id index it
+    makes redundant. Tables that predate the constraint are deduplicated
+    first, keeping the most recently inserted row.
+    """
+    constraint = user_date_constraint(table_name)
+    expected = user_date_constraint_sql(table_name, include_macros).split(' ', 2)[2]
+
+    with engine.begin() as conn:
+        current = conn.execute(text("""
+            SELECT pg_get_constraintdef(c.oid)
+            FROM pg_constraint c
+            WHERE c.conname = :name AND c.conrelid = CAST(:table_name AS regclass)
+        """), {'name': constraint, 'table_name': table_name}).scalar()
+
+        if current == expected:
+            conn.execute(text(f"DROP INDEX IF EXISTS ix_{table_name}_user_id"))
+            return
+
+        if current is None:
+            removed = conn.execute(text(f"""
+                DELETE FROM {table_name} a
+                USING {table_name} b
+                WHERE a.user_id = b.user_id AND a.date = b.date AND a.id < b.id
+            """)).rowcount
+            if removed:
+                logger.warning(f"Removed {removed} duplicate (user_id, date) rows from {table_name}.")
+        else:
+            conn.execute(text(f"ALTER TABLE {table_name} DROP CONSTRAINT {constraint}"))
+
+        conn.execute(text(f"ALTER TABLE {table_name} ADD {user_date_constraint_sql(table_name, include_macros)}"))
+        conn.execute(text(f"DROP INDEX IF EXISTS ix_{table_name}_user_id"))
+
+    logger.info(f"Index on {table_name}(user_id, date) set to: {expected}")
+
+def archive_table(engine, table_name):
+    """Rename a table out of the way instead of dropping it; returns the new name."""
+    archived = f"{table_name}_legacy_{datetime.utcnow():%Y%m%d%H%M%S}"
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table_name} RENAME TO {archived}"))
+
+        # Index names are schema-wide, so move them too or the new table's
+        # indexes would collide with them.
+        indexes = conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = :archived"),
+                               {'archived': archived}).scalars().all()
+        for index in indexes:
+            if table_name in index:
+                conn.execute(text(f"ALTER INDEX {index} RENAME TO {index.replace(table_name, archived, 1)}"))
+
+    logger.warning(f"Renamed existing {table_name} table to {archived}.")
+    return archived
+
+def add_missing_columns(engine, table):
+    """
+    Add the model's columns that an existing table predates, as nullable
+    columns without a default, so no row is rewritten. Returns their names.
+    """
+    existing = {column['name'] for column in inspect(engine).get_columns(table.name)}
+    missing = [column for column in table.columns if column.name not in existing]
+
+    with engine.begin() as conn:
+        for column in missing:
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS "
+                              f"{column.name} {column.type.compile(dialect=conn.dialect)}"))
+            logger.info(f"Added column {table.name}.{column.name}.")
+
+    return [column.name for column in missing]
+
+def is_partitioned(conn, table_name):
+    return conn.execute(text(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table_name)"
+    ), {'table_name': table_name}).scalar() is True
+
+def create_partitioned_table(conn, table, include_macros=False, sequence=None):
+    """
+    Create `table` as a table range-partitioned by month on date. Postgres
+    requires the partition key in every unique index, so the primary key
+    becomes (id, date); (user_id, date) already contains it.
+    """
+    columns = []
+    for column in table.columns:
+        if column.name == 'id':
+            default = f"nextval('{sequence}')" if sequence else None
+            columns.append(f"id integer NOT NULL DEFAULT {default}" if default else "id serial")
+            continue
+
+        definition = f"{column.name} {column.type.compile(dialect=conn.dialect)}"
+        if not column.nullable:
+            definition += " NOT NULL"
+        columns.append(definition)
+
+    conn.execute(text(f"""
+        CREATE TABLE {table.name} (
+            {', '.join(columns)},
+            CONSTRAINT {table.name}_pkey PRIMARY KEY (id, date),
+            {user_date_constraint_sql(table.name, include_macros)}
+        ) PARTITION BY RANGE (date)
+    """))
+    conn.execute(text(f"CREATE INDEX ix_{table.name}_date ON {table.name} (date)"))
+    logger.info(f"Created {table.name} partitioned by month.")
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(table_name, month):
+    return f"{table_name}_y{month.year:04d}m{month.month:02d}"
+
+def create_month_partitions(conn, table_name, months):
+    """Create the monthly partitions that do not exist yet."""
+    for month in sorted(set(months)):
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {partition_name(table_name, month)}
+            PARTITION OF {table_name}
+            FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')
+        """))
+
+# Partitions this process has already created or seen, per table.
+_known_partitions = {}
+_partitions_lock = threading.Lock()
+
+def ensure_partitions(engine, table_name, dates):
+    """
+    Make sure a partition exists for every month in dates. Each new partition
+    is created in its own short transaction, because attaching one locks the
+    parent table, and that lock must not be held for a whole upload. A month
+    another process created first counts as created; only months that exist
+    afterwards are remembered, so the others are tried again next time.
+    """
+    months = {month_start(value) for value in dates}
+
+    with _partitions_lock:
+        known = _known_partitions.setdefault((engine.url.render_as_string(), table_name), set())
+        missing = months - known
+        if not missing:
+            return
+
+        for month in sorted(missing):
+            try:
+                with engine.begin() as conn:
+                    create_month_partitions(conn, table_name, [month])
+            except (ProgrammingError, IntegrityError) as e:
+                # Another process created the same partition concurrently:
+                # "already exists", or a duplicate pg_type row.
+                if isinstance(e, ProgrammingError) and 'already exists' not in str(e):
+                    raise
+                with engine.connect() as conn:
+                    exists = conn.execute(text("SELECT to_regclass(:name)"),
+                                          {'name': partition_name(table_name, month)}).scalar()
+                if exists is None:
+                    raise
+            known.add(month)
+
+    logger.info(f"Ensured {len(missing)} monthly partition(s) of {table_name}.")
+
+def premake_partitions(engine, table_name, months_ahead):
+    """Create partitions from the current month through months_ahead months out."""
+    today = month_start(date.today())
+    ensure_partitions(engine, table_name, [add_months(today, i) for i in range(months_ahead + 1)])
+
+def migrate_to_partitioned(engine, table, include_macros=False):
+    """
+    Convert an existing plain table into a partitioned one without losing
+    rows. In one transaction: rename the old table, create the partitioned
+    table and one partition per month that has data, copy every row across
+    (keeping ids and the id sequence), then drop the old table. Any failure
+    rolls the whole conversion back.
+    """
+    name = table.name
+    old_name = f"{name}_unpartitioned"
+    column_list = ', '.join(column.name for column in table.columns)
+
+    with engine.begin() as conn:
+        conn.execute(text(f"LOCK TABLE {name} IN ACCESS EXCLUSIVE MODE"))
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table_name, 'id')"),
+                                {'table_name': name}).scalar()
+
+        conn.execute(text(f"ALTER TABLE {name} RENAME TO {old_name}"))
+        conn.execute(text(f"ALTER TABLE {old_name} DROP CONSTRAINT IF EXISTS {user_date_constraint(name)}"))
+        conn.execute(text(f"ALTER TABLE {old_name} DROP CONSTRAINT IF EXISTS {name}_pkey"))
+        for index in inspect(conn).get_indexes(old_name):
+            conn.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+
+        create_partitioned_table(conn, table, include_macros, sequence=sequence)
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {name}.id"))
+
+        months = conn.execute(text(
+            f"SELECT DISTINCT CAST(date_trunc('month', date) AS date) FROM {old_name}")).scalars().all()
+        create_month_partitions(conn, name, months)
+
+        copied = conn.execute(text(
+            f"INSERT INTO {name} ({column_list}) SELECT {column_list} FROM {old_name}")).rowcount
+        conn.execute(text(f"DROP TABLE {old_name}"))
+
+    logger.info(f"Migrated {copied} rows of {name} into {len(months)} monthly partition(s).")
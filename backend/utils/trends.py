@@ -0,0 +1,126 @@
+from sqlalchemy import text
+import pandas as pd
+import logging
+
+from backend.utils.db_client import TREND_MACROS
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# A day's trends read the days up to 29 days before it, so rows written for
+# [first, last] change the trends of [first, last + REACH_DAYS], which in turn
+# read the rows of [first - REACH_DAYS, last + REACH_DAYS].
+REACH_DAYS = 29
+
+_MACRO_CALORIES = ' + '.join(f'COALESCE(f.{m}_calories, 0)' for m in TREND_MACROS)
+
+# Running totals per user in date order. Postgres recomputes float sum()/avg()
+# over a moving frame row by row, so a 30-day window costs 30 rows per day;
+# running totals are one pass, and any calendar window is a difference of two.
+_RUNNING = {'days': 'count(*)', 'calories_n': 'count(f.calories)', 'calories': 'sum(f.calories)',
+            'macros': f'sum({_MACRO_CALORIES})',
+            **{m: f'sum(COALESCE(f.{m}_calories, 0))' for m in TREND_MACROS}}
+
+def _before(total, days):
+    """The running total up to `days` days before the current day."""
+    return f"COALESCE(last_value(r.{total}) OVER before_{days}, 0)"
+
+def _window(total, days, until=None):
+    """The total over the `days` days up to the current day, or up to `until` days before it."""
+    return f"({f'r.{total}' if until is None else _before(total, until)} - {_before(total, days)})"
+
+def _average(days, until=None):
+    return f"{_window('calories', days, until)} / NULLIF({_window('calories_n', days, until)}, 0)"
+
+def _share(macro, days):
+    return f"{_window(macro, days)} / NULLIF({_window('macros', days)}, 0)"
+
+TREND_COLUMNS = (['user_id', 'date', 'days_7d', 'calories_avg_7d', 'calories_avg_30d', 'calories_wow_change'] +
+                 [f'{m}_share_7d' for m in TREND_MACROS] + [f'{m}_share_drift' for m in TREND_MACROS])
+
+_EXPRESSIONS = (['r.user_id', 'r.date', _window('days', 7), _average(7), _average(30),
+                 f'{_average(7)} - {_average(14, 7)}'] +
+                [_share(m, 7) for m in TREND_MACROS] +
+                [f'{_share(m, 7)} - {_share(m, 30)}' for m in TREND_MACROS])
+
+# The window frames are calendar ranges, not row counts, so days without a
+# log do not stretch them.
+_BEFORE_WINDOWS = ', '.join(
+    f"before_{days} AS (PARTITION BY r.user_id ORDER BY r.date "
+    f"RANGE BETWEEN UNBOUNDED PRECEDING AND INTERVAL '{days} days' PRECEDING)"
+    for days in (7, 14, 30))
+
+def _trends_select(where=''):
+    return f"""
+        SELECT {', '.join(f'{expression} AS {column}' for expression, column in zip(_EXPRESSIONS, TREND_COLUMNS))}
+        FROM (
+            SELECT f.user_id, f.date,
+                   {', '.join(f'{aggregate} OVER running AS {total}' for total, aggregate in _RUNNING.items())}
+            FROM fitness_data f
+            {where}
+            WINDOW running AS (PARTITION BY f.user_id ORDER BY f.date ROWS UNBOUNDED PRECEDING)
+        ) r
+        WINDOW {_BEFORE_WINDOWS}
+    """
+
+# Each user's span is one (user_id, date) index range scan, windowed on its
+# own, like the rollup buckets.
+_SPAN_ROWS = f"""
+            WHERE f.user_id = s.user_id
+              AND f.date BETWEEN s.first_date - {REACH_DAYS} AND s.last_date + {REACH_DAYS}
+"""
+
+REFRESH_SQL = f"""
+    INSERT INTO fitness_trends ({', '.join(TREND_COLUMNS)})
+    SELECT t.* FROM unnest(CAST(:user_ids AS integer[]), CAST(:firsts AS date[]), CAST(:lasts AS date[]))
+        AS s(user_id, first_date, last_date)
+    CROSS JOIN LATERAL ({_trends_select(_SPAN_ROWS)}) t
+    WHERE t.date BETWEEN s.first_date AND s.last_date + {REACH_DAYS}
+    ON CONFLICT (user_id, date) DO UPDATE SET
+        {', '.join(f'{c} = EXCLUDED.{c}' for c in TREND_COLUMNS[2:])}
+"""
+
+REBUILD_SQL = f"""
+    INSERT INTO fitness_trends ({', '.join(TREND_COLUMNS)})
+    {_trends_select()}
+"""
+
+def touched_spans(df):
+    """The first and last date of each user's rows in df, as {user_id: (first, last)}."""
+    dates = pd.to_datetime(df['date'])
+    spans = dates.groupby(df['user_id'].astype('int64').to_numpy()).agg(['min', 'max'])
+    return {int(user_id): (first.date(), last.date())
+            for user_id, first, last in zip(spans.index, spans['min'], spans['max'])}
+
+def merge_spans(spans, other):
+    """Widen the spans in spans, in place, to also cover those in other."""
+    for user_id, (first, last) in other.items():
+        if user_id in spans:
+            first, last = min(first, spans[user_id][0]), max(last, spans[user_id][1])
+        spans[user_id] = (first, last)
+
+def refresh_trends(session, spans):
+    """Recompute the trends the given user spans can affect, inside the caller's transaction."""
+    if not spans or session.get_bind().dialect.name != 'postgresql':
+        # Like the rollups, trends rely on Postgres (date windows, unnest()).
+        return
+
+    user_ids = sorted(spans)
+    session.execute(text(REFRESH_SQL), {
+        'user_ids': user_ids,
+        'firsts': [spans[user_id][0] for user_id in user_ids],
+        'lasts': [spans[user_id][1] for user_id in user_ids]
+    })
+    logger.info(f"Refreshed trends of {len(user_ids)} user(s).")
+
+def rebuild_trends(conn):
+    """
+    Recompute every user's trends from scratch, e.g. for data loaded before
+    trends existed. Every user's updated_at is bumped too, so no worker
+    serves trends it cached before the rebuild.
+    """
+    conn.execute(text("DELETE FROM fitness_trends"))
+    conn.execute(text(REBUILD_SQL))
+    conn.execute(text("UPDATE users SET updated_at = now()"))
+    logger.info("Rebuilt trends.")
@@ -0,0 +1,214 @@
+from sqlalchemy import bindparam, insert, text
+import datetime
+import io
+import logging
+
+import numpy as np
+import pandas as pd
+
+from backend.utils.csv_parser import NUTRIENT_COLUMNS
+from backend.utils.db_client import fitness_rejects
+from backend.utils.metrics import REJECTED_ROWS
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+REJECT_REASONS = ('missing_user_id', 'missing_date', 'no_nutrients', 'out_of_range',
+                  'calorie_mismatch', 'future_date', 'duplicate')
+
+# Plausible daily totals (sodium in mg, the rest in kcal or g). Values outside
+# are typing or unit errors rather than real days.
+NUTRIENT_RANGES = {
+    'calories': (0, 20000),
+    'carbs': (0, 3000),
+    'fat': (0, 1500),
+    'protein': (0, 1500),
+    'sodium': (0, 100000),
+    'sugar': (0, 3000)
+}
+
+# Logged calories may differ from 4/9/4 kcal per gram of carbs/fat/protein
+# by fiber, alcohol and rounding, but not by more than this.
+CALORIE_MISMATCH_RATIO = 0.5
+CALORIE_MISMATCH_KCAL = 300
+
+REJECT_COLUMNS = ['row_number', 'user_id', 'date'] + NUTRIENT_COLUMNS + ['reasons']
+
+class RowValidator:
+    """
+    Validation state of one upload. Each chunk is checked with vectorized
+    masks, one per rule in REJECT_REASONS; a row may break several.
+
+    Like the upsert, the last row of a (user_id, date) in the upload wins:
+    earlier ones are rejected as duplicates. Within a chunk they are simply
+    not written. An earlier chunk's row has already been written, so split
+    reports it as superseded: the later row overwrites it, and
+    write_superseded records it as a reject. Duplicates are only looked for
+    among rows that pass every other rule, so a broken row never replaces a
+    good one.
+    """
+
+    def __init__(self, today=None):
+        self.today = np.datetime64(today or datetime.date.today(), 'D')
+        self.rows = 0
+        self.rejected = 0
+        self.reasons = dict.fromkeys(REJECT_REASONS, 0)
+        self._seen_keys = np.empty(0, dtype=np.int64)
+        self._seen_rows = np.empty(0, dtype=np.int64)
+
+    def split(self, df):
+        """
+        Split a parsed chunk into (valid rows, rejected rows, superseded rows).
+        The rejected rows get the row_number of each row in the upload
+        (1-based, header excluded) and a comma-separated 'reasons' column.
+        Superseded rows are the row_number, user_id and date of rows of
+        earlier chunks that a valid row of this one replaces.
+        """
+        masks = self._rule_masks(df)
+        failed = np.logical_or.reduce(list(masks.values()))
+        masks['duplicate'], superseded = self._duplicates(df, ~failed)
+        failed |= masks['duplicate']
+
+        rejects = df[failed].copy()
+        if len(rejects):
+            rejects['row_number'] = self.rows + 1 + np.flatnonzero(failed)
+            rejects['reasons'] = _reason_codes(masks, failed)
+            for reason, mask in masks.items():
+                count = int(mask.sum())
+                if count:
+                    self.reasons[reason] += count
+                    REJECTED_ROWS.labels(reason).inc(count)
+
+        if len(superseded):
+            self.reasons['duplicate'] += len(superseded)
+            REJECTED_ROWS.labels('duplicate').inc(len(superseded))
+
+        self.rows += len(df)
+        self.rejected += len(rejects) + len(superseded)
+        return df[~failed], rejects, superseded
+
+    def summary(self):
+        """Rejected row count and the number of rows that broke each rule."""
+        return {'rows': self.rejected, 'reasons': {reason: count for reason, count in self.reasons.items() if count}}
+
+    def _rule_masks(self, df):
+        values = df[NUTRIENT_COLUMNS].to_numpy(dtype='float64', na_value=np.nan)
+        low, high = np.array([NUTRIENT_RANGES[nutrient] for nutrient in NUTRIENT_COLUMNS], dtype='float64').T
+        calories, carbs, fat, protein = (values[:, NUTRIENT_COLUMNS.index(nutrient)]
+                                         for nutrient in ('calories', 'carbs', 'fat', 'protein'))
+        # Comparisons with missing (NaN/NaT) values are False, so each rule
+        # only judges the fields it needs that are present.
+        mismatch = np.abs(calories - (4 * carbs + 9 * fat + 4 * protein))
+
+        return {
+            'missing_user_id': df['user_id'].isna().to_numpy(),
+            'missing_date': df['date'].isna().to_numpy(),
+            'no_nutrients': np.isnan(values).all(axis=1),
+            'out_of_range': ((values < low) | (values > high)).any(axis=1),
+            'calorie_mismatch': mismatch > np.maximum(CALORIE_MISMATCH_KCAL, CALORIE_MISMATCH_RATIO * calories),
+            'future_date': df['date'].to_numpy(dtype='datetime64[D]') > self.today
+        }
+
+    def _duplicates(self, df, candidates):
+        """
+        (mask of rows among candidates that a later row of the chunk repeats,
+        the earlier chunks' rows that the chunk's remaining ones repeat).
+        """
+        duplicate = np.zeros(len(df), dtype=bool)
+        superseded = pd.DataFrame({'row_number': np.empty(0, dtype=np.int64),
+                                   'user_id': np.empty(0, dtype=np.int64),
+                                   'date': np.empty(0, dtype='datetime64[ns]')})
+        rows = np.flatnonzero(candidates)
+        if not len(rows):
+            return duplicate, superseded
+
+        user_ids = df['user_id'].to_numpy(dtype='int64', na_value=0)[rows]
+        days = df['date'].to_numpy(dtype='datetime64[D]').astype('int64')[rows]
+        keys = (user_ids << 32) + days
+
+        earlier = pd.Series(keys).duplicated(keep='last').to_numpy()
+        duplicate[rows[earlier]] = True
+        rows, keys = rows[~earlier], keys[~earlier]
+        row_numbers = self.rows + 1 + rows
+
+        # The keys seen so far stay sorted, each with the row number of its
+        # row: lookups are a binary search, and merging in a chunk is one
+        # pass over two sorted runs.
+        repeated = np.zeros(len(keys), dtype=bool)
+        if len(self._seen_keys):
+            positions = np.minimum(np.searchsorted(self._seen_keys, keys), len(self._seen_keys) - 1)
+            repeated = self._seen_keys[positions] == keys
+            if repeated.any():
+                replaced = df.iloc[rows[repeated]]
+                superseded = pd.DataFrame({'row_number': self._seen_rows[positions[repeated]],
+                                           'user_id': replaced['user_id'].to_numpy(dtype='int64'),
+                                           'date': replaced['date'].to_numpy()})
+                self._seen_rows[positions[repeated]] = row_numbers[repeated]
+
+        keys = np.concatenate([self._seen_keys, keys[~repeated]])
+        order = np.argsort(keys, kind='stable')
+        self._seen_keys = keys[order]
+        self._seen_rows = np.concatenate([self._seen_rows, row_numbers[~repeated]])[order]
+        return duplicate, superseded
+
+def _reason_codes(masks, failed):
+    """Comma-separated codes of the rules each failed row broke."""
+    codes = np.full(int(failed.sum()), '', dtype=object)
+    for reason, mask in masks.items():
+        hit = mask[failed]
+        codes[hit] = codes[hit] + ',' + reason
+    return [code[1:] for code in codes]
+
+def write_rejects(session, upload_id, rejects):
+    """Store rejected rows in fitness_data_rejects, in the caller's transaction."""
+    if rejects.empty:
+        return
+
+    frame = rejects[REJECT_COLUMNS].copy()
+    frame.insert(0, 'upload_id', upload_id)
+
+    if session.get_bind().dialect.name == 'postgresql':
+        frame['reasons'] = '{' + frame['reasons'] + '}'
+        buffer = io.StringIO()
+        frame.to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d')
+        buffer.seek(0)
+
+        cursor = session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY fitness_data_rejects ({', '.join(frame.columns)}) FROM STDIN WITH (FORMAT csv)",
+                               buffer)
+        finally:
+            cursor.close()
+    else:
+        frame['date'] = frame['date'].dt.date
+        frame = frame.astype(object).where(frame.notna(), None)
+        session.execute(insert(fitness_rejects), frame.to_dict('records'))
+
+# Stored values of superseded rows, looked up like the row fingerprints in
+# backend.utils.dedupe: one (user_id, date) range scan per user.
+_STORED_ROWS_SQL = text(f"""
+    SELECT user_id, date, {', '.join(NUTRIENT_COLUMNS)} FROM fitness_data
+    WHERE user_id IN :user_ids AND date BETWEEN :first AND :last
+""").bindparams(bindparam('user_ids', expanding=True))
+
+def write_superseded(session, upload_id, superseded):
+    """
+    Store superseded rows in fitness_data_rejects as duplicates, in the
+    caller's transaction. Call it before the chunk that replaces them is
+    written: their values are read from fitness_data, where they still are.
+    """
+    if superseded.empty:
+        return
+
+    stored = pd.DataFrame(session.execute(_STORED_ROWS_SQL, {
+        'user_ids': sorted(int(user_id) for user_id in superseded['user_id'].unique()),
+        'first': superseded['date'].min().date(),
+        'last': superseded['date'].max().date()
+    }).fetchall(), columns=['user_id', 'date'] + NUTRIENT_COLUMNS)
+    stored['user_id'] = stored['user_id'].astype('int64')
+    stored['date'] = pd.to_datetime(stored['date'])
+
+    rejects = superseded.merge(stored, on=['user_id', 'date'], how='left')
+    rejects['reasons'] = 'duplicate'
+    write_rejects(session, upload_id, rejects)
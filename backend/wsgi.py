@@ -0,0 +1,16 @@
+"""
+Production entry point: `gunicorn -c gunicorn.conf.py backend.wsgi:app`.
+
+With preload_app, gunicorn imports this module once in the master before
+forking the workers. The data modules that create_app leaves to the first
+request (pandas, SQLAlchemy, the upload pipeline) are imported here too, so
+workers start with them already loaded and share their memory pages with
+the master instead of each importing them on its first upload. Nothing here
+opens a database connection or starts a thread: engines and pools are
+created per process on first use (see backend/utils/db_client.py).
+"""
+from backend.app import app  # noqa: F401
+
+import backend.utils.export  # noqa: F401
+import backend.utils.pipeline  # noqa: F401
+import backend.utils.queries  # noqa: F401
@@ -1,3 +1,18 @@
+// Plain CSV files above this size are gzipped in the browser before upload.
+const COMPRESS_ABOVE_BYTES = 1024 * 1024;
+
+const ACCEPTED_EXTENSIONS = ['.csv', '.csv.gz', '.csv.zst', '.zip'];
+
+// Uploads above this size go through the resumable /api/uploads API in
+// chunks; a failed chunk is retried and a failed upload can be resubmitted
+// to continue where it stopped.
+const RESUMABLE_ABOVE_BYTES = 8 * 1024 * 1024;
+const CHUNK_ATTEMPTS = 5;
+const PARALLEL_CHUNKS = 3;
+
+// Uploads interrupted in this page session, by file, so a resubmit resumes them.
+const pendingUploads = new Map();
+
 document.addEventListener('DOMContentLoaded', function() {
     const uploadForm = document.getElementById('upload-form');
     const statusMessage = document.getElementById('status-message');
@@ -17,16 +32,12 @@ document.addEventListener('DOMContentLoaded', function() {
             }
             
          
-            if (!file.name.toLowerCase().endsWith('.csv')) {
-                showMessage('error', 'Only CSV files are accepted.');
+            if (!ACCEPTED_EXTENSIONS.some(extension => file.name.toLowerCase().endsWith(extension))) {
+                showMessage('error', 'Only .csv, .csv.gz, .csv.zst and .zip files are accepted.');
                 return;
             }
             
             
-            const formData = new FormData();
-            formData.append('file', file);
-            
-            
             showMessage('info', 'Uploading and processing your file... Please wait.');
             
             
@@ -35,47 +46,25 @@ document.addEventListener('DOMContentLoaded', function() {
             submitBtn.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Processing...';
             
             
-            fetch('/api/upload', {
-                method: 'POST',
-                body: formData
-            })
-            .then(response => {
-                
-                if (!response.ok) {
-                    return response.json().then(data => {
-                        throw new Error(data.error || `HTTP error! Status: ${response.status}`);
-                    });
+            const key = `upload:${file.name}:${file.size}:${file.lastModified}`;
+            
+            (pendingUploads.has(key) ? Promise.resolve(pendingUploads.get(key)) : prepareUpload(file))
+            .then(upload => {
+                if (upload.blob.size >= RESUMABLE_ABOVE_BYTES && window.crypto && crypto.subtle) {
+                    return sendResumable(upload, key);
                 }
-                return response.json();
+                
+                const formData = new FormData();
+                formData.append('file', upload.blob, upload.name);
+                return fetch('/api/upload?async=1', {
+                    method: 'POST',
+                    body: formData
+                }).then(readJson);
             })
+            .then(data => pollJob(data.status_url))
             .then(data => {
                 if (data.success) {
-                    showMessage('success', data.message);
-                    
-                    
-                    if (successSection) {
-                        successSection.style.display = 'block';
-                    }
-                    
-                    
-                    if (data.users_processed === 1 && grafanaLink) {
-                        const userId = data.users_processed_details?.[0] || '';
-                        const updatedHref = `http://localhost:3001/d/nutrition/nutrition-dashboard?var-userId=${userId}`;
-                        grafanaLink.href = updatedHref;
-                        
-                       
-                        grafanaLink.setAttribute('data-bs-toggle', 'tooltip');
-                        grafanaLink.setAttribute('data-bs-placement', 'top');
-                        grafanaLink.setAttribute('title', `View dashboard for user ID: ${userId}`);
-                        
-                       
-                        const tooltip = new bootstrap.Tooltip(grafanaLink);
-                    }
-                    
-                   
-                    if (data.users_processed > 1 && data.users_processed_details) {
-                        createUserSelection(data.users_processed_details);
-                    }
+                    showUploadSuccess(data);
                 } else {
                     showMessage('error', data.error || 'An unknown error occurred.');
                 }
@@ -93,6 +82,172 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     
+    function prepareUpload(file) {
+        // Gzip large plain CSV files; the server decompresses them while parsing.
+        const isPlainCsv = file.name.toLowerCase().endsWith('.csv');
+        if (!isPlainCsv || file.size < COMPRESS_ABOVE_BYTES || typeof CompressionStream === 'undefined') {
+            return Promise.resolve({blob: file, name: file.name});
+        }
+        
+        showMessage('info', 'Compressing your file before upload...');
+        const compressed = file.stream().pipeThrough(new CompressionStream('gzip'));
+        return new Response(compressed).blob().then(blob => {
+            showMessage('info', `Uploading ${(blob.size / 1048576).toFixed(1)} MB (compressed from ${(file.size / 1048576).toFixed(1)} MB) and processing... Please wait.`);
+            return {blob: blob, name: `${file.name}.gz`};
+        });
+    }
+    
+    function readJson(response) {
+        if (!response.ok) {
+            return response.json().then(data => {
+                throw new Error(data.error || `HTTP error! Status: ${response.status}`);
+            });
+        }
+        return response.json();
+    }
+    
+    function sendResumable(upload, key) {
+        // Only an unmodified file can be resumed after a reload; a copy
+        // compressed in the browser is only kept for this page session.
+        const isOriginal = upload.blob instanceof File;
+        const savedId = upload.uploadId || (isOriginal ? localStorage.getItem(key) : null);
+        
+        const existing = savedId
+            ? fetch(`/api/uploads/${savedId}`).then(response => response.ok ? response.json() : null)
+            : Promise.resolve(null);
+        
+        return existing
+            .then(status => {
+                if (status && status.size === upload.blob.size && !status.complete) {
+                    return status;
+                }
+                return fetch('/api/uploads', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({filename: upload.name, size: upload.blob.size})
+                }).then(readJson);
+            })
+            .then(status => {
+                upload.uploadId = status.upload_id;
+                pendingUploads.set(key, upload);
+                if (isOriginal) {
+                    localStorage.setItem(key, status.upload_id);
+                }
+                return sendChunks(upload.blob, status);
+            })
+            .then(() => fetch(`/api/uploads/${upload.uploadId}/complete`, {method: 'POST'}).then(readJson))
+            .then(data => {
+                pendingUploads.delete(key);
+                localStorage.removeItem(key);
+                return data;
+            });
+    }
+    
+    function sendChunks(blob, status) {
+        const missing = status.missing_chunks.slice();
+        let sent = status.chunks - missing.length;
+        
+        // Chunks are taken in order, so the server can parse the received
+        // prefix while the rest is still being sent.
+        function next() {
+            const index = missing.shift();
+            if (index === undefined) {
+                return Promise.resolve();
+            }
+            const start = index * status.chunk_size;
+            const chunk = blob.slice(start, Math.min(start + status.chunk_size, status.size));
+            return putChunk(status.upload_id, index, chunk, 1).then(result => {
+                sent += 1;
+                const parsing = result.job_id ? ' Parsing has started.' : '';
+                showMessage('info', `Uploaded ${sent} of ${status.chunks} chunks (${Math.round(100 * sent / status.chunks)}%).${parsing}`);
+                return next();
+            });
+        }
+        
+        return Promise.all(Array.from({length: PARALLEL_CHUNKS}, next));
+    }
+    
+    function putChunk(uploadId, index, chunk, attempt) {
+        return chunk.arrayBuffer()
+            .then(data => crypto.subtle.digest('SHA-256', data).then(digest => fetch(`/api/uploads/${uploadId}/chunks/${index}`, {
+                method: 'PUT',
+                headers: {'X-Chunk-SHA256': Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('')},
+                body: data
+            })))
+            .then(readJson)
+            .catch(error => {
+                if (attempt >= CHUNK_ATTEMPTS) {
+                    throw new Error(`Chunk ${index + 1} failed after ${attempt} attempts (${error.message}). Submit again to resume the upload.`);
+                }
+                return new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt))
+                    .then(() => putChunk(uploadId, index, chunk, attempt + 1));
+            });
+    }
+    
+    function pollJob(statusUrl) {
+        const phases = {
+            'queued': 'Waiting for a free worker',
+            'parse': 'Parsing',
+            'transform': 'Transforming',
+            'insert': 'Saving'
+        };
+        
+        return new Promise((resolve, reject) => {
+            function check() {
+                fetch(statusUrl)
+                    .then(response => {
+                        if (!response.ok) {
+                            throw new Error(`HTTP error! Status: ${response.status}`);
+                        }
+                        return response.json();
+                    })
+                    .then(job => {
+                        if (job.state === 'succeeded') {
+                            resolve(job.result);
+                        } else if (job.state === 'failed') {
+                            reject(new Error(job.error || 'Processing failed'));
+                        } else {
+                            const phase = phases[job.phase] || 'Processing';
+                            showMessage('info', `${phase}... ${job.rows_processed.toLocaleString()} rows processed.`);
+                            setTimeout(check, 1000);
+                        }
+                    })
+                    .catch(reject);
+            }
+            check();
+        });
+    }
+    
+    function showUploadSuccess(data) {
+        showMessage('success', data.message);
+        
+        
+        if (successSection) {
+            successSection.style.display = 'block';
+        }
+        
+        
+        if (data.users_processed === 1 && grafanaLink) {
+            const userId = data.users_processed_details?.[0] || '';
+            const updatedHref = `http://localhost:3001/d/nutrition/nutrition-dashboard?var-userId=${userId}`;
+            grafanaLink.href = updatedHref;
+            
+           
+            grafanaLink.setAttribute('data-bs-toggle', 'tooltip');
+            grafanaLink.setAttribute('data-bs-placement', 'top');
+            grafanaLink.setAttribute('title', `View dashboard for user ID: ${userId}`);
+            
+           
+            const tooltip = new bootstrap.Tooltip(grafanaLink);
+        }
+        
+       
+        if (data.users_processed > 1 && data.users_processed_details) {
+            createUserSelection(data.users_processed_details);
+        }
+    }
+    
+    
     function createUserSelection(userIds) {
         let userSelectionDiv = document.getElementById('user-selection');
         if (!userSelectionDiv) {
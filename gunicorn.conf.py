@@ -0,0 +1,96 @@
+"""
+Gunicorn settings for serving backend.wsgi:app in production. Every value
+can be overridden with the environment variable next to it.
+
+    gunicorn -c gunicorn.conf.py backend.wsgi:app
+"""
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+
+# Uploads are CPU-bound in pandas, so one process per core (plus one to
+# cover I/O waits) and threads for the reads that wait on Postgres. Each
+# worker has its own connection pool: keep
+# workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) below Postgres' max_connections.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import the app and its data modules once in the master (see backend/wsgi.py).
+preload_app = True
+
+# With threads, timeout only catches a worker whose main loop is stuck, not a
+# slow request. graceful_timeout is how long a stopping or recycled worker
+# may finish its requests and background upload jobs (see worker_exit).
+# Large uploads run for minutes, hence 5 minutes for both.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 300))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers after a number of requests to return memory pandas has
+# fragmented. Jitter keeps them from restarting all at once. A recycled worker
+# stops accepting requests and finishes the ones it has, and its upload
+# jobs, first.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# The heartbeat file is touched every few seconds; keep it off overlay
+# filesystems where that can stall.
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# An empty GUNICORN_ACCESS_LOG turns the access log off.
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+# /metrics aggregates every worker through prometheus_client's multiprocess
+# mode. It must be set before prometheus_client is imported, which is when
+# the app is preloaded.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'myfitnessapp-metrics'))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+def on_starting(server):
+    from backend.app import app
+    from backend.utils.jobs import fail_unfinished_jobs
+
+    # Samples left by the workers of a previous run would be counted again.
+    # The master has no samples of its own: it never handles a request.
+    for name in os.listdir(os.environ['PROMETHEUS_MULTIPROC_DIR']):
+        os.remove(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], name))
+
+    # Jobs of a previous run that was killed would otherwise show as running forever.
+    fail_unfinished_jobs(app.config['JOB_STATUS_FOLDER'])
+
+def post_fork(server, worker):
+    # worker_exit runs after the worker has closed its heartbeat file; keep a
+    # descriptor of our own so the master does not kill it as stuck meanwhile.
+    worker.heartbeat_fd = os.dup(worker.tmp.fileno())
+
+def worker_exit(server, worker):
+    # The master calls this too, for a worker that was already gone when it
+    # was signalled. It has no heartbeat_fd and no jobs there: the jobs ran
+    # in the worker, and the master's app is only the preloaded one.
+    if getattr(worker, 'heartbeat_fd', None) is None:
+        return
+
+    from backend.wsgi import app
+    from backend.utils.jobs import stop_job_managers
+
+    spinner = [0]
+
+    def heartbeat():
+        # What worker.notify() does on the closed heartbeat file.
+        spinner[0] ^= 1
+        os.fchmod(worker.heartbeat_fd, spinner[0])
+
+    # Upload jobs run on threads of this worker. Give them until shortly
+    # before the master's graceful_timeout ends; any still running are marked
+    # failed before the process goes.
+    stop_job_managers(app, max(server.cfg.graceful_timeout - 5, 0), heartbeat)
+    os.close(worker.heartbeat_fd)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)